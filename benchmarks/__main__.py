@@ -0,0 +1,51 @@
+"""Run the bring-up benchmarks: python -m benchmarks [--sizes 10 100]"""
+
+import argparse
+import json
+
+from .harness import DEFAULT_FANOUT, DEFAULT_SIZES, report, run_benchmark
+
+
+def latency(value: str) -> tuple[str, float]:
+    op, _, seconds = value.partition("=")
+    return op, float(seconds)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES)
+    )
+    parser.add_argument("--fanout", type=int, default=DEFAULT_FANOUT)
+    parser.add_argument(
+        "--latency",
+        type=latency,
+        action="append",
+        default=[],
+        metavar="OP=SECONDS",
+        help="Latency of a fake daemon operation, e.g. start=0.05",
+    )
+    parser.add_argument("--json", metavar="FILE", help="Write raw results")
+    parser.add_argument(
+        "--trace", metavar="FILE", help="Write a Chrome trace of all runs"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show the manager output"
+    )
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        args.sizes,
+        latencies=dict(args.latency),
+        fanout=args.fanout,
+        quiet=not args.verbose,
+        trace=args.trace,
+    )
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
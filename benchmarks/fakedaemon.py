@@ -0,0 +1,546 @@
+"""Stand-in for the Docker Engine API on a unix socket.
+
+Only the endpoints docker_overdose uses are implemented. Every request is
+counted per operation and delayed by the configured latency, containers
+never run anything.
+"""
+
+import itertools
+import json
+import os
+import queue
+import re
+import socketserver
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+API_VERSION = "1.41"
+
+# Seconds every operation takes by default
+DEFAULT_LATENCIES = {
+    "create": 0.005,
+    "start": 0.01,
+    "inspect": 0.001,
+    "list": 0.002,
+    "stop": 0.005,
+    "kill": 0.002,
+    # Between the exit and the removal of an auto-removed container
+    "auto_remove": 0,
+}
+
+# First fake PID handed out, high enough to never match a real process
+FIRST_PID = 4000000
+
+ROUTES = [
+    ("GET", r"/_ping", "ping"),
+    ("GET", r"/version", "version"),
+    ("GET", r"/info", "info"),
+    ("POST", r"/containers/create", "create"),
+    ("GET", r"/containers/json", "list"),
+    ("GET", r"/containers/(?P<id>[^/]+)/json", "inspect"),
+    ("POST", r"/containers/(?P<id>[^/]+)/start", "start"),
+    ("POST", r"/containers/(?P<id>[^/]+)/stop", "stop"),
+    ("POST", r"/containers/(?P<id>[^/]+)/kill", "kill"),
+    ("POST", r"/containers/(?P<id>[^/]+)/pause", "pause"),
+    ("POST", r"/containers/(?P<id>[^/]+)/unpause", "unpause"),
+    ("POST", r"/containers/(?P<id>[^/]+)/rename", "rename"),
+    ("GET", r"/containers/(?P<id>[^/]+)/logs", "logs"),
+    ("DELETE", r"/containers/(?P<id>[^/]+)", "remove"),
+    ("GET", r"/events", "events"),
+    ("GET", r"/images/json", "image_list"),
+    ("POST", r"/images/create", "image_pull"),
+    ("GET", r"/images/(?P<id>.+)/json", "image_inspect"),
+    ("GET", r"/networks", "network_list"),
+    ("POST", r"/networks/create", "network_create"),
+    ("GET", r"/networks/(?P<id>[^/]+)", "network_inspect"),
+    ("DELETE", r"/networks/(?P<id>[^/]+)", "network_remove"),
+    ("POST", r"/networks/(?P<id>[^/]+)/connect", "network_connect"),
+]
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class FakeContainer:
+    def __init__(self, cid: str, name: str, config: dict, pid: int):
+        self.id = cid
+        self.name = name
+        self.config = config
+        self.pid = pid
+        self.status = "created"
+        self.host_config = config.get("HostConfig") or {}
+        # network name -> IP address
+        self.networks: dict[str, str] = {}
+        self.stopped = threading.Event()
+        self.removing = False
+
+    @property
+    def running(self) -> bool:
+        return self.status == "running"
+
+    def summary(self) -> dict:
+        return {
+            "Id": self.id,
+            "Names": [f"/{self.name}"],
+            "Image": self.config.get("Image"),
+            "State": self.status,
+            "Labels": self.config.get("Labels") or {},
+        }
+
+    def inspect(self) -> dict:
+        networks = {
+            name: {"IPAddress": ip, "IPPrefixLen": 16}
+            for name, ip in self.networks.items()
+        }
+        return {
+            "Id": self.id,
+            "Name": f"/{self.name}",
+            "Image": self.config.get("Image"),
+            "State": {
+                "Status": self.status,
+                "Running": self.running,
+                "Pid": self.pid if self.running else 0,
+            },
+            "Config": {
+                "Image": self.config.get("Image"),
+                "Tty": bool(self.config.get("Tty")),
+                "Labels": self.config.get("Labels") or {},
+            },
+            "HostConfig": dict(
+                self.host_config, LogConfig={"Type": "json-file"}
+            ),
+            "NetworkSettings": {"Networks": networks},
+        }
+
+
+class FakeDockerDaemon:
+    """Engine API stand-in, use as a context manager.
+
+    `latencies` maps operation names (see ROUTES) and "auto_remove" to
+    seconds. With `images` given only those images exist and others have to
+    be pulled first, otherwise every image exists. `cpus` and `memory` are
+    the capacity reported by /info.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        latencies: Optional[dict[str, float]] = None,
+        images: Optional[list[str]] = None,
+        cpus: int = 4,
+        memory: int = 8 * 1024**3,
+    ):
+        self.socket_path = socket_path
+        self.cpus = cpus
+        self.memory = memory
+        self.latencies = dict(DEFAULT_LATENCIES)
+        if latencies:
+            self.latencies.update(latencies)
+        self.images = set(images) if images is not None else None
+        self.calls: Counter = Counter()
+        self.lock = threading.Lock()
+        self.containers: dict[str, FakeContainer] = {}
+        self.networks: dict[str, dict] = {}
+        self._subscribers: list[queue.Queue] = []
+        self._ids = itertools.count(1)
+        self._pids = itertools.count(FIRST_PID)
+        self._hosts = itertools.count(2)
+        self._server: Optional[socketserver.UnixStreamServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "FakeDockerDaemon":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def start(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = _Server(self.socket_path, _Handler)
+        server.daemon = self
+        self._server = server
+        self._thread = threading.Thread(
+            target=server.serve_forever, daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        with self.lock:
+            for q in self._subscribers:
+                q.put(None)
+            for c in self.containers.values():
+                c.stopped.set()
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def reset_calls(self) -> Counter:
+        with self.lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+    def _new_id(self) -> str:
+        return f"{next(self._ids):064x}"
+
+    def _emit(self, c: FakeContainer, action: str) -> None:
+        event = {
+            "Type": "container",
+            "Action": action,
+            "status": action,
+            "id": c.id,
+            "Actor": {"ID": c.id, "Attributes": {"name": c.name}},
+            "time": int(time.time()),
+            "timeNano": time.time_ns(),
+        }
+        for q in self._subscribers:
+            q.put(event)
+
+    def _lookup(self, ref: str) -> FakeContainer:
+        c = self.containers.get(ref)
+        if c is None:
+            for candidate in self.containers.values():
+                if candidate.name == ref or candidate.id.startswith(ref):
+                    return candidate
+            raise ApiError(404, f"No such container: {ref}")
+        return c
+
+    def _lookup_network(self, ref: str) -> dict:
+        for n in self.networks.values():
+            if ref in (n["Id"], n["Name"]):
+                return n
+        raise ApiError(404, f"network {ref} not found")
+
+    def _address(self, network: str) -> str:
+        n = self.networks.get(network)
+        if n:
+            prefix = n["IPAM"]["Config"][0]["Subnet"].rsplit(".", 2)[0]
+            host, n["_next"] = n["_next"], n["_next"] + 1
+            return f"{prefix}.{host // 256}.{host % 256}"
+        host = next(self._hosts)
+        return f"172.{16 + host // 65536 % 16}.{host // 256 % 256}.{host % 256}"  # noqa: E501
+
+    # Operations, called with the lock held
+
+    def op_create(self, query, body, **kw):
+        name = query.get("name") or self._new_id()[:12]
+        image = body.get("Image", "")
+        if self.images is not None and image not in self.images:
+            raise ApiError(404, f"No such image: {image}")
+        if any(c.name == name for c in self.containers.values()):
+            raise ApiError(409, f'Conflict. The name "/{name}" is in use')
+        c = FakeContainer(self._new_id(), name, body, next(self._pids))
+        mode = c.host_config.get("NetworkMode") or "bridge"
+        if mode != "none":
+            c.networks[mode] = self._address(mode)
+        self.containers[c.id] = c
+        self._emit(c, "create")
+        return 201, {"Id": c.id, "Warnings": []}
+
+    def op_list(self, query, body, **kw):
+        show_all = query.get("all") in ("1", "true", "True")
+        return 200, [
+            c.summary()
+            for c in self.containers.values()
+            if show_all or c.running
+        ]
+
+    def op_inspect(self, query, body, id):
+        return 200, self._lookup(id).inspect()
+
+    def op_start(self, query, body, id):
+        c = self._lookup(id)
+        if not c.running:
+            c.status = "running"
+            c.stopped.clear()
+            self._emit(c, "start")
+        return 204, None
+
+    def op_pause(self, query, body, id):
+        c = self._lookup(id)
+        if not c.running:
+            raise ApiError(409, f"Container {id} is not running")
+        c.status = "paused"
+        self._emit(c, "pause")
+        return 204, None
+
+    def op_unpause(self, query, body, id):
+        c = self._lookup(id)
+        if c.status != "paused":
+            raise ApiError(409, f"Container {id} is not paused")
+        c.status = "running"
+        self._emit(c, "unpause")
+        return 204, None
+
+    def op_rename(self, query, body, id):
+        c = self._lookup(id)
+        name = query.get("name", "")
+        if any(o.name == name for o in self.containers.values()):
+            raise ApiError(409, f'Conflict. The name "/{name}" is in use')
+        c.name = name
+        self._emit(c, "rename")
+        return 204, None
+
+    def _exit(self, c: FakeContainer, action: str) -> None:
+        if c.status not in ("running", "paused"):
+            raise ApiError(304, "")
+        c.status = "exited"
+        c.stopped.set()
+        if action == "kill":
+            self._emit(c, "kill")
+        self._emit(c, "die")
+        if c.host_config.get("AutoRemove"):
+            # Like the daemon, removed after the die event was sent
+            c.removing = True
+            delay = self.latencies.get("auto_remove", 0)
+            if delay:
+                threading.Timer(delay, self._auto_remove, (c,)).start()
+            else:
+                self._destroy(c)
+
+    def _auto_remove(self, c: FakeContainer) -> None:
+        with self.lock:
+            self._destroy(c)
+
+    def _destroy(self, c: FakeContainer) -> None:
+        if self.containers.pop(c.id, None):
+            self._emit(c, "destroy")
+
+    def op_stop(self, query, body, id):
+        self._exit(self._lookup(id), "stop")
+        return 204, None
+
+    def op_kill(self, query, body, id):
+        self._exit(self._lookup(id), "kill")
+        return 204, None
+
+    def op_remove(self, query, body, id):
+        c = self._lookup(id)
+        if c.removing:
+            raise ApiError(
+                409, f"removal of container {c.name} is already in progress"
+            )
+        if c.running and query.get("force") not in ("1", "true", "True"):
+            raise ApiError(409, "container is running")
+        c.stopped.set()
+        self._destroy(c)
+        return 204, None
+
+    def op_image_list(self, query, body, **kw):
+        images = self.images if self.images is not None else set()
+        return 200, [
+            {"Id": f"sha256:{abs(hash(i)):064x}"[:71], "RepoTags": [i]}
+            for i in sorted(images)
+        ]
+
+    def op_image_pull(self, query, body, **kw):
+        image = query.get("fromImage", "")
+        if query.get("tag"):
+            image = f"{image}:{query['tag']}"
+        if self.images is not None:
+            self.images.add(image)
+        return 200, {"status": f"Downloaded newer image for {image}"}
+
+    def op_image_inspect(self, query, body, id):
+        if self.images is not None and id not in self.images:
+            raise ApiError(404, f"No such image: {id}")
+        return 200, {"Id": f"sha256:{abs(hash(id)):064x}", "RepoTags": [id]}
+
+    def op_network_list(self, query, body, **kw):
+        return 200, [self._network(n) for n in self.networks.values()]
+
+    @staticmethod
+    def _network(n: dict) -> dict:
+        return {k: v for k, v in n.items() if not k.startswith("_")}
+
+    def op_network_create(self, query, body, **kw):
+        name = body["Name"]
+        if name in self.networks:
+            raise ApiError(409, f"network with name {name} already exists")
+        index = len(self.networks) + 1
+        self.networks[name] = {
+            "Id": self._new_id(),
+            "Name": name,
+            "Driver": body.get("Driver") or "bridge",
+            "Internal": bool(body.get("Internal")),
+            "IPAM": {
+                "Config": [
+                    {
+                        "Subnet": f"10.{index % 256}.0.0/16",
+                        "Gateway": f"10.{index % 256}.0.1",
+                    }
+                ]
+            },
+            "Containers": {},
+            "_next": 2,
+        }
+        return 201, {"Id": self.networks[name]["Id"], "Warning": ""}
+
+    def op_network_inspect(self, query, body, id):
+        return 200, self._network(self._lookup_network(id))
+
+    def op_network_remove(self, query, body, id):
+        n = self._lookup_network(id)
+        if any(n["Name"] in c.networks for c in self.containers.values()):
+            raise ApiError(
+                403,
+                f"error while removing network: network {n['Name']} id "
+                f"{n['Id']} has active endpoints",
+            )
+        self.networks.pop(n["Name"])
+        return 204, None
+
+    def op_network_connect(self, query, body, id):
+        n = self._lookup_network(id)
+        c = self._lookup(body["Container"])
+        c.networks[n["Name"]] = self._address(n["Name"])
+        return 200, None
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    # Every followed log stream holds a connection of its own
+    request_queue_size = 1024
+    daemon: FakeDockerDaemon
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: _Server
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch()
+
+    def do_POST(self):
+        self.dispatch()
+
+    def do_DELETE(self):
+        self.dispatch()
+
+    def do_HEAD(self):
+        self.dispatch()
+
+    def dispatch(self):
+        daemon = self.server.daemon
+        url = urlsplit(self.path)
+        path = re.sub(r"^/v[0-9.]+", "", url.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        body = json.loads(raw) if raw.strip() else {}
+        for method, pattern, op in ROUTES:
+            match = re.fullmatch(pattern, path)
+            if method == self.command and match:
+                break
+        else:
+            return self.reply(404, {"message": f"page not found: {path}"})
+        with daemon.lock:
+            daemon.calls[op] += 1
+        time.sleep(daemon.latencies.get(op, 0))
+        if op in ("logs", "events"):
+            return getattr(self, f"stream_{op}")(query, **match.groupdict())
+        if op == "ping":
+            return self.reply(200, b"OK")
+        if op == "version":
+            return self.reply(
+                200,
+                {"ApiVersion": API_VERSION, "Version": "fake", "Os": "linux"},
+            )
+        if op == "info":
+            return self.reply(
+                200,
+                {
+                    "Name": "fake",
+                    "Containers": len(daemon.containers),
+                    "NCPU": daemon.cpus,
+                    "MemTotal": daemon.memory,
+                },
+            )
+        try:
+            with daemon.lock:
+                status, payload = getattr(daemon, f"op_{op}")(
+                    query, body, **match.groupdict()
+                )
+        except ApiError as e:
+            status, payload = e.status, {"message": str(e)}
+        self.reply(status, payload)
+
+    def reply(self, status, payload):
+        if isinstance(payload, bytes):
+            data = payload
+        elif payload is None or status in (204, 304):
+            data = b""
+        else:
+            data = json.dumps(payload).encode()
+        self.send_response(status)
+        if status not in (204, 304):
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if data and status not in (204, 304):
+            self.wfile.write(data)
+
+    def start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self.wfile.flush()
+
+    def write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def stream_logs(self, query, id):
+        daemon = self.server.daemon
+        try:
+            with daemon.lock:
+                c = daemon._lookup(id)
+        except ApiError as e:
+            return self.reply(e.status, {"message": str(e)})
+        self.close_connection = True
+        self.start_chunked("application/vnd.docker.raw-stream")
+        line = f"{c.name} started\n".encode()
+        if not c.config.get("Tty"):
+            line = b"\x01\0\0\0" + len(line).to_bytes(4, "big") + line
+        try:
+            self.write_chunk(line)
+            if query.get("follow") in ("1", "true", "True"):
+                c.stopped.wait()
+            self.write_chunk(b"")
+        except OSError:
+            pass
+
+    def stream_events(self, query):
+        daemon = self.server.daemon
+        q: queue.Queue = queue.Queue()
+        with daemon.lock:
+            daemon._subscribers.append(q)
+        self.close_connection = True
+        try:
+            self.start_chunked("application/json")
+            while True:
+                event = q.get()
+                if event is None:
+                    break
+                self.write_chunk(json.dumps(event).encode() + b"\n")
+        except OSError:
+            pass
+        finally:
+            with daemon.lock:
+                daemon._subscribers.remove(q)
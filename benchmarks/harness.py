@@ -0,0 +1,216 @@
+"""Drive OverdoseManager against the fake daemon and a stub nsenter."""
+
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+from docker_overdose import dockerclient, iptables, processmanager
+from docker_overdose.containermanager import ContainerManager
+from docker_overdose.overdosemanager import OverdoseManager
+from docker_overdose.tracing import get_tracer
+
+from .fakedaemon import FakeDockerDaemon
+
+DEFAULT_SIZES = (10, 100, 1000)
+# Children per router in the synthetic topologies
+DEFAULT_FANOUT = 4
+BENCH_IMAGE = "overdose/bench:latest"
+BENCH_NETWORK = "overdose-bench"
+
+# Records its name and execs the command following the nsenter options,
+# with only the stubs on the PATH so nothing touches the host
+NSENTER_STUB = """#!/bin/sh
+echo nsenter >> {log}
+PATH={directory}
+export PATH
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --target|-t) shift 2;;
+        -*) shift;;
+        *) break;;
+    esac
+done
+exec "$@"
+"""
+
+# Records its name and does nothing
+COMMAND_STUB = """#!/bin/sh
+echo {name} >> {log}
+"""
+
+
+class StubBinaries:
+    """Swap nsenter and the tools run through it for counting stubs."""
+
+    PATCHES = (
+        (processmanager, "NSENTER_BIN", "nsenter"),
+        (processmanager, "IP_BIN", "ip"),
+        (processmanager, "IPTABLES_BIN", "iptables"),
+        (processmanager, "BRCTL_BIN", "brctl"),
+        (iptables, "IPTABLES_SAVE_BIN", "iptables-save"),
+        (iptables, "IPTABLES_RESTORE_BIN", "iptables-restore"),
+    )
+    # Commands run through nsenter by their bare name
+    COMMANDS = ("ip", "iptables", "iw", "sh", "mkdir", "ln")
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.log = os.path.join(directory, "invocations.log")
+        self._saved: list = []
+
+    def __enter__(self) -> "StubBinaries":
+        open(self.log, "w").close()
+        names = {name for _, _, name in self.PATCHES} | set(self.COMMANDS)
+        for name in names:
+            template = NSENTER_STUB if name == "nsenter" else COMMAND_STUB
+            path = os.path.join(self.directory, name)
+            with open(path, "w") as f:
+                f.write(
+                    template.format(
+                        name=name, log=self.log, directory=self.directory
+                    )
+                )
+            os.chmod(path, 0o755)
+        for module, attr, name in self.PATCHES:
+            self._saved.append((module, attr, getattr(module, attr)))
+            setattr(module, attr, os.path.join(self.directory, name))
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for module, attr, value in self._saved:
+            setattr(module, attr, value)
+        self._saved = []
+
+    def reset(self) -> Counter:
+        with open(self.log, "r+") as f:
+            counts = Counter(line.strip() for line in f if line.strip())
+            f.truncate(0)
+        return counts
+
+
+def build_topology(
+    manager: OverdoseManager, size: int, fanout: int = DEFAULT_FANOUT
+) -> list[ContainerManager]:
+    """Add a tree of `size` containers, every node routes via its parent."""
+    nodes: list[ContainerManager] = []
+    for i in range(size):
+        net_options: dict = {}
+        post_options: dict = {}
+        if i:
+            parent = nodes[(i - 1) // fanout]
+            net_options = {
+                "depends": [parent],
+                "change_default_route": parent,
+                "add_route": {"subnet": f"10.{i % 256}.0.0/16", "via": parent},
+            }
+        if i * fanout + 1 < size:
+            # Routers get to NAT for their children
+            post_options = {"set_masquerade": "eth0"}
+        c = ContainerManager(
+            f"bench{size}-{i}",
+            image=BENCH_IMAGE,
+            run_options={"network": BENCH_NETWORK},
+            net_options=net_options,
+            post_options=post_options,
+        )
+        manager.add(c)
+        nodes.append(c)
+    return nodes
+
+
+def run_size(
+    daemon: FakeDockerDaemon,
+    stubs: StubBinaries,
+    size: int,
+    fanout: int = DEFAULT_FANOUT,
+) -> dict:
+    manager = OverdoseManager(containers={})
+    build_topology(manager, size, fanout)
+    daemon.reset_calls()
+    stubs.reset()
+    phases = {}
+    for phase, action in (
+        ("start", manager.start_containers),
+        ("post_config", manager.post_start_config),
+        ("stop", manager.stop_containers),
+    ):
+        started = time.perf_counter()
+        action()
+        phases[phase] = {
+            "seconds": time.perf_counter() - started,
+            "api_calls": dict(daemon.reset_calls()),
+            "subprocesses": dict(stubs.reset()),
+        }
+    if manager.logmux:
+        manager.logmux.close()
+    return {
+        "size": size,
+        "seconds": sum(p["seconds"] for p in phases.values()),
+        "api_calls": sum(
+            sum(p["api_calls"].values()) for p in phases.values()
+        ),
+        "subprocesses": sum(
+            sum(p["subprocesses"].values()) for p in phases.values()
+        ),
+        "phases": phases,
+    }
+
+
+def run_benchmark(
+    sizes: Iterable[int] = DEFAULT_SIZES,
+    latencies: Optional[dict[str, float]] = None,
+    fanout: int = DEFAULT_FANOUT,
+    quiet: bool = True,
+    trace: Optional[str] = None,
+) -> list[dict]:
+    """Run every topology size against a fresh fake daemon.
+
+    Connects the global docker client to the fake daemon, so run this in
+    a process of its own. With `trace` given the spans of all runs are
+    written to it as a Chrome trace.
+    """
+    tracer = get_tracer()
+    if trace:
+        tracer.enable()
+    workdir = tempfile.mkdtemp(prefix="overdose-bench-")
+    results = []
+    try:
+        sock = os.path.join(workdir, "docker.sock")
+        with FakeDockerDaemon(sock, latencies) as daemon, StubBinaries(
+            workdir
+        ) as stubs, open(os.devnull, "w") as devnull:
+            dockerclient.connect(socket_path=sock)
+            for size in sizes:
+                with contextlib.ExitStack() as stack:
+                    if quiet:
+                        stack.enter_context(
+                            contextlib.redirect_stdout(devnull)
+                        )
+                    results.append(run_size(daemon, stubs, size, fanout))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if trace:
+        tracer.export_chrome(trace)
+        tracer.report()
+    return results
+
+
+def report(results: list[dict]) -> None:
+    print(
+        f"{'nodes':>6} {'seconds':>9} {'api calls':>10} {'subprocs':>9}  "
+        "phases (seconds / api calls / subprocesses)"
+    )
+    for r in results:
+        phases = "  ".join(
+            f"{name} {p['seconds']:.2f}/{sum(p['api_calls'].values())}"
+            f"/{sum(p['subprocesses'].values())}"
+            for name, p in r["phases"].items()
+        )
+        print(
+            f"{r['size']:>6} {r['seconds']:>9.2f} {r['api_calls']:>10} "
+            f"{r['subprocesses']:>9}  {phases}"
+        )
@@ -0,0 +1,267 @@
+import asyncio
+import json
+import shlex
+from typing import AsyncIterator, Optional
+from urllib.parse import quote, urlencode
+from . import dockerclient
+from .logmux import LogStreamParser
+
+API_VERSION = "1.41"
+
+
+class DockerAPIError(Exception):
+    def __init__(self, status: int, message: str):
+        self.status = status
+        self.message = message
+        super().__init__(f"{status}: {message}")
+
+
+class NotFound(DockerAPIError):
+    pass
+
+
+class AsyncDockerClient:
+    """Non-blocking client for the Docker Engine API on a unix socket."""
+
+    def __init__(
+        self, socket_path: Optional[str] = None, version: str = API_VERSION
+    ):
+        self.socket_path = (
+            socket_path if socket_path else dockerclient.get_docker_sock()
+        )
+        self.version = version
+
+    def _request_head(
+        self, method: str, path: str, params: Optional[dict], length: int
+    ) -> bytes:
+        url = f"/v{self.version}{path}"
+        if params:
+            url += "?" + urlencode(params)
+        head = f"{method} {url} HTTP/1.1\r\nHost: docker\r\n"
+        head += "Connection: close\r\n"
+        if length:
+            head += "Content-Type: application/json\r\n"
+        head += f"Content-Length: {length}\r\n\r\n"
+        return head.encode()
+
+    async def _open(
+        self,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        body: Optional[dict] = None,
+    ):
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        data = json.dumps(body).encode() if body is not None else b""
+        writer.write(self._request_head(method, path, params, len(data)))
+        writer.write(data)
+        await writer.drain()
+        return reader, writer
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[dict] = None,
+        body: Optional[dict] = None,
+    ):
+        reader, writer = await self._open(method, path, params, body)
+        try:
+            status_line = await reader.readline()
+            status = int(status_line.split()[1])
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode().partition(":")
+                headers[key.strip().lower()] = value.strip()
+            if "chunked" in headers.get("transfer-encoding", ""):
+                data = b""
+                while True:
+                    size = int((await reader.readline()).split(b";")[0], 16)
+                    if not size:
+                        break
+                    data += await reader.readexactly(size)
+                    await reader.readline()
+            elif "content-length" in headers:
+                data = await reader.readexactly(int(headers["content-length"]))
+            else:
+                data = await reader.read()
+        finally:
+            writer.close()
+        result = None
+        if data and "json" in headers.get("content-type", ""):
+            # Streaming endpoints (e.g. pull) return one object per line
+            lines = [json.loads(x) for x in data.splitlines() if x.strip()]
+            result = lines[0] if len(lines) == 1 else lines
+        elif data:
+            result = data.decode(errors="replace")
+        if status >= 400:
+            message = (
+                result.get("message", "") if isinstance(result, dict) else ""
+            )
+            if status == 404:
+                raise NotFound(status, message or str(result))
+            raise DockerAPIError(status, message or str(result))
+        return result
+
+    async def create_container(self, name: str, config: dict) -> dict:
+        return await self.request(
+            "POST", "/containers/create", {"name": name}, config
+        )
+
+    async def start_container(self, ref: str) -> None:
+        await self.request("POST", f"/containers/{quote(ref)}/start")
+
+    async def stop_container(self, ref: str, timeout: int = 10) -> None:
+        await self.request(
+            "POST", f"/containers/{quote(ref)}/stop", {"t": timeout}
+        )
+
+    async def kill_container(self, ref: str) -> None:
+        await self.request("POST", f"/containers/{quote(ref)}/kill")
+
+    async def inspect_container(self, ref: str) -> dict:
+        return await self.request("GET", f"/containers/{quote(ref)}/json")
+
+    async def pull_image(self, image: str) -> None:
+        repo, _, tag = image.rpartition(":")
+        if not repo or "/" in tag:
+            repo, tag = image, "latest"
+        await self.request(
+            "POST", "/images/create", {"fromImage": repo, "tag": tag}
+        )
+
+    async def connect_network(self, network: str, container: str) -> None:
+        await self.request(
+            "POST",
+            f"/networks/{quote(network)}/connect",
+            body={"Container": container},
+        )
+
+    async def logs(
+        self, ref: str, tty: bool = False, timestamps: bool = True
+    ) -> AsyncIterator[bytes]:
+        params = {
+            "follow": 1,
+            "stdout": 1,
+            "stderr": 1,
+            "timestamps": int(timestamps),
+        }
+        reader, writer = await self._open(
+            "GET", f"/containers/{quote(ref)}/logs", params
+        )
+        parser = LogStreamParser(tty=tty)
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                for line in parser.feed(data):
+                    yield line
+            for line in parser.flush():
+                yield line
+        finally:
+            writer.close()
+
+
+def create_config(image: str, run_kwargs: dict) -> dict:
+    """Translate `containers.run` keyword arguments to a create body."""
+    config: dict = {"Image": image}
+    host: dict = {}
+    endpoints: dict = {}
+    for key, value in run_kwargs.items():
+        if key in ("name", "detach"):
+            continue
+        elif key == "command":
+            config["Cmd"] = (
+                shlex.split(value) if isinstance(value, str) else value
+            )
+        elif key == "entrypoint":
+            config["Entrypoint"] = (
+                shlex.split(value) if isinstance(value, str) else value
+            )
+        elif key == "environment":
+            if isinstance(value, dict):
+                value = [f"{k}={v}" for k, v in value.items()]
+            config["Env"] = value
+        elif key == "ports":
+            config["ExposedPorts"] = {}
+            host["PortBindings"] = {}
+            for port, binding in value.items():
+                port = str(port) if "/" in str(port) else f"{port}/tcp"
+                config["ExposedPorts"][port] = {}
+                if binding is None:
+                    continue
+                bindings = binding if isinstance(binding, list) else [binding]
+                host["PortBindings"][port] = [
+                    (
+                        {"HostIp": b[0], "HostPort": str(b[1])}
+                        if isinstance(b, tuple)
+                        else {"HostIp": "", "HostPort": str(b)}
+                    )
+                    for b in bindings
+                ]
+        elif key == "volumes":
+            if isinstance(value, dict):
+                value = [
+                    f"{src}:{v['bind']}:{v.get('mode', 'rw')}"
+                    for src, v in value.items()
+                ]
+            host["Binds"] = value
+        elif key == "devices":
+            host["Devices"] = []
+            for device in value:
+                parts = device.split(":")
+                host["Devices"].append(
+                    {
+                        "PathOnHost": parts[0],
+                        "PathInContainer": (
+                            parts[1] if len(parts) > 1 else parts[0]
+                        ),
+                        "CgroupPermissions": (
+                            parts[2] if len(parts) > 2 else "rwm"
+                        ),
+                    }
+                )
+        elif key == "extra_hosts":
+            if isinstance(value, dict):
+                value = [f"{k}:{v}" for k, v in value.items()]
+            host["ExtraHosts"] = value
+        elif key == "network_mode":
+            host["NetworkMode"] = value
+        elif key == "network":
+            host["NetworkMode"] = value
+            endpoints[value] = {}
+        elif key in RUN_CONFIG_KEYS:
+            config[RUN_CONFIG_KEYS[key]] = value
+        elif key in RUN_HOST_CONFIG_KEYS:
+            host[RUN_HOST_CONFIG_KEYS[key]] = value
+        else:
+            raise ValueError(f"Run option '{key}' is not supported")
+    config["HostConfig"] = host
+    if endpoints:
+        config["NetworkingConfig"] = {"EndpointsConfig": endpoints}
+    return config
+
+
+RUN_CONFIG_KEYS = {
+    "hostname": "Hostname",
+    "labels": "Labels",
+    "working_dir": "WorkingDir",
+    "user": "User",
+    "tty": "Tty",
+    "stdin_open": "OpenStdin",
+    "healthcheck": "Healthcheck",
+}
+
+RUN_HOST_CONFIG_KEYS = {
+    "auto_remove": "AutoRemove",
+    "privileged": "Privileged",
+    "cap_add": "CapAdd",
+    "cap_drop": "CapDrop",
+    "dns": "Dns",
+    "sysctls": "Sysctls",
+    "pid_mode": "PidMode",
+}
@@ -0,0 +1,379 @@
+import asyncio
+from typing import Optional
+from .asyncdocker import AsyncDockerClient, NotFound, create_config
+from .containermanager import CONFIG_OPTIONS, DEPENDENCY_TIMEOUT
+from .networkmanager import NetworkManager
+from .processmanager import DEFAULT_BACKEND, ProcessManager
+from .scheduler import DEFAULT_WORKERS, DependencyScheduler, ScheduleResult
+
+async_docker_client = None
+
+
+def get_async_docker_client() -> AsyncDockerClient:
+    global async_docker_client
+    if not async_docker_client:
+        async_docker_client = AsyncDockerClient()
+    return async_docker_client
+
+
+class AsyncContainerManager(ProcessManager):
+    """Awaitable counterpart of ContainerManager.
+
+    Docker is driven through the non-blocking AsyncDockerClient. The
+    namespace helpers of ProcessManager are shared with the synchronous
+    API and run in the default executor, so the event loop never blocks.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        image: Optional[str] = None,
+        run_options={},
+        net_options={},
+        post_options={},
+        autostart: bool = True,
+        host: Optional[ProcessManager] = None,
+        backend: str = DEFAULT_BACKEND,
+        client: Optional[AsyncDockerClient] = None,
+        follow_logs: bool = True,
+    ):
+        self.client = client if client else get_async_docker_client()
+        self.name = name
+        self.image = image
+        self.run_options = run_options
+        self.net_options = net_options
+        self.post_options = post_options
+        self.autostart = autostart
+        self.host = host
+        self.backend = backend
+        self.follow_logs = follow_logs
+        self.pid = 0
+        self._attrs: Optional[dict] = None
+        self._logtask: Optional[asyncio.Task] = None
+
+    async def run(self, noconfig: bool = False) -> bool:
+        image = self.image
+        if not image:
+            raise ValueError(f"[{self.name}] No image to run")
+        run_kwargs = self.run_options.copy()
+        run_kwargs.setdefault("auto_remove", True)
+        if ("network" not in run_kwargs) and (
+            "network_mode" not in run_kwargs
+        ):
+            run_kwargs["network_mode"] = "none"
+        if isinstance(run_kwargs.get("network"), NetworkManager):
+            run_kwargs["network"] = run_kwargs["network"].name
+        config = create_config(image, run_kwargs)
+        print(f"[{self.name}] Start container...")
+        try:
+            await self.client.create_container(self.name, config)
+        except NotFound:
+            print(f"[{self.name}] Pulling image {image}...")
+            await self.client.pull_image(image)
+            await self.client.create_container(self.name, config)
+        await self.client.start_container(self.name)
+        print(f"[{self.name}] Start container...OK")
+        if self.follow_logs:
+            self._logtask = asyncio.create_task(self.logger())
+        if not noconfig and self.net_options:
+            return await self.config(self.net_options)
+        return True
+
+    async def logger(self, timestamps: bool = True) -> None:
+        tty = (await self.inspect() or {}).get("Config", {}).get("Tty")
+        async for line in self.client.logs(
+            self.name, tty=bool(tty), timestamps=timestamps
+        ):
+            print(f"[{self.name}] {line.decode(errors='replace')}")
+        print(
+            f"[{self.name}] !!! Logging interrupted. Container stopped? !!!"  # noqa : E501
+        )
+
+    async def inspect(self) -> Optional[dict]:
+        try:
+            self._attrs = await self.client.inspect_container(self.name)
+        except NotFound:
+            self._attrs = None
+            self.pid = 0
+            return None
+        self.pid = self._attrs["State"]["Pid"]
+        return self._attrs
+
+    async def is_running(self) -> bool:
+        attrs = await self.inspect()
+        return bool(attrs and attrs["State"]["Running"])
+
+    async def wait_for_start(self, timeout: float = 60) -> bool:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = 0.05
+        while not await self.is_running():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                print(f"[{self.name}] Waiting for container to start...NOK!")
+                return False
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, 1)
+        return True
+
+    async def stop(self, timeout: int = 10) -> None:
+        if not await self.is_running():
+            print(f"[{self.name}] Container already stopped...")
+            return
+        print(f"[{self.name}] Stopping container...")
+        try:
+            await self.client.stop_container(self.name, timeout=timeout)
+        except NotFound:
+            pass
+        if self._logtask:
+            await asyncio.gather(self._logtask, return_exceptions=True)
+            self._logtask = None
+        print(f"[{self.name}] Stopping container...OK")
+
+    @staticmethod
+    def _depends(options) -> set["AsyncContainerManager"]:
+        depends = options.get("depends", [])
+        if isinstance(depends, AsyncContainerManager):
+            return {depends}
+        return set(depends)
+
+    @classmethod
+    def _peers(cls, value) -> set["AsyncContainerManager"]:
+        # Containers referred to in options, alone or as (container, network)
+        if isinstance(value, AsyncContainerManager):
+            return {value}
+        if isinstance(value, dict):
+            value = list(value.values())
+        if isinstance(value, (list, tuple, set)):
+            return set().union(*(cls._peers(v) for v in value))
+        return set()
+
+    @property
+    def peers(self) -> set["AsyncContainerManager"]:
+        return self._peers([self.net_options, self.post_options]) - {self}
+
+    @property
+    def dependencies(self) -> set["AsyncContainerManager"]:
+        # Peers of the net options resolve while the container starts
+        return (
+            self._depends(self.net_options)
+            | self._depends(self.post_options)
+            | self._peers(self.net_options)
+        ) - {self}
+
+    async def config(self, options) -> bool:
+        if not await self.wait_for_start():
+            return False
+        for d in self._peers(options) - {self}:
+            if not await d.wait_for_start(timeout=DEPENDENCY_TIMEOUT):
+                print(
+                    f"[{self.name}] Dependency [{d.name}] failed to start! (Timeout set to {DEPENDENCY_TIMEOUT}s) Stopping configuration..."  # noqa : E501
+                )
+                return False
+        for o in options:
+            if o == "depends":
+                continue
+            if o not in CONFIG_OPTIONS:
+                print(f"[{self.name}] Option '{o}' is not supported!")
+                continue
+            arglist = (
+                options[o] if isinstance(options[o], list) else [options[o]]
+            )
+            for arg in arglist:
+                if isinstance(arg, bool):
+                    await self.apply(o)
+                elif isinstance(arg, dict):
+                    await self.apply(o, **arg)
+                else:
+                    await self.apply(o, arg)
+        return True
+
+    async def post_config(self) -> bool:
+        if self.post_options:
+            return await self.config(self.post_options)
+        return True
+
+    async def apply(self, option: str, *args, **kwargs) -> None:
+        handler = getattr(self, f"_apply_{option}", None)
+        if handler:
+            await handler(*args, **kwargs)
+        else:
+            func = getattr(ProcessManager, option)
+            await asyncio.to_thread(func, self, *args, **kwargs)
+
+    async def ipaddress_in_network(self, network=None) -> str | bool:
+        if isinstance(network, NetworkManager):
+            network = network.name
+        attrs = self._attrs if self._attrs else await self.inspect()
+        if not attrs:
+            return False
+        try:
+            networks = attrs["NetworkSettings"]["Networks"]
+            if not network:
+                n = next(iter(networks.values()))
+            else:
+                n = networks[network]
+            return n["IPAddress"]
+        except (TypeError, KeyError, StopIteration):
+            return False
+
+    async def _resolve(self, ref) -> str:
+        if isinstance(ref, AsyncContainerManager):
+            address = await ref.ipaddress_in_network()
+        elif isinstance(ref, tuple) and isinstance(
+            ref[0], AsyncContainerManager
+        ):
+            network = ref[1] if len(ref) > 1 else None
+            address = await ref[0].ipaddress_in_network(network)
+        else:
+            return ref
+        if not isinstance(address, str):
+            raise ValueError(f"[{self.name}] No address for {ref}")
+        return address
+
+    async def _apply_add_if(self, interface) -> None:
+        print(f"[{self.name}] Add interface {interface} to container...")
+        host = self.host if self.host else ProcessManager("host", pid=1)
+        await asyncio.to_thread(host.intf_to_netns, interface, self.pid)
+
+    async def _apply_add_route(self, subnet, via) -> None:
+        _via = await self._resolve(via)
+        await asyncio.to_thread(ProcessManager.add_route, self, subnet, _via)
+
+    async def _apply_change_default_route(self, ipaddress) -> None:
+        _ipaddress = await self._resolve(ipaddress)
+        await asyncio.to_thread(
+            ProcessManager.change_default_route, self, _ipaddress
+        )
+
+    async def _apply_change_nameserver(self, nameservers) -> None:
+        if isinstance(nameservers, AsyncContainerManager):
+            nameservers = [await nameservers.ipaddress_in_network()]
+        await asyncio.to_thread(
+            ProcessManager.change_nameserver, self, nameservers
+        )
+
+    async def _apply_add_network(self, network) -> None:
+        if isinstance(network, NetworkManager):
+            network = network.name
+        await self.client.connect_network(network, self.name)
+        self._attrs = None
+        print(f"[{self.name}] Network {network} connected...")
+
+
+class AsyncOverdoseManager:
+    def __init__(
+        self,
+        host=None,
+        containers=None,
+        version="latest",
+        workers=DEFAULT_WORKERS * 8,
+    ):
+        if not host:
+            self.host = ProcessManager("host", pid=1)
+        else:
+            self.host = host
+        self.containers: dict[str, AsyncContainerManager] = (
+            containers if containers else {}
+        )
+        self.version = version
+        self.workers = workers
+
+    def add(self, container: AsyncContainerManager) -> None:
+        if container.image and ":" not in container.image:
+            container.image = f"{container.image}:{self.version}"
+        self.containers[container.name] = container
+        container.host = self.host
+
+    def _names(self, containers, autostart_only=False) -> list[str]:
+        if containers:
+            return [containers] if isinstance(containers, str) else containers
+        return [
+            n
+            for n, c in self.containers.items()
+            if c.autostart or not autostart_only
+        ]
+
+    async def _schedule(self, names, func, reverse=False) -> ScheduleResult:
+        graph = {
+            n: {d.name for d in self.containers[n].dependencies} for n in names
+        }
+        # Raises DependencyCycleError
+        scheduler = DependencyScheduler(graph)
+        if reverse:
+            scheduler = scheduler.reversed()
+        result = ScheduleResult()
+        done = {n: asyncio.Event() for n in scheduler.graph}
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def run(n):
+            for d in scheduler.graph[n]:
+                await done[d].wait()
+            failed = [
+                d
+                for d in scheduler.graph[n]
+                if d in result.failed or d in result.skipped
+            ]
+            if failed:
+                d = failed[0]
+                result.skipped[n] = result.skipped.get(d, d)
+            else:
+                try:
+                    async with semaphore:
+                        ok = await func(self.containers[n])
+                    if ok is False:
+                        result.failed[n] = "returned False"
+                    else:
+                        result.succeeded.append(n)
+                except Exception as e:
+                    result.failed[n] = e
+            done[n].set()
+
+        await asyncio.gather(*(run(n) for n in scheduler.graph))
+        return result
+
+    async def start_containers(
+        self, containers=None, noconfig=False, post_config=False
+    ) -> ScheduleResult:
+        names = self._names(containers, autostart_only=True)
+        # Post config referring to peers that may still be starting waits
+        # until all containers run
+        deferred = [
+            n
+            for n in names
+            if self.containers[n].peers - self.containers[n].dependencies
+        ]
+
+        async def start(c):
+            if not await c.run(noconfig=noconfig):
+                return False
+            if post_config and c.name not in deferred:
+                return await c.post_config()
+            return True
+
+        result = await self._schedule(names, start)
+        if post_config:
+            await asyncio.gather(
+                *(
+                    self.containers[n].post_config()
+                    for n in deferred
+                    if n in result.succeeded
+                )
+            )
+        result.report("start")
+        return result
+
+    async def post_start_config(self, containers=None) -> ScheduleResult:
+        async def configure(c):
+            if await c.is_running():
+                return await c.post_config()
+            return True
+
+        result = await self._schedule(self._names(containers), configure)
+        result.report("configure")
+        return result
+
+    async def stop_containers(self, containers=None) -> None:
+        await asyncio.gather(
+            *(self.containers[n].stop() for n in self._names(containers))
+        )
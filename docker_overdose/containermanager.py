@@ -1,9 +1,58 @@
+import hashlib
+import json
 import time
 import threading
-from typing import Optional, Union
-from .processmanager import ProcessManager
+from typing import TYPE_CHECKING, Any, Optional, Union
+from .processmanager import DEFAULT_BACKEND, ProcessManager
+from .netlink import close_netns_worker
+from .logmux import LogMultiplexer
 from .networkmanager import NetworkManager
-from .dockerclient import get_docker_client
+from .dockerclient import get_endpoint_client
+from .inventory import get_inventory
+from .tracing import get_tracer
+from .probes import READY_TIMEOUT, Probe, wait_ready
+from .plan import ConfigPlan
+from .state import get_config_state
+from .events import (
+    POLL_INTERVAL,
+    POLL_INTERVAL_WITH_EVENTS,
+    get_event_watcher,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .pool import ContainerPool
+
+# Options accepted by ContainerManager.config
+CONFIG_OPTIONS = (
+    "add_if",
+    "intf_set_ip",
+    "intf_up",
+    "delete_default_route",
+    "change_default_route",
+    "add_route",
+    "change_nameserver",
+    "set_masquerade",
+    "config_bridge",
+    "add_network",
+)
+
+# Label carrying the hash of the image and run options of a container
+RUN_HASH_LABEL = "docker-overdose.run-hash"
+# Seconds a container waits for its dependencies to be started, woken by
+# the docker events of the dependency
+DEPENDENCY_TIMEOUT = 30
+
+
+def _option_ref(value):
+    # Containers and networks in options are referred to by name
+    name = getattr(value, "name", None)
+    return {"ref": name} if name is not None else repr(value)
+
+
+def options_hash(*options) -> str:
+    """Stable hash of (nested) options, independent of dict order."""
+    data = json.dumps(options, sort_keys=True, default=_option_ref)
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
 
 
 class ContainerManager(ProcessManager):
@@ -16,22 +65,88 @@ class ContainerManager(ProcessManager):
         post_options={},
         autostart: bool = True,
         host: Optional["ContainerManager"] = None,
+        backend: str = DEFAULT_BACKEND,
+        logmux: Optional[LogMultiplexer] = None,
+        adopt: bool = False,
+        pool: Optional["ContainerPool"] = None,
+        readiness: Optional[Union[Probe, list[Probe]]] = None,
+        endpoint: Optional[str] = None,
     ):
-        self.client = get_docker_client()
+        # Docker endpoint the container runs on, None for the default one
+        self.endpoint = endpoint
         self.name = name
         self.image = image
         self.run_options = run_options
+        # phase ("net", "post") -> compiled plan of its options
+        self._plans: dict[str, ConfigPlan] = {}
         self.net_options = net_options
         self.post_options = post_options
         self.autostart = autostart
         self.host = host
-        self._container = None
+        self.backend = backend
+        self.logmux = logmux
+        # Reuse a running container started with the same image and run
+        # options, and only configure it if its config changed
+        self.adopt = adopt
+        self.adopted = False
+        # Take the container from (and return it to) a pool of idle ones
+        self.pool = pool
+        # Probes dependents wait for on top of the container running
+        if isinstance(readiness, Probe):
+            readiness = [readiness]
+        self.probes: list[Probe] = list(readiness) if readiness else []
+        self._ready = False
+        self._ready_lock = threading.Lock()
+        self._container: Any = None
         self._pid = None
+        # network name -> IP address, filled from a single inspect
+        self._addresses: Optional[dict[str, str]] = None
         self.is_running
 
     def run(self, noconfig: bool = False):
-        # TODO: Check if the container is already running
+        with get_tracer().span("run", "lifecycle", container=self.name) as s:
+            configured = self._run(noconfig)
+            s.set(ok=configured)
+            return configured
+
+    def _run(self, noconfig: bool):
         self.clear_cache()
+        self.adopted = False
+        if self.adopt:
+            existing = self.inventory.get(self.name)
+            if existing is not None:
+                if self._adoptable(existing):
+                    return self._adopt(noconfig)
+                print(f"[{self.name}] Replacing outdated container...", end="")
+                existing.remove(force=True)
+                self.inventory.invalidate(self.name)
+                print("OK")
+        since = None
+        if self.pool:
+            print(f"[{self.name}] Take container from pool...", end="")
+            self._container, reused = self.pool.acquire(self)
+            if reused:
+                # Don't show what the previous user logged
+                since = int(time.time())
+        else:
+            print(f"[{self.name}] Start container...", end="")
+            with get_tracer().span(
+                "containers.run", "docker", container=self.name
+            ):
+                self._container = self.client.containers.run(
+                    self.image, **self.run_kwargs()
+                )
+        # The returned model was inspected before the start
+        self.inventory.update(self.name, self._container, status="running")
+        print("OK")
+        configured = True
+        if not noconfig and self.net_options:
+            configured = self._config_once("net")
+        self.follow_logs(since=since)
+        return configured
+
+    def run_kwargs(self) -> dict:
+        """Keyword arguments of containers.run for this container."""
         run_kwargs = self.run_options.copy()
         run_kwargs["name"] = self.name
         if "detach" not in run_kwargs:
@@ -46,102 +161,273 @@ class ContainerManager(ProcessManager):
             isinstance(run_kwargs["network"], NetworkManager)
         ):
             run_kwargs["network"] = run_kwargs["network"].name
-        print(f"[{self.name}] Start container...", end="")
-        self._container = self.client.containers.run(self.image, **run_kwargs)
+        labels = run_kwargs.get("labels") or {}
+        if isinstance(labels, list):
+            labels = {label: "" for label in labels}
+        run_kwargs["labels"] = dict(labels, **{RUN_HASH_LABEL: self.run_hash})
+        return run_kwargs
+
+    @staticmethod
+    def _labels(container) -> dict:
+        # Sparse list results carry the labels at the top level
+        attrs = container.attrs
+        return (
+            attrs.get("Labels") or attrs.get("Config", {}).get("Labels") or {}
+        )
+
+    def _adoptable(self, container) -> bool:
+        return (
+            self.inventory.status(container) == "running"
+            and self._labels(container).get(RUN_HASH_LABEL) == self.run_hash
+        )
+
+    def _adopt(self, noconfig: bool) -> bool:
+        print(f"[{self.name}] Adopting running container...", end="")
+        attrs = self.inventory.inspect(self.name)
+        if not attrs:
+            print("NOK!")
+            return False
+        self._container = self.client.containers.prepare_model(attrs)
+        self.inventory.update(self.name, self._container)
+        self.adopted = True
         print("OK")
+        configured = True
         if not noconfig and self.net_options:
-            self.config(self.net_options)
-        # TODO: Spawn logging thread
-        self.logthread = threading.Thread(target=self.logger)
-        self.logthread.start()
+            configured = self._config_once("net")
+        # Only what is logged from now on, the rest was shown before
+        self.follow_logs(since=int(time.time()))
+        return configured
+
+    def follow_logs(self, since: Optional[int] = None) -> None:
+        # Follow the logs through the shared multiplexer if there is one,
+        # otherwise spawn a logging thread for this container
+        for probe in self.probes:
+            probe.arm(self)
+        if not (self.logmux and self.logmux.attach(self, since=since)):
+            self.logthread = threading.Thread(
+                target=self.logger, kwargs={"since": since}
+            )
+            self.logthread.start()
 
-    def logger(self, timestamps=True):
+    def logger(self, timestamps=True, since=None):
         i = self._container.logs(
-            stream=True, follow=True, timestamps=timestamps
+            stream=True, follow=True, timestamps=timestamps, since=since
         )
+        store = self.logmux.store if self.logmux else None
+        echo = self.logmux.echo if self.logmux else True
         try:
             while True:
-                line = next(i).decode().strip("\n\r")
-                print(f"[{self.name}] {line}")
+                raw = next(i).strip(b"\n\r")
+                if self.logmux and self.logmux.watches:
+                    self.logmux.match(self.name, [raw])
+                if store:
+                    store.write(self.name, [raw])
+                if echo:
+                    print(f"[{self.name}] {raw.decode(errors='replace')}")
         except StopIteration:
             print(
                 f"[{self.name}] !!! Logging interrupted. Container stopped? !!!"  # noqa : E501
             )  # noqa: E501
 
-    def config(self, options):
-        self.wait_for_start()
+    @property
+    def endpoint(self) -> Optional[str]:
+        return self._endpoint
 
-        DEPENDENCY_TIMEOUT = 0
+    @endpoint.setter
+    def endpoint(self, endpoint: Optional[str]) -> None:
+        self._endpoint = endpoint
+        self.client = get_endpoint_client(endpoint)
+        self.inventory = get_inventory(self.client)
 
-        # Wait for related containers
-        dependencies = set()
-        if "depends" in options:
-            if isinstance(options["depends"], ContainerManager):
-                dependencies.add(options["depends"])
-            else:
-                dependencies.update(options["depends"])
-        # TODO: Search for other dependencies in the options
-        for d in dependencies:
+    @property
+    def net_options(self) -> dict:
+        return self._net_options
+
+    @net_options.setter
+    def net_options(self, options: dict) -> None:
+        # Options are replaced, not changed in place, plans are recompiled
+        self._net_options = options
+        self._plans.pop("net", None)
+
+    @property
+    def post_options(self) -> dict:
+        return self._post_options
+
+    @post_options.setter
+    def post_options(self, options: dict) -> None:
+        self._post_options = options
+        self._plans.pop("post", None)
+
+    def plan(self, phase: str) -> ConfigPlan:
+        """Compiled plan of the options of `phase` ("net" or "post")."""
+        plan = self._plans.get(phase)
+        if plan is None:
+            options = self.net_options if phase == "net" else self.post_options
+            plan = self._plans[phase] = ConfigPlan(
+                options, type(self), CONFIG_OPTIONS
+            )
+        return plan
+
+    def compile(self) -> None:
+        """Compile the plans of all phases, ValueError on bad options."""
+        for phase in ("net", "post"):
+            self.plan(phase)
+
+    def config(self, options: Union[dict, ConfigPlan]):
+        if not isinstance(options, ConfigPlan):
+            options = ConfigPlan(options, type(self), CONFIG_OPTIONS)
+        with get_tracer().span(
+            "config", "lifecycle", container=self.name
+        ) as s:
+            configured = self._config(options)
+            s.set(ok=configured)
+            return configured
+
+    def _config(self, plan: ConfigPlan):
+        tracer = get_tracer()
+        self.wait_for_start()
+
+        # Wait for related containers, and for the peers whose addresses
+        # the options resolve
+        for d in plan.depends | (plan.peers - {self}):
             print("\t", end="")
-            if not d.wait_for_start(timeout=DEPENDENCY_TIMEOUT):
+            with tracer.span(
+                "depends", "wait", container=self.name, dependency=d.name
+            ) as s:
+                started = d.wait_for_start(timeout=DEPENDENCY_TIMEOUT)
+                s.set(ok=started)
+            if not started:
                 print(
                     f"[{self.name}] Dependency [{d.name}] failed to start! (Timeout set to {DEPENDENCY_TIMEOUT}s) Stopping configuration..."  # noqa : E501
                 )
                 return False
+            if d in plan.depends and d.probes and not d.wait_until_ready():
+                print(
+                    f"[{self.name}] Dependency [{d.name}] not ready! (Timeout set to {READY_TIMEOUT}s) Stopping configuration..."  # noqa : E501
+                )
+                return False
 
-        for o in options:
-            ignorelist = ("depends",)
-            if o in ignorelist:
-                continue
-            whitelist = (
-                "add_if",
-                "intf_set_ip",
-                "intf_up",
-                "delete_default_route",
-                "change_default_route",
-                "add_route",
-                "change_nameserver",
-                "set_masquerade",
-                "config_bridge",
-                "add_network",
-            )
-            if o not in whitelist:
-                print(f"[{self.name}] Option '{o}' is not supported!")
-                continue
-            try:
-                f = self.__getattribute__(o)
-            except AttributeError:
-                print(f"[{self.name}] Option '{o}' is not supported!")
-                continue
-
-            arglist = (
-                options[o] if isinstance(options[o], list) else [options[o]]
-            )  # noqa: E501
-            for arg in arglist:
-                if isinstance(arg, bool):
-                    f()
-                elif isinstance(arg, dict):
-                    f(**arg)
-                else:
-                    f(arg)
+        # Reuse one nsenter helper per namespace for the whole pass and
+        # apply the iptables rules of all options at once
+        plan.apply(self)
         return True
 
     def post_config(self):
         if self.post_options:
-            self.config(self.post_options)
+            return self._config_once("post")
+        return True
+
+    def _config_once(self, phase: str) -> bool:
+        """Apply the plan of `phase`, in adopt mode only if it wasn't yet."""
+        plan = self.plan(phase)
+        if not self.adopt:
+            return self.config(plan)
+        state = get_config_state()
+        fingerprint = self.config_fingerprint(plan.options)
+        if state.matches(self.name, self._container.id, phase, fingerprint):
+            print(f"[{self.name}] Configuration ({phase}) up to date...OK")
+            return True
+        configured = self.config(plan)
+        if configured:
+            state.record(self.name, self._container.id, phase, fingerprint)
+        return configured
+
+    def config_fingerprint(self, options) -> str:
+        # Peers count with their current container, so the config is
+        # applied again once a peer was recreated (and got a new address)
+        peers = {
+            c.name: getattr(self.inventory.get(c.name), "id", None)
+            for c in self._peers(options)
+        }
+        return options_hash(options, peers)
+
+    @classmethod
+    def _peers(cls, value) -> set["ContainerManager"]:
+        if isinstance(value, ContainerManager):
+            return {value}
+        if isinstance(value, dict):
+            value = list(value.values())
+        if isinstance(value, (list, tuple, set)):
+            return set().union(*(cls._peers(v) for v in value))
+        return set()
+
+    @property
+    def run_hash(self) -> str:
+        return options_hash(self.image, self.run_options)
+
+    @staticmethod
+    def _depends(options) -> set["ContainerManager"]:
+        dependencies = set()
+        if "depends" in options:
+            if isinstance(options["depends"], ContainerManager):
+                dependencies.add(options["depends"])
+            else:
+                dependencies.update(options["depends"])
+        return dependencies
+
+    @property
+    def peers(self) -> set["ContainerManager"]:
+        """Containers whose addresses the options resolve."""
+        return (self.plan("net").peers | self.plan("post").peers) - {self}
+
+    @property
+    def dependencies(self) -> set["ContainerManager"]:
+        # Containers started before this one: the ones it depends on and
+        # the peers its net options refer to. Peers of the post options
+        # are only needed once everything runs, see OverdoseManager.
+        net = self.plan("net")
+        return (net.depends | net.peers | self.plan("post").depends) - {self}
 
     def add_if(self, interface):
         print(f"[{self.name}] Add interface {interface} to container...")
         self.host.intf_to_netns(interface, self.pid)
 
-    def stop(self):
-        if self.is_running:
+    def stop(self, timeout: Optional[int] = None) -> bool:
+        """Stop the container, killing it after `timeout` seconds.
+
+        Returns False when the container was not running.
+        """
+        running = self.is_running
+        if running and self.pool and self.pool.release(self):
+            self.inventory.invalidate(self.name)
+            self.clear_cache()
+            return True
+        if running:
             print(f"[{self.name}] Stopping container...", end="")
-            self._container.stop()
+            watcher = get_event_watcher(self.client)
+            since = watcher.seq if watcher else 0
+            with get_tracer().span("stop", "lifecycle", container=self.name):
+                if timeout is None:
+                    self._container.stop()
+                else:
+                    self._container.stop(timeout=timeout)
+            if watcher:
+                # Make sure the daemon has processed the exit before others
+                # look at the state of this container again
+                watcher.wait(
+                    self.name,
+                    ("die", "destroy"),
+                    since=since,
+                    timeout=POLL_INTERVAL_WITH_EVENTS,
+                )
             print("OK")
         else:
             print(f"[{self.name}] Container already stopped...")
+        self.inventory.invalidate(self.name)
+        self.clear_cache()
+        return running
+
+    def kill(self) -> bool:
+        running = self.is_running
+        if running:
+            print(f"[{self.name}] Killing container...", end="")
+            self._container.kill()
+            print("OK")
+        if self.pool:
+            self.pool.forget(self)
+        self.inventory.invalidate(self.name)
         self.clear_cache()
+        return running
 
     @property
     def container(self):
@@ -160,33 +446,69 @@ class ContainerManager(ProcessManager):
 
     @property
     def is_running(self):
-        try:
-            self._container = self.client.containers.list(
-                filters={"name": self.name, "status": "running"}
-            )[
-                0
-            ]  # noqa: E501
-            return True
-        except IndexError:
+        # Served from the inventory shared by all containers
+        c = self.inventory.get(self.name)
+        if c is None or self.inventory.status(c) != "running":
             return False
+        if self._container is None or self._container.id != c.id:
+            self._container = c
+        return True
 
     def wait_for_start(self, timeout=60):
+        with get_tracer().span(
+            "wait_for_start", "wait", container=self.name
+        ) as s:
+            running = self._wait_for_start(timeout)
+            s.set(ok=running)
+            return running
+
+    def _wait_for_start(self, timeout):
         print(f"[{self.name}] Waiting for container to start...", end="")
         starttime = time.time()
-        while (not self.is_running) and (time.time() - starttime < timeout):
-            time.sleep(1)
-        if self.is_running:
+        watcher = get_event_watcher(self.client)
+        # Take the event marker before checking, so a start in between the
+        # check and the wait is not missed
+        since = watcher.seq if watcher else 0
+        running = self.is_running
+        while (not running) and (time.time() - starttime < timeout):
+            remaining = timeout - (time.time() - starttime)
+            if watcher and watcher.alive:
+                watcher.wait(
+                    self.name,
+                    ("start", "health_status"),
+                    since=since,
+                    timeout=min(remaining, POLL_INTERVAL_WITH_EVENTS),
+                )
+                since = watcher.seq
+            else:
+                time.sleep(min(remaining, POLL_INTERVAL))
+            running = self.is_running
+        if running:
             print("OK")
             return True
         else:
             print("NOK!")
             return False
 
+    def wait_until_ready(self, timeout=READY_TIMEOUT) -> bool:
+        """Wait until all readiness probes of the running container pass."""
+        if self._ready or not self.probes:
+            return True
+        # Dependents waiting at the same time share one probing loop
+        with self._ready_lock, get_tracer().span(
+            "wait_until_ready", "wait", container=self.name
+        ) as s:
+            if not self._ready:
+                print(f"[{self.name}] Waiting for readiness...", end="")
+                self._ready = wait_ready(self, self.probes, timeout)
+                print("OK" if self._ready else "NOK!")
+            s.set(ok=self._ready)
+            return self._ready
+
     @property
     def inspect(self):
         if self._container:
-            self._container.reload()
-            return self._container.attrs
+            return self.inventory.inspect(self.name) or False
         else:
             return False
 
@@ -194,65 +516,80 @@ class ContainerManager(ProcessManager):
     def ipaddress(self) -> str | bool:
         return self.ipaddress_in_network()
 
-    def ipaddress_in_network(self, network=None) -> str | bool:
-        try:
-            networks = self.inspect["NetworkSettings"]["Networks"]
-            if not network:
-                n = next(iter(networks.values()))
-            else:
-                n = networks[network]
-            return n["IPAddress"]
-        except ValueError:  # TODO: Use correct error type(s)
-            return False
+    @property
+    def addresses(self) -> dict[str, str]:
+        if self._addresses is None:
+            attrs = self.inspect
+            if not attrs:
+                return {}
+            networks = attrs["NetworkSettings"]["Networks"] or {}
+            self._addresses = {
+                name: n["IPAddress"] for name, n in networks.items()
+            }
+        return self._addresses
+
+    def ipaddress_in_network(
+        self, network: Optional[Union[str, NetworkManager]] = None
+    ) -> str | bool:
+        name = network.name if isinstance(network, NetworkManager) else network
+        addresses = self.addresses
+        if not name:
+            return next(iter(addresses.values()), False)
+        return addresses.get(name, False)
+
+    @staticmethod
+    def resolve_address(
+        ref: Union[
+            "ContainerManager",
+            tuple["ContainerManager", Union[str, NetworkManager, None]],
+            str,
+        ],
+    ) -> str | bool:
+        if isinstance(ref, ContainerManager):
+            return ref.ipaddress
+        elif isinstance(ref, tuple) and isinstance(ref[0], ContainerManager):
+            network = ref[1] if len(ref) > 1 else None
+            if not isinstance(network, (str, NetworkManager)):
+                network = None
+            return ref[0].ipaddress_in_network(network=network)
+        return ref
 
     def add_route(
         self,
         subnet: str,
         via: Union["ContainerManager", tuple["ContainerManager", str], str],
     ):
-        if isinstance(via, ContainerManager):
-            _via = via.ipaddress
-        elif isinstance(via, tuple) and isinstance(via[0], ContainerManager):
-            _via = via[0].ipaddress_in_network(network=via[1])
-        else:
-            _via = via
-        super().add_route(subnet, _via)
+        super().add_route(subnet, self.resolve_address(via))
 
     def add_network(self, network):
-        if isinstance(network, str):
-            network = self.client.networks.get(network)
-        elif isinstance(network, NetworkManager):
-            network = network._network
-        network.connect(self.name)
-        print(f"[{self.name}] Network {network.name} connected...")
+        if isinstance(network, NetworkManager):
+            network = network.name
+        elif not isinstance(network, str):
+            network = network.name
+        # The API accepts names, so no network lookup is needed
+        self.client.api.connect_container_to_network(self.name, network)
+        self._addresses = None
+        self.inventory.drop_inspect(self.name)
+        print(f"[{self.name}] Network {network} connected...")
 
     def change_nameserver(self, nameservers):
-        if isinstance(nameservers, ContainerManager):
-            _nameservers = [nameservers.ipaddress]
-        else:
-            _nameservers = nameservers
-        super().change_nameserver(_nameservers)
+        # One reference, or a list of them
+        if isinstance(nameservers, (str, ContainerManager)) or (
+            isinstance(nameservers, tuple)
+            and isinstance(nameservers[0], ContainerManager)
+        ):
+            nameservers = [nameservers]
+        super().change_nameserver(
+            [self.resolve_address(n) for n in nameservers]
+        )
 
     def change_default_route(self, ipaddress):
-        if isinstance(ipaddress, ContainerManager):
-            _ipaddress = ipaddress.ipaddress
-        elif isinstance(ipaddress, tuple) and isinstance(
-            ipaddress[0], ContainerManager
-        ):
-            if isinstance(ipaddress[1], str):
-                _ipaddress = ipaddress[0].ipaddress_in_network(
-                    network=ipaddress[1]
-                )
-            elif isinstance(ipaddress[1], NetworkManager):
-                _ipaddress = ipaddress[0].ipaddress_in_network(
-                    network=ipaddress[1].name
-                )
-            else:
-                _ipaddress = ipaddress[0].ipaddress
-        else:
-            _ipaddress = ipaddress
-        super().change_default_route(_ipaddress)
+        super().change_default_route(self.resolve_address(ipaddress))
 
     def clear_cache(self):
+        if self._pid:
+            close_netns_worker(self._pid)
         self._container = None
         self._pid = None
+        self._ready = False
+        self._addresses = None
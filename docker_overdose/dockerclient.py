@@ -1,21 +1,67 @@
 import os
-import docker
+import threading
+from typing import Optional
 
 DOCKER_SOCK_OPTIONS = ("/var/run/docker.sock", "/var/run/balena-engine.sock")
-DOCKER_SOCK = None
-for opt in DOCKER_SOCK_OPTIONS:
-    if os.path.exists(opt):
-        DOCKER_SOCK = opt
-        break
-if not DOCKER_SOCK:
+# Environment variable overriding the socket discovery
+DOCKER_SOCK_ENV = "DOCKER_OVERDOSE_SOCK"
+# Number of keep-alive connections to the daemon
+DEFAULT_POOL_SIZE = 32
+# Retries for idempotent requests failing on a connection error
+DEFAULT_RETRIES = 2
+
+docker_sock = None
+
+
+def find_docker_sock(path: Optional[str] = None) -> str:
+    # A configured socket is used or fails, the defaults are only searched
+    # without one
+    path = path or os.environ.get(DOCKER_SOCK_ENV)
+    if path:
+        if not os.path.exists(path):
+            raise Exception(f"Docker socket {path} not available!")
+        return path
+    for opt in DOCKER_SOCK_OPTIONS:
+        if os.path.exists(opt):
+            return opt
     raise Exception("No docker socket available!")
 
+
+def get_docker_sock(path: Optional[str] = None) -> str:
+    global docker_sock
+    if path or not docker_sock:
+        docker_sock = find_docker_sock(path)
+    return docker_sock
+
+
+def __getattr__(name):
+    # Socket discovery is deferred until DOCKER_SOCK is first used
+    if name == "DOCKER_SOCK":
+        return get_docker_sock()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 docker_client = None
+# Clients of the other endpoints, by endpoint
+endpoint_clients: dict = {}
+endpoint_lock = threading.Lock()
 
 
-def connect(base_url=f"unix:/{DOCKER_SOCK}"):
+def connect(
+    base_url=None,
+    pool_size=DEFAULT_POOL_SIZE,
+    retries=DEFAULT_RETRIES,
+    socket_path=None,
+):
     global docker_client
-    docker_client = docker.DockerClient(base_url=base_url)
+    # Importing the docker SDK is deferred until the first connection
+    from .dockerpool import PooledDockerClient
+
+    if not base_url:
+        base_url = f"unix:/{get_docker_sock(socket_path)}"
+    docker_client = PooledDockerClient(
+        base_url=base_url, pool_size=pool_size, retries=retries
+    )
 
 
 def get_docker_client():
@@ -23,3 +69,32 @@ def get_docker_client():
     if not docker_client:
         connect()
     return docker_client
+
+
+def endpoint_url(endpoint: str) -> str:
+    # A bare path is a unix socket
+    return endpoint if "://" in endpoint else f"unix://{endpoint}"
+
+
+def get_endpoint_client(
+    endpoint: Optional[str] = None,
+    pool_size=DEFAULT_POOL_SIZE,
+    retries=DEFAULT_RETRIES,
+):
+    """Client of `endpoint` (a socket path, unix:// or tcp:// URL).
+
+    Without an endpoint this is the global client.
+    """
+    if not endpoint:
+        return get_docker_client()
+    from .dockerpool import PooledDockerClient
+
+    with endpoint_lock:
+        client = endpoint_clients.get(endpoint)
+        if client is None:
+            client = endpoint_clients[endpoint] = PooledDockerClient(
+                base_url=endpoint_url(endpoint),
+                pool_size=pool_size,
+                retries=retries,
+            )
+        return client
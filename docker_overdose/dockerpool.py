@@ -0,0 +1,131 @@
+import bisect
+import threading
+import time
+from typing import Optional
+import docker
+import requests
+from .dockerclient import DEFAULT_POOL_SIZE, DEFAULT_RETRIES
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+
+class ClientMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        # Last bucket counts everything above the largest bound
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_total = 0.0
+
+    def start(self) -> float:
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        return time.perf_counter()
+
+    def finish(self, started: float, error: bool = False) -> None:
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.in_flight -= 1
+            self.requests += 1
+            self.errors += int(error)
+            self.latency[bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+            self.latency_total += elapsed
+
+    def retried(self) -> None:
+        with self.lock:
+            self.retries += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            bounds = [str(b) for b in LATENCY_BUCKETS] + ["+Inf"]
+            return {
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "latency_total": self.latency_total,
+                "latency_histogram": dict(zip(bounds, self.latency)),
+            }
+
+    def report(self) -> None:
+        s = self.snapshot()
+        average = s["latency_total"] / s["requests"] if s["requests"] else 0
+        print(
+            f"Docker API: {s['requests']} requests, {s['errors']} errors, "
+            f"{s['retries']} retries, max {s['max_in_flight']} in flight, "
+            f"avg {average * 1000:.1f}ms"
+        )
+        for bound, count in s["latency_histogram"].items():
+            print(f"\t<= {bound}s: {count}")
+
+
+class InstrumentedAPIClient(docker.APIClient):
+    def __init__(
+        self,
+        *args,
+        metrics: Optional[ClientMetrics] = None,
+        retries: int = DEFAULT_RETRIES,
+        **kwargs,
+    ):
+        # Set before connecting, the API version lookup already goes
+        # through send()
+        self.metrics = metrics if metrics else ClientMetrics()
+        self.retries = retries
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        attempt = 0
+        while True:
+            started = self.metrics.start()
+            try:
+                response = super().send(request, **kwargs)
+            except requests.exceptions.ConnectionError:
+                self.metrics.finish(started, error=True)
+                if (
+                    request.method not in IDEMPOTENT_METHODS
+                    or attempt >= self.retries
+                ):
+                    raise
+                attempt += 1
+                self.metrics.retried()
+                continue
+            self.metrics.finish(started, error=response.status_code >= 500)
+            return response
+
+
+class PooledDockerClient(docker.DockerClient):
+    """DockerClient with a sized keep-alive pool and request metrics.
+
+    The connection pool is thread-safe, so one client can be shared by all
+    threads; concurrent requests each take their own connection from the
+    pool instead of queueing on a single one.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        retries: int = DEFAULT_RETRIES,
+        metrics: Optional[ClientMetrics] = None,
+        **kwargs,
+    ):
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.api = InstrumentedAPIClient(
+            base_url=base_url,
+            max_pool_size=pool_size,
+            metrics=metrics,
+            retries=retries,
+            **kwargs,
+        )
+
+    @property
+    def metrics(self) -> ClientMetrics:
+        return self.api.metrics
@@ -0,0 +1,149 @@
+import threading
+import time
+from typing import Callable, Iterable, Optional
+from . import dockerclient
+from .dockerclient import get_docker_client
+
+# Fallback polling intervals for waiters (in seconds)
+POLL_INTERVAL = 1
+POLL_INTERVAL_WITH_EVENTS = 5
+# Seconds before subscribing again after a failure, doubled per failure
+RETRY_INITIAL = 1
+RETRY_MAX = 60
+
+
+class EventWatcher:
+    def __init__(self, client=None):
+        self.client = client if client else get_docker_client()
+        self._cond = threading.Condition()
+        # container name -> (last action, sequence number)
+        self._states: dict[str, tuple[str, int]] = {}
+        self._seq = 0
+        self._listeners: list[Callable[[str, str, dict], None]] = []
+        self._stream = None
+        self._thread: Optional[threading.Thread] = None
+        # Failed subscriptions in a row, and when to try again
+        self._failures = 0
+        self._retry_at = 0.0
+
+    @property
+    def alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def seq(self) -> int:
+        with self._cond:
+            return self._seq
+
+    def start(self) -> bool:
+        with self._cond:
+            if self.alive:
+                return True
+            if time.monotonic() < self._retry_at:
+                # Failed recently, the callers poll meanwhile
+                return False
+            try:
+                self._stream = self.client.events(
+                    decode=True, filters={"type": "container"}
+                )
+            except Exception as e:
+                if not self._failures:
+                    print(f"Unable to subscribe to docker events ({e})")
+                delay = min(RETRY_INITIAL * 2**self._failures, RETRY_MAX)
+                self._failures += 1
+                self._retry_at = time.monotonic() + delay
+                return False
+            self._failures = 0
+            self._thread = threading.Thread(target=self._watch, daemon=True)
+            self._thread.start()
+            return True
+
+    def close(self) -> None:
+        if self._stream is not None:
+            self._stream.close()
+
+    def add_listener(self, callback: Callable[[str, str, dict], None]):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str, str, dict], None]):
+        self._listeners.remove(callback)
+
+    def _watch(self) -> None:
+        try:
+            for event in self._stream:
+                self._handle(event)
+        except Exception:
+            pass
+        finally:
+            with self._cond:
+                self._cond.notify_all()
+
+    def _handle(self, event: dict) -> None:
+        action = event.get("Action") or event.get("status") or ""
+        # Health events are reported as 'health_status: healthy'
+        action = action.split(":")[0].strip()
+        name = event.get("Actor", {}).get("Attributes", {}).get("name")
+        if not name:
+            return
+        with self._cond:
+            self._seq += 1
+            self._states[name] = (action, self._seq)
+            self._cond.notify_all()
+        for callback in list(self._listeners):
+            callback(name, action, event)
+
+    def last_action(self, name: str) -> Optional[str]:
+        with self._cond:
+            state = self._states.get(name)
+        return state[0] if state else None
+
+    def wait(
+        self,
+        name: str,
+        actions: Iterable[str],
+        since: int = 0,
+        timeout: Optional[float] = None,
+    ) -> bool:
+        """Wait for one of `actions` on container `name` after `since`.
+
+        Returns False on timeout or when the event stream is gone, in which
+        case callers should fall back to polling.
+        """
+        actions = set(actions)
+
+        def happened():
+            state = self._states.get(name)
+            return state is not None and (
+                state[1] > since and state[0] in actions
+            )
+
+        with self._cond:
+            if not self.alive:
+                return happened()
+            return (
+                self._cond.wait_for(
+                    lambda: happened() or not self.alive, timeout=timeout
+                )
+                and happened()
+            )
+
+
+event_watcher: Optional[EventWatcher] = None
+# Watchers of the clients of other endpoints, by client
+event_watchers: dict[int, EventWatcher] = {}
+
+
+def get_event_watcher(client=None) -> Optional[EventWatcher]:
+    global event_watcher
+    watcher: Optional[EventWatcher]
+    if client is None or client is dockerclient.docker_client:
+        if event_watcher is None:
+            event_watcher = EventWatcher()
+        watcher = event_watcher
+    else:
+        watcher = event_watchers.get(id(client))
+        if watcher is None:
+            watcher = event_watchers[id(client)] = EventWatcher(client)
+    if not watcher.start():
+        return None
+    return watcher
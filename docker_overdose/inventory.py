@@ -0,0 +1,234 @@
+import threading
+import time
+from typing import Optional
+from .dockerclient import get_docker_client
+from .events import get_event_watcher
+
+# Seconds a snapshot or inspect result is served from memory
+DEFAULT_TTL = 2.0
+
+
+class ContainerInventory:
+    """Shared view on all containers of one daemon.
+
+    The state of every container is fetched with a single sparse
+    `containers.list(all=True)` call and served from memory until the TTL
+    expires. Inspect results are cached per container. Docker events
+    update the snapshot and drop stale inspect results right away.
+
+    Only one thread lists at a time, the others wait for its result.
+    Containers updated while a list is in flight keep their newer state,
+    invalidated containers are looked up again on their own.
+    """
+
+    def __init__(self, client=None, ttl: float = DEFAULT_TTL):
+        self.client = client if client else get_docker_client()
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._snapshot: dict = {}
+        self._snapshot_time: Optional[float] = None
+        # Changes of the snapshot are numbered, a list only replaces the
+        # containers that didn't change since it started
+        self._generation = 0
+        # container name -> generation of its last change
+        self._changed: dict[str, int] = {}
+        # Generation of the last invalidate() of all containers
+        self._invalidated = 0
+        # Invalidated containers, inspected on the next lookup
+        self._stale: set[str] = set()
+        # container name -> (inspect attrs, time)
+        self._inspect: dict[str, tuple[dict, float]] = {}
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "list_calls": 0,
+            "inspect_calls": 0,
+        }
+
+    def _expired(self, timestamp: Optional[float]) -> bool:
+        return timestamp is None or time.monotonic() - timestamp > self.ttl
+
+    def _change(self, name: str) -> None:
+        # Called with the lock held
+        self._generation += 1
+        self._changed[name] = self._generation
+
+    def refresh(self) -> None:
+        with self.lock:
+            started = self._generation
+        containers = self.client.containers.list(all=True, sparse=True)
+        snapshot = {}
+        for c in containers:
+            for name in c.attrs.get("Names", []):
+                snapshot[name.lstrip("/")] = c
+        with self.lock:
+            self.stats["list_calls"] += 1
+            for name, generation in self._changed.items():
+                if generation <= started:
+                    continue
+                # Changed while listing, the list may predate the change
+                if name in self._snapshot:
+                    snapshot[name] = self._snapshot[name]
+                else:
+                    snapshot.pop(name, None)
+            self._changed = {
+                n: g for n, g in self._changed.items() if g > started
+            }
+            self._stale &= set(self._changed)
+            self._snapshot = snapshot
+            if self._invalidated <= started:
+                self._snapshot_time = time.monotonic()
+
+    def get(self, name: str):
+        with self.lock:
+            expired = self._expired(self._snapshot_time)
+            self.stats["misses" if expired else "hits"] += 1
+        if expired:
+            with self._refresh_lock:
+                # Listed by another thread in the meantime
+                with self.lock:
+                    expired = self._expired(self._snapshot_time)
+                if expired:
+                    self.refresh()
+        with self.lock:
+            if name not in self._stale:
+                return self._snapshot.get(name)
+            started = self._generation
+        import docker
+
+        try:
+            container = self.client.containers.get(name)
+        except docker.errors.NotFound:
+            container = None
+        with self.lock:
+            self.stats["inspect_calls"] += 1
+            if self._changed.get(name, 0) <= started:
+                # Nothing newer came in while inspecting
+                self._stale.discard(name)
+                self._change(name)
+                if container is None:
+                    self._snapshot.pop(name, None)
+                else:
+                    self._snapshot[name] = container
+                    self._inspect[name] = (container.attrs, time.monotonic())
+            return self._snapshot.get(name)
+
+    @staticmethod
+    def status(container) -> Optional[str]:
+        # Sparse list results carry the status as a string, full models
+        # carry the State dict of an inspect
+        state = container.attrs.get("State")
+        if isinstance(state, dict):
+            return state.get("Status")
+        return state
+
+    def is_running(self, name: str) -> bool:
+        c = self.get(name)
+        return c is not None and self.status(c) == "running"
+
+    def inspect(self, name: str) -> Optional[dict]:
+        with self.lock:
+            cached = self._inspect.get(name)
+            hit = cached is not None and not self._expired(cached[1])
+            self.stats["hits" if hit else "misses"] += 1
+        if cached is not None and hit:
+            return cached[0]
+        import docker
+
+        try:
+            attrs = self.client.api.inspect_container(name)
+        except docker.errors.NotFound:
+            attrs = None
+        with self.lock:
+            self.stats["inspect_calls"] += 1
+            if attrs:
+                self._inspect[name] = (attrs, time.monotonic())
+            else:
+                self._inspect.pop(name, None)
+        return attrs
+
+    def update(
+        self, name: str, container, status: Optional[str] = None
+    ) -> None:
+        """Record a container the caller just created or started.
+
+        `status` overrides the state of the model, which is stale when it
+        was inspected before the container was started.
+        """
+        if status:
+            if isinstance(container.attrs.get("State"), dict):
+                container.attrs["State"]["Status"] = status
+            else:
+                container.attrs["State"] = status
+        with self.lock:
+            self._snapshot[name] = container
+            self._inspect.pop(name, None)
+            self._stale.discard(name)
+            self._change(name)
+
+    def drop_inspect(self, name: str) -> None:
+        with self.lock:
+            self._inspect.pop(name, None)
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Forget the state of `name`, or of all containers, it is fetched
+        again on the next lookup."""
+        with self.lock:
+            if name is None:
+                self._generation += 1
+                self._invalidated = self._generation
+                self._snapshot_time = None
+                self._inspect.clear()
+            else:
+                self._inspect.pop(name, None)
+                self._stale.add(name)
+                self._change(name)
+
+    def on_event(self, name: str, action: str, event: dict) -> None:
+        status = {
+            "start": "running",
+            "die": "exited",
+            "pause": "paused",
+            "unpause": "running",
+        }
+        with self.lock:
+            c = self._snapshot.get(name)
+            if (
+                c is not None
+                and event.get("id")
+                and c.id != event["id"]
+                and action != "start"
+            ):
+                # Late event of a removed container that had the name
+                return
+            self._inspect.pop(name, None)
+            if action == "destroy" or action in status:
+                self._stale.discard(name)
+                self._change(name)
+            if action == "destroy":
+                self._snapshot.pop(name, None)
+            elif action in status:
+                if c is None or (event.get("id") and c.id != event["id"]):
+                    c = self.client.containers.prepare_model(
+                        {"Id": event.get("id"), "Names": [f"/{name}"]}
+                    )
+                    self._snapshot[name] = c
+                if isinstance(c.attrs.get("State"), dict):
+                    c.attrs["State"]["Status"] = status[action]
+                else:
+                    c.attrs["State"] = status[action]
+
+
+inventories: dict[int, ContainerInventory] = {}
+
+
+def get_inventory(client=None) -> ContainerInventory:
+    client = client if client else get_docker_client()
+    if id(client) not in inventories:
+        inventory = ContainerInventory(client)
+        watcher = get_event_watcher(client)
+        if watcher and watcher.client is client:
+            watcher.add_listener(inventory.on_event)
+        inventories[id(client)] = inventory
+    return inventories[id(client)]
@@ -0,0 +1,91 @@
+import shlex
+import threading
+from typing import TYPE_CHECKING, Iterable
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .processmanager import ProcessManager
+
+IPTABLES_SAVE_BIN = "/usr/sbin/iptables-save"
+IPTABLES_RESTORE_BIN = "/usr/sbin/iptables-restore"
+# IPTABLES_SAVE_BIN = "/usr/sbin/iptables-legacy-save"
+# IPTABLES_RESTORE_BIN = "/usr/sbin/iptables-legacy-restore"
+
+Rule = tuple[str, tuple[str, ...]]
+
+
+def normalize_spec(spec: Iterable[str]) -> tuple[str, ...]:
+    # iptables-save always prints addresses with a prefix length
+    spec = list(spec)
+    for i, arg in enumerate(spec[:-1]):
+        if arg in ("-s", "-d") and "/" not in spec[i + 1]:
+            spec[i + 1] += "/128" if ":" in spec[i + 1] else "/32"
+    return tuple(spec)
+
+
+def parse_save(output: str) -> set[Rule]:
+    rules = set()
+    for line in output.splitlines():
+        if line.startswith("-A "):
+            args = shlex.split(line)
+            rules.add((args[1], normalize_spec(args[2:])))
+    return rules
+
+
+class IptablesBatch:
+    """Collects rules per table and applies them with one restore per table.
+
+    Rules that are already present in the namespace are skipped, so adding
+    the same rule twice does not create duplicates.
+    """
+
+    def __init__(self, pm: "ProcessManager"):
+        self.pm = pm
+        self.lock = threading.Lock()
+        self.rules: dict[str, list[Rule]] = {}
+
+    def add(
+        self, chain: str, spec: Iterable[str], table: str = "filter"
+    ) -> None:
+        rule = (chain, normalize_spec(spec))
+        with self.lock:
+            rules = self.rules.setdefault(table, [])
+            if rule not in rules:
+                rules.append(rule)
+
+    def existing(self, table: str) -> set[Rule]:
+        res = self.pm.exec_in_ns(
+            [IPTABLES_SAVE_BIN, "-t", table], capture_output=True
+        )
+        if res.returncode:
+            return set()
+        return parse_save(res.stdout.decode(errors="replace"))
+
+    @staticmethod
+    def restore_payload(table: str, rules: Iterable[Rule]) -> str:
+        lines = [f"*{table}"]
+        for chain, spec in rules:
+            lines.append(shlex.join(["-I", chain, *spec]))
+        lines.append("COMMIT")
+        return "\n".join(lines) + "\n"
+
+    def commit(self) -> int:
+        with self.lock:
+            pending, self.rules = self.rules, {}
+        rc = 0
+        for table, rules in pending.items():
+            present = self.existing(table)
+            missing = [r for r in rules if r not in present]
+            if not missing:
+                continue
+            res = self.pm.exec_in_ns(
+                [IPTABLES_RESTORE_BIN, "--noflush"],
+                capture_output=True,
+                input=self.restore_payload(table, missing).encode(),
+            )
+            if res.returncode:
+                print(
+                    f"[{self.pm.name}] iptables-restore failed for table "
+                    f"{table}: {res.stderr.decode(errors='replace').strip()}"
+                )
+                rc = res.returncode
+        return rc
@@ -0,0 +1,211 @@
+import ipaddress
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+from . import processmanager
+from .processmanager import ProcessManager
+
+# Prefix of generated interface names, followed by a per-container number
+INTF_PREFIX = "veth"
+# Longest interface name the kernel accepts
+MAX_INTF_LEN = 15
+# Lines per `ip -batch` run
+BATCH_SIZE = 1000
+# Namespaces configured in parallel
+LINK_WORKERS = 8
+
+
+class Link:
+    """veth pair between the network namespaces of two containers."""
+
+    def __init__(
+        self,
+        a: ProcessManager,
+        b: ProcessManager,
+        a_intf: str,
+        b_intf: str,
+        a_address: Optional[str] = None,
+        b_address: Optional[str] = None,
+    ):
+        for intf in (a_intf, b_intf):
+            if len(intf) > MAX_INTF_LEN:
+                raise ValueError(f"Interface name '{intf}' is too long")
+        self.a = a
+        self.b = b
+        self.a_intf = a_intf
+        self.b_intf = b_intf
+        self.a_address = a_address
+        self.b_address = b_address
+        self.created = False
+
+    def __repr__(self) -> str:
+        a = f"{self.a.name}:{self.a_intf}"
+        b = f"{self.b.name}:{self.b_intf}"
+        return f"Link({a} <-> {b})"
+
+    def ends(self) -> Iterator[tuple[ProcessManager, str, Optional[str]]]:
+        yield self.a, self.a_intf, self.a_address
+        yield self.b, self.b_intf, self.b_address
+
+
+class LinkManager:
+    """Wires containers together with veth pairs, in bulk.
+
+    All pairs are created by a single `ip -batch` in the host namespace,
+    which puts both ends straight into the container namespaces. Addresses
+    and link state are then set with one `ip -batch` per namespace.
+
+    With `subnet` given, links without addresses get a /31 (/127) from it.
+    """
+
+    def __init__(
+        self,
+        host: Optional[ProcessManager] = None,
+        subnet: Optional[str] = None,
+    ):
+        self.host = host if host else ProcessManager("host", pid=1)
+        self.lock = threading.Lock()
+        self.links: list[Link] = []
+        self._subnets = (
+            ipaddress.ip_network(subnet).subnets(
+                new_prefix=ipaddress.ip_network(subnet).max_prefixlen - 1
+            )
+            if subnet
+            else None
+        )
+        # container name -> number of the next generated interface
+        self._intfs: dict[str, itertools.count] = {}
+
+    def _intf(self, c: ProcessManager) -> str:
+        counter = self._intfs.setdefault(c.name, itertools.count())
+        return f"{INTF_PREFIX}{next(counter)}"
+
+    def add(
+        self,
+        a: ProcessManager,
+        b: ProcessManager,
+        a_intf: Optional[str] = None,
+        b_intf: Optional[str] = None,
+        a_address: Optional[str] = None,
+        b_address: Optional[str] = None,
+    ) -> Link:
+        with self.lock:
+            if a_address is None and b_address is None and self._subnets:
+                net = next(self._subnets)
+                a_address, b_address = (
+                    f"{ip}/{net.prefixlen}" for ip in net  # type: ignore
+                )
+            link = Link(
+                a,
+                b,
+                a_intf if a_intf else self._intf(a),
+                b_intf if b_intf else self._intf(b),
+                a_address,
+                b_address,
+            )
+            self.links.append(link)
+        return link
+
+    @staticmethod
+    def _batch(pm: ProcessManager, lines: list[str], **kwargs) -> int:
+        rc = 0
+        for i in range(0, len(lines), BATCH_SIZE):
+            payload = "\n".join(lines[i : i + BATCH_SIZE]) + "\n"  # noqa: E203
+            res = pm.nsenter(
+                [processmanager.IP_BIN, "-force", "-batch", "-"],
+                net=True,
+                capture_output=True,
+                input=payload.encode(),
+                **kwargs,
+            )
+            if res.returncode:
+                for line in res.stderr.decode(errors="replace").splitlines():
+                    if not line.startswith("Command failed"):
+                        print(f"[{pm.name}] ip -batch: {line}")
+                rc = res.returncode
+        return rc
+
+    def create(self, links: Optional[list[Link]] = None) -> int:
+        """Create the pending links of which both containers are running.
+
+        Returns the number of links created.
+        """
+        with self.lock:
+            pending = [
+                link
+                for link in (links if links is not None else self.links)
+                if not link.created and link.a.pid and link.b.pid
+            ]
+        if not pending:
+            return 0
+        print(f"Creating {len(pending)} links...")
+        if self._batch(
+            self.host,
+            [
+                f"link add name {link.a_intf} netns {link.a.pid} type veth "
+                f"peer name {link.b_intf} netns {link.b.pid}"
+                for link in pending
+            ],
+        ):
+            # -force carried on past the failing lines, the rest exist
+            print("Creating links...NOK!")
+        # Addresses and link state, one batch per namespace
+        namespaces: dict[int, tuple[ProcessManager, list[str]]] = {}
+        for link in pending:
+            link.created = True
+            for c, intf, address in link.ends():
+                lines = namespaces.setdefault(c.pid, (c, []))[1]
+                if address:
+                    lines.append(f"addr add {address} dev {intf}")
+                lines.append(f"link set {intf} up")
+        with ThreadPoolExecutor(max_workers=LINK_WORKERS) as pool:
+            list(
+                pool.map(
+                    lambda item: self._batch(item[0], item[1]),
+                    namespaces.values(),
+                )
+            )
+        return len(pending)
+
+    def remove(self, containers: Optional[list[str]] = None) -> int:
+        """Delete the links of `containers` (all when None).
+
+        The links stay registered and are created again by the next
+        create() once both containers run. Deleting one end removes the
+        pair, links of which a container is gone already went with its
+        namespace.
+
+        Returns the number of links deleted.
+        """
+        with self.lock:
+            doomed = [
+                link
+                for link in self.links
+                if link.created
+                and (
+                    containers is None
+                    or link.a.name in containers
+                    or link.b.name in containers
+                )
+            ]
+            for link in doomed:
+                link.created = False
+        namespaces: dict[int, tuple[ProcessManager, list[str]]] = {}
+        for link in doomed:
+            for c, intf, _ in link.ends():
+                if c.pid:
+                    lines = namespaces.setdefault(c.pid, (c, []))[1]
+                    lines.append(f"link del {intf}")
+                    break
+        if namespaces:
+            print(f"Removing {len(doomed)} links...")
+            with ThreadPoolExecutor(max_workers=LINK_WORKERS) as pool:
+                list(
+                    pool.map(
+                        lambda item: self._batch(item[0], item[1]),
+                        namespaces.values(),
+                    )
+                )
+        return len(doomed)
@@ -0,0 +1,397 @@
+import collections
+import json
+import re
+import selectors
+import socket
+import struct
+import sys
+import threading
+from typing import TYPE_CHECKING, Optional, TextIO
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .containermanager import ContainerManager
+    from .logstore import LogStore
+
+MAX_QUEUE = 10000
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 0.1
+READ_SIZE = 65536
+STREAM_HEADER = struct.Struct(">BxxxL")
+
+
+class LogStreamParser:
+    """Incremental decoder for a Docker `/containers/{id}/logs` response.
+
+    Handles the HTTP response head, chunked transfer encoding and (for
+    containers without a TTY) the multiplexed stdout/stderr framing, and
+    yields complete lines. The body of an error response is kept as the
+    error instead.
+    """
+
+    def __init__(self, tty: bool = False):
+        self.tty = tty
+        self.head = b""
+        self.headers_done = False
+        self.status = 0
+        self.chunked = False
+        self.length: Optional[int] = None
+        self.error_body = b""
+        self.chunk_left = 0
+        self.chunk_state = "size"
+        self.body = b""
+        self.frames = b""
+        self.partial = b""
+
+    def feed(self, data: bytes) -> list[bytes]:
+        if not self.headers_done:
+            self.head += data
+            if b"\r\n\r\n" not in self.head:
+                return []
+            head, data = self.head.split(b"\r\n\r\n", 1)
+            self.head = b""
+            self.headers_done = True
+            lines = head.split(b"\r\n")
+            self.status = int(lines[0].split()[1])
+            for line in lines[1:]:
+                key, _, value = line.partition(b":")
+                key = key.strip().lower()
+                if key == b"transfer-encoding":
+                    self.chunked = b"chunked" in value.lower()
+                elif key == b"content-length":
+                    self.length = int(value)
+        payload = self._dechunk(data) if self.chunked else data
+        if self.failed:
+            # Not log frames but the message of the daemon
+            self.error_body += payload
+            return []
+        return self._lines(self._deframe(payload))
+
+    @property
+    def failed(self) -> bool:
+        return self.headers_done and not 200 <= self.status < 300
+
+    @property
+    def complete(self) -> bool:
+        """The whole body was read, as far as its length is known."""
+        if self.chunked:
+            return self.chunk_state == "end"
+        return self.length is not None and len(self.error_body) >= self.length
+
+    @property
+    def error(self) -> str:
+        try:
+            message = json.loads(self.error_body)["message"]
+        except (ValueError, KeyError, TypeError):
+            message = self.error_body.decode(errors="replace").strip()
+        return f"{self.status} {message}".strip()
+
+    def _dechunk(self, data: bytes) -> bytes:
+        self.body += data
+        out = b""
+        while self.body:
+            if self.chunk_state == "size":
+                if b"\r\n" not in self.body:
+                    break
+                size, self.body = self.body.split(b"\r\n", 1)
+                self.chunk_left = int(size.split(b";")[0] or b"0", 16)
+                self.chunk_state = "data" if self.chunk_left else "end"
+            elif self.chunk_state == "data":
+                take = self.body[: self.chunk_left]
+                self.body = self.body[len(take) :]  # noqa: E203
+                self.chunk_left -= len(take)
+                out += take
+                if not self.chunk_left:
+                    self.chunk_state = "crlf"
+            elif self.chunk_state == "crlf":
+                if len(self.body) < 2:
+                    break
+                self.body = self.body[2:]
+                self.chunk_state = "size"
+            else:
+                self.body = b""
+        return out
+
+    def _deframe(self, data: bytes) -> bytes:
+        if self.tty:
+            return data
+        self.frames += data
+        out = b""
+        while len(self.frames) >= STREAM_HEADER.size:
+            _, length = STREAM_HEADER.unpack_from(self.frames)
+            end = STREAM_HEADER.size + length
+            if len(self.frames) < end:
+                break
+            out += self.frames[STREAM_HEADER.size : end]  # noqa: E203
+            self.frames = self.frames[end:]
+        return out
+
+    def _lines(self, data: bytes) -> list[bytes]:
+        data = self.partial + data
+        *lines, self.partial = data.split(b"\n")
+        return lines
+
+    def flush(self) -> list[bytes]:
+        partial, self.partial = self.partial, b""
+        return [partial] if partial else []
+
+
+class _Stream:
+    def __init__(self, name: str, sock: socket.socket, tty: bool):
+        self.name = name
+        self.sock = sock
+        self.parser = LogStreamParser(tty=tty)
+        self.ended = False
+
+
+class LogMultiplexer:
+    """Single pump for the log streams of all attached containers.
+
+    One selector thread reads every stream and one writer thread prints the
+    lines in batches. The line queue is bounded: when it is full the oldest
+    lines are dropped and the number of dropped lines is reported per
+    container, so a chatty container can never stall the orchestration.
+
+    With a `store` the lines are also kept in its per-container rings,
+    `echo=False` then skips printing them.
+    """
+
+    def __init__(
+        self,
+        max_queue: int = MAX_QUEUE,
+        batch_size: int = BATCH_SIZE,
+        flush_interval: float = FLUSH_INTERVAL,
+        output: Optional[TextIO] = None,
+        timestamps: bool = True,
+        store: Optional["LogStore"] = None,
+        echo: bool = True,
+    ):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.output = output if output else sys.stdout
+        self.timestamps = timestamps
+        self.store = store
+        self.echo = echo
+        self.queue: collections.deque = collections.deque()
+        # container name -> (pattern, event) of lines waited for
+        self.watches: dict[str, list[tuple[re.Pattern, threading.Event]]] = {}
+        self.dropped: collections.Counter = collections.Counter()
+        self.cond = threading.Condition()
+        self.selector = selectors.DefaultSelector()
+        self._pending: list[_Stream] = []
+        # Streams to end without a message, see detach()
+        self._detached: list[_Stream] = []
+        # container name -> its current stream
+        self._streams: dict[str, _Stream] = {}
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._closing = False
+        # The pump and writer threads only run while streams are attached
+        self._running = False
+        self._generation = 0
+        self._pump: Optional[threading.Thread] = None
+        self._writer: Optional[threading.Thread] = None
+
+    def attach(
+        self, container: "ContainerManager", since: Optional[int] = None
+    ) -> bool:
+        """Start following the logs of `container`, from `since` if given.
+
+        Returns False when the stream can't be multiplexed (e.g. the daemon
+        is not reached over a unix socket), the caller should then fall back
+        to a logging thread.
+        """
+        api = container.client.api
+        socket_path = getattr(
+            getattr(api, "_custom_adapter", None), "socket_path", None
+        )
+        if not socket_path or self._closing:
+            return False
+        c = container._container
+        tty = bool(c.attrs.get("Config", {}).get("Tty", False))
+        timestamps = 1 if self.timestamps else 0
+        request = (
+            f"GET /v{api._version}/containers/{c.id}/logs?follow=1&stdout=1"
+            f"&stderr=1&timestamps={timestamps}"
+            f"{f'&since={since}' if since else ''} HTTP/1.1\r\n"
+            "Host: docker\r\nConnection: close\r\n\r\n"
+        )
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(socket_path)
+            sock.sendall(request.encode())
+        except OSError:
+            return False
+        sock.setblocking(False)
+        stream = _Stream(container.name, sock, tty)
+        with self.cond:
+            self._pending.append(stream)
+            self._streams[container.name] = stream
+            if not self._running:
+                self._running = True
+                self._generation += 1
+                self._pump = threading.Thread(
+                    target=self._run_pump, daemon=True
+                )
+                self._writer = threading.Thread(
+                    target=self._run_writer,
+                    args=(self._generation,),
+                    daemon=True,
+                )
+                self._pump.start()
+                self._writer.start()
+        self._wakeup_w.send(b"\0")
+        return True
+
+    def detach(self, name: str) -> None:
+        """Stop following the logs of `name` while the container lives on."""
+        with self.cond:
+            stream = self._streams.pop(name, None)
+            if stream is None:
+                return
+            if stream in self._pending:
+                self._pending.remove(stream)
+                stream.sock.close()
+                return
+            self._detached.append(stream)
+        self._wakeup_w.send(b"\0")
+
+    def watch(self, name: str, pattern: re.Pattern) -> threading.Event:
+        """Event set once a log line of `name` matches `pattern` (bytes)."""
+        event = threading.Event()
+        with self.cond:
+            self.watches.setdefault(name, []).append((pattern, event))
+        return event
+
+    def match(self, name: str, lines: list[bytes]) -> None:
+        with self.cond:
+            watches = self.watches.get(name)
+            if not watches:
+                return
+            for line in lines:
+                for pattern, event in watches:
+                    if pattern.search(line):
+                        event.set()
+            watches[:] = [w for w in watches if not w[1].is_set()]
+
+    def _put(self, name: str, lines: list[bytes]) -> None:
+        with self.cond:
+            for line in lines:
+                if len(self.queue) >= self.max_queue:
+                    dropped_name, _ = self.queue.popleft()
+                    self.dropped[dropped_name] += 1
+                self.queue.append((name, line))
+            self.cond.notify()
+
+    def _run_pump(self) -> None:
+        while True:
+            for key, _ in self.selector.select():
+                if key.data is None:
+                    try:
+                        self._wakeup_r.recv(READ_SIZE)
+                    except BlockingIOError:
+                        pass
+                    continue
+                stream = key.data
+                try:
+                    data = stream.sock.recv(READ_SIZE)
+                except BlockingIOError:
+                    continue
+                except OSError:
+                    data = b""
+                if data:
+                    lines = stream.parser.feed(data)
+                    if not stream.parser.failed:
+                        self._put(stream.name, lines)
+                    elif stream.parser.complete:
+                        self._end(stream)
+                else:
+                    self._end(stream)
+            with self.cond:
+                detached, self._detached = self._detached, []
+            for stream in detached:
+                if not stream.ended:
+                    self._end(stream, interrupted=False)
+            with self.cond:
+                pending, self._pending = self._pending, []
+                # Only the wakeup socket left: all containers stopped
+                idle = not pending and len(self.selector.get_map()) == 1
+                closing = self._closing
+                if closing or idle:
+                    self._running = False
+                    self.cond.notify_all()
+                    break
+            for stream in pending:
+                self.selector.register(
+                    stream.sock, selectors.EVENT_READ, stream
+                )
+        if not closing:
+            return
+        for key in list(self.selector.get_map().values()):
+            if key.data is not None:
+                self._end(key.data, interrupted=False)
+
+    def _end(self, stream: _Stream, interrupted: bool = True) -> None:
+        self.selector.unregister(stream.sock)
+        stream.sock.close()
+        stream.ended = True
+        with self.cond:
+            if self._streams.get(stream.name) is stream:
+                del self._streams[stream.name]
+        lines = stream.parser.flush()
+        if stream.parser.failed:
+            error = stream.parser.error
+            lines = [f"!!! Logging failed: {error} !!!".encode()]
+        elif interrupted:
+            lines.append(b"!!! Logging interrupted. Container stopped? !!!")
+        self._put(stream.name, lines)
+
+    def _run_writer(self, generation: int) -> None:
+        while True:
+            with self.cond:
+                if not self.queue:
+                    self.cond.wait(self.flush_interval)
+                batch = [
+                    self.queue.popleft()
+                    for _ in range(min(self.batch_size, len(self.queue)))
+                ]
+                dropped, self.dropped = self.dropped, collections.Counter()
+                done = not self._running and not self.queue
+                # A new writer takes over once streams are attached again
+                done = done or generation != self._generation
+            lines: dict[str, list[bytes]] = {}
+            for name, line in batch:
+                lines.setdefault(name, []).append(line.rstrip(b"\r"))
+            for name, container_lines in lines.items():
+                if self.watches:
+                    self.match(name, container_lines)
+                if self.store:
+                    self.store.write(name, container_lines)
+            out = [
+                f"[{name}] !!! {count} log lines dropped !!!\n"
+                for name, count in dropped.items()
+            ]
+            if self.echo:
+                out += [
+                    f"[{name}] "
+                    f"{line.decode(errors='replace').rstrip(chr(13))}\n"
+                    for name, line in batch
+                ]
+            if out:
+                self.output.write("".join(out))
+                self.output.flush()
+            if done:
+                break
+
+    def close(self, timeout: Optional[float] = 5) -> None:
+        with self.cond:
+            self._closing = True
+            pump, writer = self._pump, self._writer
+        self._wakeup_w.send(b"\0")
+        for thread in (pump, writer):
+            if thread:
+                thread.join(timeout)
+        self.selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
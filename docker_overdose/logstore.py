@@ -0,0 +1,259 @@
+import bisect
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from typing import Optional
+
+# Directory with one ring file per container
+DEFAULT_DIR = ".docker-overdose-logs"
+# Bytes of log lines kept per container
+DEFAULT_SIZE = 8 * 1024 * 1024
+# Average line length the index is sized for
+AVG_LINE = 64
+MAGIC = b"ODLOG001"
+# magic, data size, index slots, next sequence number, write position
+HEADER = struct.Struct("<8sQQQQ")
+# timestamp, write position of the line, line length
+ENTRY = struct.Struct("<dQI")
+
+
+class LogRing:
+    """Bounded log of one container in a memory-mapped file.
+
+    The file holds a header, a ring of index entries (timestamp, offset and
+    length per line) and a ring of line data. Positions grow monotonically
+    and are taken modulo the ring size, a line never wraps around the end of
+    the data ring. The oldest lines are overwritten once either ring is
+    full, so the file never grows.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int = DEFAULT_SIZE,
+        slots: Optional[int] = None,
+        readonly: bool = False,
+    ):
+        self.path = path
+        self.lock = threading.Lock()
+        self.readonly = readonly
+        slots = slots if slots else max(1, size // AVG_LINE)
+        fd = os.open(path, os.O_RDONLY if readonly else os.O_RDWR | os.O_CREAT)
+        try:
+            header = os.pread(fd, HEADER.size, 0)
+            if len(header) == HEADER.size and header.startswith(MAGIC):
+                _, file_size, file_slots, seq, pos = HEADER.unpack(header)
+            else:
+                file_size = file_slots = seq = pos = 0
+            if readonly:
+                if not file_size:
+                    raise ValueError(f"{path} is not a log ring")
+                size, slots = file_size, file_slots
+            elif (file_size, file_slots) != (size, slots):
+                # Other geometry: start over
+                seq = pos = 0
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, HEADER.size + slots * ENTRY.size + size)
+            self.mm = mmap.mmap(
+                fd,
+                0,
+                access=mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE,
+            )
+        finally:
+            os.close(fd)
+        self.size = size
+        self.slots = slots
+        self.seq = seq
+        self.pos = pos
+        self.data_offset = HEADER.size + slots * ENTRY.size
+        if not readonly:
+            self._sync()
+
+    @classmethod
+    def open(cls, path: str) -> "LogRing":
+        """Read-only view of a ring, e.g. after the run ended."""
+        return cls(path, readonly=True)
+
+    def _sync(self) -> None:
+        HEADER.pack_into(
+            self.mm, 0, MAGIC, self.size, self.slots, self.seq, self.pos
+        )
+
+    def _refresh(self) -> None:
+        # A reader follows the writer through the header
+        if self.readonly:
+            _, _, _, self.seq, self.pos = HEADER.unpack_from(self.mm, 0)
+
+    def append(self, lines: list[bytes], ts: Optional[float] = None) -> None:
+        if self.readonly:
+            raise ValueError(f"{self.path} is opened read-only")
+        ts = ts if ts is not None else time.time()
+        with self.lock:
+            for line in lines:
+                line = line[: self.size]
+                n = len(line)
+                offset = self.pos % self.size
+                if offset + n > self.size:
+                    # Skip the tail of the ring rather than split the line
+                    self.pos += self.size - offset
+                    offset = 0
+                start = self.data_offset + offset
+                self.mm[start : start + n] = line  # noqa: E203
+                ENTRY.pack_into(
+                    self.mm,
+                    HEADER.size + self.seq % self.slots * ENTRY.size,
+                    ts,
+                    self.pos,
+                    n,
+                )
+                self.pos += n
+                self.seq += 1
+            self._sync()
+
+    def _entry(self, seq: int) -> tuple[float, int, int]:
+        return ENTRY.unpack_from(
+            self.mm, HEADER.size + seq % self.slots * ENTRY.size
+        )
+
+    def _line(self, pos: int, n: int) -> bytes:
+        start = self.data_offset + pos % self.size
+        return self.mm[start : start + n]  # noqa: E203
+
+    def _window(self) -> range:
+        # Sequence numbers of the lines still in both rings
+        self._refresh()
+        seqs = range(max(0, self.seq - self.slots), self.seq)
+        oldest = self.pos - self.size
+        first = bisect.bisect_left(
+            seqs, oldest, key=lambda s: self._entry(s)[1]
+        )
+        return seqs[first:]
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self._window())
+
+    def _read(self, seqs: range) -> list[tuple[float, str]]:
+        out = []
+        for s in seqs:
+            ts, pos, n = self._entry(s)
+            out.append((ts, self._line(pos, n).decode(errors="replace")))
+        return out
+
+    def tail(self, n: int = 10) -> list[tuple[float, str]]:
+        """Last `n` lines as (timestamp, line)."""
+        with self.lock:
+            window = self._window()
+            return self._read(window[max(0, len(window) - n) :])  # noqa: E203
+
+    def _between(
+        self, window: range, start: Optional[float], end: Optional[float]
+    ) -> range:
+        def key(s):
+            return self._entry(s)[0]
+
+        lo = bisect.bisect_left(window, start, key=key) if start else 0
+        hi = bisect.bisect_right(window, end, key=key) if end else None
+        return window[lo:hi]
+
+    def between(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> list[tuple[float, str]]:
+        """Lines logged from `start` up to `end` (epoch seconds)."""
+        with self.lock:
+            return self._read(self._between(self._window(), start, end))
+
+    def search(
+        self,
+        pattern: str,
+        regex: bool = False,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> list[tuple[float, str]]:
+        """Lines containing `pattern`, a regular expression if `regex`."""
+        needle = pattern.encode()
+        compiled = re.compile(needle) if regex else None
+        out = []
+        with self.lock:
+            for s in self._between(self._window(), start, end):
+                ts, pos, n = self._entry(s)
+                line = self._line(pos, n)
+                if compiled.search(line) if compiled else needle in line:
+                    out.append((ts, line.decode(errors="replace")))
+                    if limit and len(out) >= limit:
+                        break
+        return out
+
+    def close(self) -> None:
+        with self.lock:
+            if not self.mm.closed:
+                if not self.readonly:
+                    self.mm.flush()
+                self.mm.close()
+
+
+class LogStore:
+    """Log rings of all containers, one file each in `directory`."""
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_DIR,
+        size: int = DEFAULT_SIZE,
+        slots: Optional[int] = None,
+    ):
+        self.directory = directory
+        self.size = size
+        self.slots = slots
+        self.lock = threading.Lock()
+        self._rings: dict[str, LogRing] = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.log")
+
+    def ring(self, name: str) -> LogRing:
+        with self.lock:
+            ring = self._rings.get(name)
+            if ring is None:
+                ring = self._rings[name] = LogRing(
+                    self.path(name), self.size, self.slots
+                )
+            return ring
+
+    def write(
+        self, name: str, lines: list[bytes], ts: Optional[float] = None
+    ) -> None:
+        self.ring(name).append(lines, ts)
+
+    def names(self) -> list[str]:
+        return sorted(
+            f.removesuffix(".log")
+            for f in os.listdir(self.directory)
+            if f.endswith(".log")
+        )
+
+    def tail(self, name: str, n: int = 10) -> list[tuple[float, str]]:
+        return self.ring(name).tail(n)
+
+    def between(
+        self,
+        name: str,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+    ) -> list[tuple[float, str]]:
+        return self.ring(name).between(start, end)
+
+    def search(
+        self, name: str, pattern: str, **kwargs
+    ) -> list[tuple[float, str]]:
+        return self.ring(name).search(pattern, **kwargs)
+
+    def close(self) -> None:
+        with self.lock:
+            rings, self._rings = list(self._rings.values()), {}
+        for ring in rings:
+            ring.close()
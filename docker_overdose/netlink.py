@@ -0,0 +1,283 @@
+import ctypes
+import ipaddress
+import os
+import queue
+import socket
+import struct
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+CLONE_NEWNET = 0x40000000
+
+NETLINK_ROUTE = 0
+NLMSG_ERROR = 2
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+
+RTM_NEWLINK = 16
+RTM_NEWADDR = 20
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+
+IFF_UP = 0x1
+IFLA_IFNAME = 3
+IFLA_LINK = 5
+IFLA_LINKINFO = 18
+IFLA_NET_NS_PID = 19
+IFLA_INFO_KIND = 1
+IFLA_INFO_DATA = 2
+IFLA_VLAN_ID = 1
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+RTA_DST = 1
+RTA_GATEWAY = 5
+RT_TABLE_MAIN = 254
+RTPROT_BOOT = 3
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_NOWHERE = 255
+RTN_UNICAST = 1
+
+NLMSGHDR = struct.Struct("=LHHLL")
+IFINFOMSG = struct.Struct("=BxHiII")
+IFADDRMSG = struct.Struct("=BBBBI")
+RTMSG = struct.Struct("=BBBBBBBBI")
+RTATTR = struct.Struct("=HH")
+
+
+def setns(fd: int, nstype: int = 0) -> None:
+    if hasattr(os, "setns"):
+        os.setns(fd, nstype)
+        return
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.setns(fd, nstype) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+
+def _attr(type_: int, data: bytes) -> bytes:
+    length = RTATTR.size + len(data)
+    pad = b"\0" * ((4 - length % 4) % 4)
+    return RTATTR.pack(length, type_) + data + pad
+
+
+def _str_attr(type_: int, value: str) -> bytes:
+    return _attr(type_, value.encode() + b"\0")
+
+
+class RtNetlink:
+    """Minimal rtnetlink client for the namespace the calling thread is in."""
+
+    def __init__(self):
+        self.sock = socket.socket(
+            socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE
+        )
+        self.sock.bind((0, 0))
+        self.seq = 0
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def request(self, msg_type: int, payload: bytes, flags: int = 0) -> None:
+        self.seq += 1
+        header = NLMSGHDR.pack(
+            NLMSGHDR.size + len(payload),
+            msg_type,
+            NLM_F_REQUEST | NLM_F_ACK | flags,
+            self.seq,
+            0,
+        )
+        self.sock.send(header + payload)
+        while True:
+            data = self.sock.recv(65536)
+            offset = 0
+            while offset < len(data):
+                length, type_, _, seq, _ = NLMSGHDR.unpack_from(data, offset)
+                if type_ == NLMSG_ERROR and seq == self.seq:
+                    (error,) = struct.unpack_from(
+                        "=i", data, offset + NLMSGHDR.size
+                    )
+                    if error:
+                        raise OSError(-error, os.strerror(-error))
+                    return
+                offset += (length + 3) & ~3
+
+    def link_index(self, name: str) -> int:
+        # if_nametoindex uses a socket of the current thread's namespace
+        return socket.if_nametoindex(name)
+
+    def link_set(
+        self, name: str, flags: int = 0, change: int = 0, attrs: bytes = b""
+    ) -> None:
+        index = self.link_index(name)
+        payload = IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, flags, change)
+        self.request(RTM_NEWLINK, payload + attrs)
+
+    def link_up(self, name: str) -> None:
+        self.link_set(name, flags=IFF_UP, change=IFF_UP)
+
+    def link_to_netns(self, name: str, pid: int) -> None:
+        self.link_set(
+            name, attrs=_attr(IFLA_NET_NS_PID, struct.pack("=I", pid))
+        )
+
+    def vlan_add(self, link: str, name: str, vlanid: int) -> None:
+        info = _str_attr(IFLA_INFO_KIND, "vlan") + _attr(
+            IFLA_INFO_DATA, _attr(IFLA_VLAN_ID, struct.pack("=H", vlanid))
+        )
+        payload = IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0)
+        payload += _attr(IFLA_LINK, struct.pack("=I", self.link_index(link)))
+        payload += _str_attr(IFLA_IFNAME, name)
+        payload += _attr(IFLA_LINKINFO, info)
+        self.request(RTM_NEWLINK, payload, NLM_F_CREATE | NLM_F_EXCL)
+
+    def addr_add(self, name: str, address: str) -> None:
+        intf = ipaddress.ip_interface(address)
+        family = socket.AF_INET if intf.version == 4 else socket.AF_INET6
+        payload = IFADDRMSG.pack(
+            family,
+            intf.network.prefixlen,
+            0,
+            RT_SCOPE_UNIVERSE,
+            self.link_index(name),
+        )
+        payload += _attr(IFA_LOCAL, intf.ip.packed)
+        payload += _attr(IFA_ADDRESS, intf.ip.packed)
+        self.request(RTM_NEWADDR, payload, NLM_F_CREATE | NLM_F_EXCL)
+
+    def _route(self, subnet: str, via: Optional[str] = None):
+        if subnet == "default":
+            gw = ipaddress.ip_address(via) if via else None
+            network = ipaddress.ip_network(
+                "::/0" if gw and gw.version == 6 else "0.0.0.0/0"
+            )
+        else:
+            network = ipaddress.ip_network(subnet, strict=False)
+        family = socket.AF_INET if network.version == 4 else socket.AF_INET6
+        attrs = b""
+        if network.prefixlen:
+            attrs += _attr(RTA_DST, network.network_address.packed)
+        if via:
+            attrs += _attr(RTA_GATEWAY, ipaddress.ip_address(via).packed)
+        return family, network.prefixlen, attrs
+
+    def route_add(self, subnet: str, via: str) -> None:
+        family, prefixlen, attrs = self._route(subnet, via)
+        payload = RTMSG.pack(
+            family,
+            prefixlen,
+            0,
+            0,
+            RT_TABLE_MAIN,
+            RTPROT_BOOT,
+            RT_SCOPE_UNIVERSE,
+            RTN_UNICAST,
+            0,
+        )
+        self.request(RTM_NEWROUTE, payload + attrs, NLM_F_CREATE | NLM_F_EXCL)
+
+    def route_del(self, subnet: str, via: Optional[str] = None) -> None:
+        family, prefixlen, attrs = self._route(subnet, via)
+        payload = RTMSG.pack(
+            family,
+            prefixlen,
+            0,
+            0,
+            RT_TABLE_MAIN,
+            0,
+            RT_SCOPE_NOWHERE,
+            RTN_UNICAST,
+            0,
+        )
+        self.request(RTM_DELROUTE, payload + attrs)
+
+
+class NetnsWorker:
+    """Thread living in the network namespace of `pid`.
+
+    setns() only switches the calling thread, so every rtnetlink request for
+    a namespace is executed by its own worker thread without any child
+    process.
+    """
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self._jobs: queue.Queue = queue.Queue()
+        self._ready: Future = Future()
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+        # Raises if entering the namespace failed
+        self._ready.result()
+
+    def _work(self) -> None:
+        try:
+            fd = os.open(f"/proc/{self.pid}/ns/net", os.O_RDONLY)
+            try:
+                setns(fd, CLONE_NEWNET)
+            finally:
+                os.close(fd)
+            nl = RtNetlink()
+        except Exception as e:
+            self._ready.set_exception(e)
+            return
+        self._ready.set_result(True)
+        try:
+            while True:
+                job = self._jobs.get()
+                if job is None:
+                    break
+                future, func, args = job
+                try:
+                    future.set_result(func(nl, *args))
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            nl.close()
+
+    def call(self, func: Callable, *args):
+        future: Future = Future()
+        self._jobs.put((future, func, args))
+        return future.result()
+
+    def close(self) -> None:
+        self._jobs.put(None)
+
+    def link_up(self, name: str) -> None:
+        self.call(RtNetlink.link_up, name)
+
+    def link_to_netns(self, name: str, pid: int) -> None:
+        self.call(RtNetlink.link_to_netns, name, pid)
+
+    def vlan_add(self, link: str, name: str, vlanid: int) -> None:
+        self.call(RtNetlink.vlan_add, link, name, vlanid)
+
+    def addr_add(self, name: str, address: str) -> None:
+        self.call(RtNetlink.addr_add, name, address)
+
+    def route_add(self, subnet: str, via: str) -> None:
+        self.call(RtNetlink.route_add, subnet, via)
+
+    def route_del(self, subnet: str, via: Optional[str] = None) -> None:
+        self.call(RtNetlink.route_del, subnet, via)
+
+
+_workers: dict[int, NetnsWorker] = {}
+_workers_lock = threading.Lock()
+
+
+def get_netns_worker(pid: int) -> NetnsWorker:
+    with _workers_lock:
+        if pid not in _workers:
+            _workers[pid] = NetnsWorker(pid)
+        return _workers[pid]
+
+
+def close_netns_worker(pid: int) -> None:
+    with _workers_lock:
+        worker = _workers.pop(pid, None)
+    if worker:
+        worker.close()
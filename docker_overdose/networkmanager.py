@@ -1,66 +1,190 @@
-import docker
 import atexit
-from .dockerclient import get_docker_client
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+from .dockerclient import get_endpoint_client
 from .processmanager import ProcessManager
 
+# Parallel API calls when removing networks together
+CLOSE_WORKERS = 8
+
+# NetworkManagers that still have to be closed at exit
+registry: list["NetworkManager"] = []
+registry_lock = threading.Lock()
+
 
 class NetworkManager:
-    def __init__(self, name, host=None, internal=True, isolate=False):
-        self.client = get_docker_client()
+    def __init__(
+        self,
+        name,
+        host=None,
+        internal=True,
+        isolate=False,
+        network=None,
+        lookup=True,
+        endpoint=None,
+    ):
+        # Docker networks are local to the engine of `endpoint`
+        self.endpoint = endpoint
+        self.client = get_endpoint_client(endpoint)
         if not host:
             self.host = ProcessManager("host", pid=1)
         else:
             self.host = host
         self.name = name
         self.by_overdose = False
-        if self._network is None:
+        # Cached network handle and IPAM config, see refresh()
+        self._net = network
+        self._ipam: Optional[dict] = None
+        if lookup and self._net is None:
+            self._net = self._get()
+        if self._net is None:
             self.create(internal)
             self.by_overdose = True
         if not isolate:
             self.remove_isolation()
-        atexit.register(self.close)
+        self.register(self)
+
+    @classmethod
+    def bulk(
+        cls,
+        names: Iterable[str],
+        host=None,
+        internal=True,
+        isolate=False,
+        endpoint=None,
+    ) -> list["NetworkManager"]:
+        """Look up or create many networks with a single list call."""
+        client = get_endpoint_client(endpoint)
+        if not host:
+            host = ProcessManager("host", pid=1)
+        names = list(names)
+        existing = {
+            n.name: n for n in client.networks.list() if n.name in names
+        }
+        with host.iptables_batch():
+            return [
+                cls(
+                    name,
+                    host=host,
+                    internal=internal,
+                    isolate=isolate,
+                    network=existing.get(name),
+                    lookup=False,
+                    endpoint=endpoint,
+                )
+                for name in names
+            ]
+
+    @staticmethod
+    def register(network: "NetworkManager") -> None:
+        with registry_lock:
+            if not registry:
+                atexit.register(NetworkManager.close_all)
+            registry.append(network)
+
+    @staticmethod
+    def unregister(network: "NetworkManager") -> None:
+        """Keep the network when the program exits."""
+        with registry_lock:
+            if network in registry:
+                registry.remove(network)
+
+    @staticmethod
+    def claim(names: Iterable[str]) -> list["NetworkManager"]:
+        """Take the networks called `names` out of the registry.
+
+        The caller closes them, once the containers it keeps attached to them
+        are gone.
+        """
+        names = set(names)
+        with registry_lock:
+            claimed = [n for n in registry if n.name in names]
+            registry[:] = [n for n in registry if n.name not in names]
+        return claimed
+
+    @staticmethod
+    def close_all(networks: Optional[Iterable["NetworkManager"]] = None):
+        with registry_lock:
+            if networks is None:
+                networks = list(registry)
+            networks = [n for n in networks if n.by_overdose and n._net]
+        if not networks:
+            return
+        try:
+            with ThreadPoolExecutor(max_workers=CLOSE_WORKERS) as pool:
+                list(pool.map(NetworkManager.close, networks))
+        except RuntimeError:
+            # No new threads at exit (atexit), one by one then
+            for network in networks:
+                network.close()
 
     def close(self):
-        if self.by_overdose and self._network:
-            self._network.remove()
+        if self.by_overdose and self._net:
+            import docker
+
+            try:
+                self._net.remove()
+            except docker.errors.NotFound:
+                pass
+            self._net = None
+        with registry_lock:
+            if self in registry:
+                registry.remove(self)
+
+    def _get(self):
+        import docker
 
-    @property
-    def _network(self):
         try:
             return self.client.networks.get(self.name)
         except docker.errors.NotFound:
             return None
 
+    @property
+    def _network(self):
+        if self._net is None:
+            self._net = self._get()
+        return self._net
+
+    def refresh(self):
+        self._net = self._get()
+        self._ipam = None
+        return self._net
+
     def create(self, internal):
-        self.client.networks.create(name=self.name, internal=internal)
+        self._net = self.client.networks.create(
+            name=self.name, internal=internal
+        )
+        self._ipam = None
 
     def remove_isolation(self):
         print(f"Removing isolation for network [{self.name}]...")
-        self.host.run_iptables(
-            ["-D", "DOCKER-USER", "-s", self.ipsubnet, "-j", "ACCEPT"]
-        )
-        self.host.run_iptables(
-            ["-D", "DOCKER-USER", "-d", self.ipsubnet, "-j", "ACCEPT"]
-        )
-        self.host.run_iptables(
-            ["-I", "DOCKER-USER", "-s", self.ipsubnet, "-j", "ACCEPT"]
-        )
-        self.host.run_iptables(
-            ["-I", "DOCKER-USER", "-d", self.ipsubnet, "-j", "ACCEPT"]
-        )
+        subnet = self.ipsubnet
+        with self.host.iptables_batch():
+            self.host.ensure_iptables_rule(
+                "DOCKER-USER", ["-s", subnet, "-j", "ACCEPT"]
+            )
+            self.host.ensure_iptables_rule(
+                "DOCKER-USER", ["-d", subnet, "-j", "ACCEPT"]
+            )
 
     @property
     def inspect(self):
         if self._network:
-            self._network.reload()
             return self._network.attrs
         else:
             return False
 
+    @property
+    def ipam(self):
+        if self._ipam is None:
+            self._ipam = self.inspect["IPAM"]["Config"][0]
+        return self._ipam
+
     @property
     def ipsubnet(self):
-        return self.inspect["IPAM"]["Config"][0]["Subnet"]
+        return self.ipam["Subnet"]
 
     @property
     def gateway(self):
-        return self.inspect["IPAM"]["Config"][0]["Gateway"]
+        return self.ipam["Gateway"]
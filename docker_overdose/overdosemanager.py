@@ -1,23 +1,195 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+from .dockerclient import get_endpoint_client
 from .processmanager import ProcessManager
+from .networkmanager import NetworkManager
+from .links import LinkManager
+from .logmux import LogMultiplexer
+from .placement import PlacementScheduler
+from .scheduler import DEFAULT_WORKERS, DependencyScheduler, ScheduleResult
+from .state import get_config_state
+
+# Seconds all containers together get to stop before they are killed
+STOP_TIMEOUT = 10
+# Concurrent pulls in the pre-flight stage
+PULL_WORKERS = 4
+
+
+def _image_ref(image: str) -> str:
+    # Local images are listed without the default registry and namespace
+    for prefix in ("docker.io/library/", "docker.io/"):
+        if image.startswith(prefix):
+            return image.removeprefix(prefix)
+    return image
 
 
 class OverdoseManager:
-    def __init__(self, host=None, containers={}, version="latest"):
+    def __init__(
+        self,
+        host=None,
+        containers={},
+        version="latest",
+        multiplex_logs=True,
+        pool=None,
+        link_subnet=None,
+        log_store=None,
+        echo_logs=True,
+    ):
         if not host:
             self.host = ProcessManager("host", pid=1)
         else:
             self.host = host
         self.containers = containers
         self.version = version
+        # Optional LogStore keeping the container logs for queries
+        self.log_store = log_store
+        self.logmux = (
+            LogMultiplexer(store=log_store, echo=echo_logs)
+            if multiplex_logs
+            else None
+        )
+        # Optional ContainerPool the containers are taken from
+        self.pool = pool
+        # veth pairs between containers, wired once both ends run
+        self.links = LinkManager(self.host, subnet=link_subnet)
 
     def add(self, container):
+        # Bad options fail here rather than halfway through a start
+        container.compile()
         if ":" not in container.image:
             container.image = f"{container.image}:{self.version}"
         self.containers[container.name] = container
         container.host = self.host
+        if container.logmux is None:
+            container.logmux = self.logmux
+        if container.pool is None:
+            container.pool = self.pool
+
+    def add_link(self, a, b, **kwargs):
+        """Connect containers `a` and `b` (names or managers) by a veth pair.
+
+        Keyword arguments are passed on to LinkManager.add(). Config that
+        needs the link belongs in the post options.
+        """
+        if isinstance(a, str):
+            a = self.containers[a]
+        if isinstance(b, str):
+            b = self.containers[b]
+        return self.links.add(a, b, **kwargs)
+
+    def pull_images(self, containers=None, workers=PULL_WORKERS):
+        """Pull the images of `containers` (all when None) missing locally.
+
+        Local images are listed once, the missing ones are pulled
+        concurrently. Returns image -> whether it is available.
+        """
+        import docker
+
+        if containers is None:
+            containers = list(self.containers)
+        elif isinstance(containers, str):
+            containers = [containers]
+        # Images are local to the engine of each endpoint
+        images: dict[Optional[str], set[str]] = {}
+        for n in containers:
+            c = self.containers[n]
+            images.setdefault(c.endpoint, set()).add(_image_ref(c.image))
+        available = {}
+        missing = []
+        for endpoint, refs in images.items():
+            client = get_endpoint_client(endpoint)
+            local = set()
+            # The low-level call, images.list() inspects every image as well
+            for i in client.api.images():
+                local.update(i.get("RepoTags") or [])
+                local.update(i.get("RepoDigests") or [])
+            available.update(dict.fromkeys(refs & local, True))
+            missing += [(client, endpoint, i) for i in sorted(refs - local)]
+        if not missing:
+            return available
+        print(f"Pulling {len(missing)} images...")
+
+        def pull(client, image):
+            repo, _, tag = image.rpartition(":")
+            if "@" in image or not repo or "/" in tag:
+                repo, tag = image, None
+            client.api.pull(repo, tag=tag)
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {
+                pool.submit(pull, client, i): (endpoint, i)
+                for client, endpoint, i in missing
+            }
+            for done, f in enumerate(as_completed(futures), 1):
+                endpoint, image = futures[f]
+                where = f" on {endpoint}" if endpoint else ""
+                print(
+                    f"[{done}/{len(missing)}] Pull {image}{where}...", end=""
+                )
+                try:
+                    f.result()
+                    ok = True
+                    print("OK")
+                except docker.errors.APIError as e:
+                    ok = False
+                    print(f"{e} NOK!")
+                # Available only if it is on every endpoint
+                available[image] = available.get(image, True) and ok
+        return available
+
+    def place(self, endpoints, strategy="count"):
+        """Spread the containers over several docker endpoints.
+
+        `endpoints` lists socket paths or URLs, or maps them to their
+        capacity, see PlacementScheduler. Returns the endpoint per
+        container.
+        """
+        links = [(link.a.name, link.b.name) for link in self.links.links]
+        return PlacementScheduler(endpoints, strategy).apply(
+            self.containers.values(), links
+        )
+
+    def _run_per_endpoint(self, names, func, workers) -> ScheduleResult:
+        # Every endpoint gets its own scheduler and workers, unless
+        # dependencies cross endpoints
+        graph: dict = self.dependency_graph(names)
+        partitions: dict = {}
+        for n in names:
+            partitions.setdefault(self.containers[n].endpoint, []).append(n)
+        crossing = any(
+            self.containers[d].endpoint != self.containers[n].endpoint
+            for n, deps in graph.items()
+            for d in deps
+            if d in graph
+        )
+        if len(partitions) < 2 or crossing:
+            return DependencyScheduler(graph, workers=workers).run(func)
+        schedulers = [
+            DependencyScheduler({n: graph[n] for n in part}, workers=workers)
+            for part in partitions.values()
+        ]
+        result = ScheduleResult()
+        with ThreadPoolExecutor(max_workers=len(schedulers)) as pool:
+            for r in pool.map(lambda s: s.run(func), schedulers):
+                result.succeeded += r.succeeded
+                result.failed.update(r.failed)
+                result.skipped.update(r.skipped)
+        return result
+
+    def dependency_graph(self, names) -> dict[str, set[str]]:
+        return {
+            n: {d.name for d in self.containers[n].dependencies} for n in names
+        }
 
     def start_containers(
-        self, containers=None, noconfig=False, post_config=False
+        self,
+        containers=None,
+        noconfig=False,
+        post_config=False,
+        workers=DEFAULT_WORKERS,
+        adopt=None,
+        pull=True,
     ):  # noqa : E501
         if containers:
             # Start all specified containers
@@ -31,12 +203,49 @@ class OverdoseManager:
             for c in self.containers:
                 if self.containers[c].autostart:
                     names.append(c)
+        if adopt is not None:
+            for n in names:
+                self.containers[n].adopt = adopt
+        if pull:
+            # Pulls would otherwise stall each container's start serially
+            self.pull_images(names)
 
+        # Post config of linked containers waits until the links exist,
+        # post config referring to peers that may still be starting until
+        # all containers run
+        deferred = {
+            c.name for link in self.links.links for c in (link.a, link.b)
+        }
         for n in names:
             c = self.containers[n]
-            c.run(noconfig=noconfig)
-            if post_config:
-                c.post_config()
+            if c.peers - c.dependencies:
+                deferred.add(n)
+
+        def start(n):
+            c = self.containers[n]
+            if not c.run(noconfig=noconfig):
+                return False
+            if post_config and n not in deferred:
+                return c.post_config()
+            return True
+
+        # Containers only wait for the dependencies they are started with,
+        # independent branches are started concurrently.
+        result = self._run_per_endpoint(names, start, workers)
+        self.links.create()
+        if post_config:
+            for n in names:
+                c = self.containers[n]
+                if n in deferred and c.is_running:
+                    c.post_config()
+        result.report("start")
+        self._flush_state(names)
+        return result
+
+    def _flush_state(self, names) -> None:
+        # Config fingerprints of adoptable containers
+        if any(self.containers[n].adopt for n in names):
+            get_config_state().flush()
 
     def post_start_config(self, containers=None):
         if containers:
@@ -51,8 +260,15 @@ class OverdoseManager:
         for n in names:
             if self.containers[n].is_running:
                 self.containers[n].post_config()
+        self._flush_state(names)
 
-    def stop_containers(self, containers=None):
+    def stop_containers(
+        self,
+        containers=None,
+        timeout=STOP_TIMEOUT,
+        workers=DEFAULT_WORKERS,
+        remove_networks=None,
+    ):
         if containers:
             # Stop all specified containers
             if isinstance(containers, str):
@@ -61,6 +277,44 @@ class OverdoseManager:
                 names = containers
         else:
             # Stop all containers
-            names = self.containers.keys()
+            names = list(self.containers.keys())
+            if remove_networks is None:
+                remove_networks = True
+
+        # One deadline for the whole teardown: containers get SIGTERM with
+        # whatever is left of it as grace period, and are killed once it
+        # has passed
+        deadline = time.monotonic() + timeout
+        timings = {}
+
+        def stop(n):
+            c = self.containers[n]
+            started = time.monotonic()
+            remaining = deadline - started
+            try:
+                if remaining >= 1:
+                    action = "stop" if c.stop(timeout=int(remaining)) else "-"
+                else:
+                    action = "kill" if c.kill() else "-"
+            except Exception as e:
+                action = f"failed ({e})"
+            timings[n] = (action, time.monotonic() - started)
+            # Never hold back the containers this one depends on
+            return True
+
+        # Pooled containers outlive the teardown, their links must not
+        self.links.remove(names)
+
+        # Dependents are stopped before the containers they depend on
+        scheduler = DependencyScheduler(
+            self.dependency_graph(names), workers=workers
+        ).reversed()
+        scheduler.run(stop)
+        if remove_networks:
+            NetworkManager.close_all()
+
+        print("Teardown report:")
         for n in names:
-            self.containers[n].stop()
+            action, duration = timings.get(n, ("-", 0.0))
+            print(f"\t[{n}] {action} {duration:.2f}s")
+        return timings
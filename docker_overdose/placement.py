@@ -0,0 +1,230 @@
+import re
+from typing import TYPE_CHECKING, Iterable, Mapping
+
+from .dockerclient import endpoint_url, get_endpoint_client
+from .networkmanager import NetworkManager
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .containermanager import ContainerManager
+
+# Balance the number of containers, or their declared CPU and memory
+STRATEGIES = ("count", "weights")
+# Weight of containers without a CPU or memory limit in their run options
+DEFAULT_CPUS = 1.0
+DEFAULT_MEMORY = 256 * 1024**2
+MEMORY_UNITS = {"": 1, "b": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+
+def parse_memory(value) -> int:
+    """Bytes of a docker memory value like 512m or 2g."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    m = re.fullmatch(
+        r"\s*(\d+(?:\.\d+)?)\s*([bkmg]?)b?\s*", str(value).lower()
+    )
+    if not m:
+        raise ValueError(f"Invalid memory value '{value}'")
+    return int(float(m.group(1)) * MEMORY_UNITS[m.group(2)])
+
+
+def weight(cm: "ContainerManager") -> tuple[float, int]:
+    """CPUs and memory `cm` declares in its run options."""
+    options = cm.run_options
+    if options.get("nano_cpus"):
+        cpus = options["nano_cpus"] / 1e9
+    elif options.get("cpu_quota"):
+        cpus = options["cpu_quota"] / options.get("cpu_period", 100000)
+    else:
+        cpus = DEFAULT_CPUS
+    memory = options.get("mem_limit")
+    return cpus, parse_memory(memory) if memory else DEFAULT_MEMORY
+
+
+def _networks(cm: "ContainerManager") -> dict[str, bool]:
+    # Docker networks of `cm`, by name, and whether they are internal
+    networks = [cm.run_options.get("network")]
+    for options in (cm.net_options, cm.post_options):
+        added = options.get("add_network") or []
+        networks += added if isinstance(added, list) else [added]
+    names = {}
+    for n in networks:
+        if isinstance(n, NetworkManager):
+            names[n.name] = bool(n.inspect and n.inspect["Internal"])
+        elif n:
+            names.setdefault(n, True)
+    return names
+
+
+def _local(endpoint: str) -> bool:
+    # Engines behind a unix socket run on this host and share its iptables
+    return endpoint_url(endpoint).startswith("unix://")
+
+
+class PlacementScheduler:
+    """Spreads containers over several Docker endpoints.
+
+    Containers that have to reach each other over a docker network, depend
+    on each other or are linked form a group that is placed on one
+    endpoint. Groups are placed largest first on the endpoint that is least
+    loaded afterwards: by number of containers, or with the "weights"
+    strategy by the CPUs and memory declared in the run options relative
+    to the capacity of the endpoint. Capacities are given per endpoint as
+    {"cpus": ..., "memory": ...} or taken from the daemon.
+    """
+
+    def __init__(
+        self,
+        endpoints: Iterable[str] | Mapping[str, Mapping],
+        strategy: str = "count",
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown placement strategy '{strategy}'")
+        self.strategy = strategy
+        if isinstance(endpoints, Mapping):
+            self.capacities = {e: dict(c) for e, c in endpoints.items()}
+        else:
+            self.capacities = {e: {} for e in endpoints}
+        if not self.capacities:
+            raise ValueError("No endpoints to place containers on")
+
+    def capacity(self, endpoint: str) -> tuple[float, int]:
+        declared = self.capacities[endpoint]
+        if "cpus" not in declared or "memory" not in declared:
+            info = get_endpoint_client(endpoint).info()
+            declared.setdefault("cpus", info["NCPU"])
+            declared.setdefault("memory", info["MemTotal"])
+        return float(declared["cpus"]), parse_memory(declared["memory"])
+
+    @staticmethod
+    def groups(
+        containers: Iterable["ContainerManager"],
+        links: Iterable[tuple[str, str]] = (),
+    ) -> list[list["ContainerManager"]]:
+        """Containers that have to share an endpoint."""
+        containers = list(containers)
+        parent = {c.name: c.name for c in containers}
+
+        def find(n):
+            while parent[n] != n:
+                parent[n] = parent[parent[n]]
+                n = parent[n]
+            return n
+
+        def union(a, b):
+            if a in parent and b in parent:
+                parent[find(a)] = find(b)
+
+        by_network: dict[str, str] = {}
+        for c in containers:
+            for d in c.dependencies | c.peers:
+                union(c.name, d.name)
+            for network in _networks(c):
+                union(c.name, by_network.setdefault(network, c.name))
+        for a, b in links:
+            union(a, b)
+        groups: dict[str, list] = {}
+        for c in containers:
+            groups.setdefault(find(c.name), []).append(c)
+        return list(groups.values())
+
+    def place(
+        self,
+        containers: Iterable["ContainerManager"],
+        links: Iterable[tuple[str, str]] = (),
+    ) -> dict[str, str]:
+        """Endpoint per container name, pinned endpoints are kept."""
+        load = {e: [0, 0.0, 0] for e in self.capacities}
+        capacity = {}
+        if self.strategy == "weights":
+            capacity = {e: self.capacity(e) for e in self.capacities}
+        groups: list[tuple[list, int, float, int, set]] = []
+        for group in self.groups(containers, links):
+            cpus = sum(weight(c)[0] for c in group)
+            memory = sum(weight(c)[1] for c in group)
+            pinned = {c.endpoint for c in group if c.endpoint}
+            if len(pinned) > 1:
+                raise ValueError(
+                    f"Containers {sorted(c.name for c in group)} share "
+                    f"networks or dependencies but are pinned to "
+                    f"{sorted(pinned)}"
+                )
+            groups.append((group, len(group), cpus, memory, pinned))
+
+        def cost(endpoint, count, cpus, memory):
+            used = load[endpoint]
+            if self.strategy == "count":
+                return (used[0] + count, endpoint)
+            cap_cpus, cap_memory = capacity[endpoint]
+            return (
+                max(
+                    (used[1] + cpus) / cap_cpus,
+                    (used[2] + memory) / cap_memory,
+                ),
+                endpoint,
+            )
+
+        placement = {}
+        # Pinned groups first, they constrain the rest
+        groups.sort(
+            key=lambda g: (
+                not g[4],
+                -(g[1] if self.strategy == "count" else g[2]),
+            )
+        )
+        for group, count, cpus, memory, pinned in groups:
+            if pinned:
+                endpoint = pinned.pop()
+                if endpoint not in load:
+                    raise ValueError(f"Unknown endpoint '{endpoint}'")
+            else:
+                endpoint = min(
+                    load, key=lambda e: cost(e, count, cpus, memory)
+                )
+            load[endpoint][0] += count
+            load[endpoint][1] += cpus
+            load[endpoint][2] += memory
+            for c in group:
+                placement[c.name] = endpoint
+        return placement
+
+    def apply(
+        self,
+        containers: Iterable["ContainerManager"],
+        links: Iterable[tuple[str, str]] = (),
+    ) -> dict[str, str]:
+        """Place `containers` and create their networks on the endpoints.
+
+        Networks are created on remote (tcp://) endpoints without touching
+        the local iptables, as those belong to the daemons of this host
+        only.
+        """
+        containers = list(containers)
+        placement = self.place(containers, links)
+        networks: dict[str, dict[str, bool]] = {}
+        for c in containers:
+            c.endpoint = placement[c.name]
+            networks.setdefault(c.endpoint, {}).update(_networks(c))
+        created: dict[tuple[str, str], NetworkManager] = {}
+        for endpoint, names in networks.items():
+            for internal in (True, False):
+                batch = [n for n, i in names.items() if i is internal]
+                if not batch:
+                    continue
+                for n in NetworkManager.bulk(
+                    batch,
+                    internal=internal,
+                    isolate=not _local(endpoint),
+                    endpoint=endpoint,
+                ):
+                    created[(endpoint, n.name)] = n
+        for c in containers:
+            network = c.run_options.get("network")
+            if isinstance(network, NetworkManager) and (
+                network.endpoint != c.endpoint
+            ):
+                # Same name, but the network of the container's own engine
+                c.run_options = dict(
+                    c.run_options,
+                    network=created[(placement[c.name], network.name)],
+                )
+        return placement
@@ -0,0 +1,101 @@
+import inspect
+from typing import TYPE_CHECKING, Callable
+
+from .tracing import get_tracer
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .containermanager import ContainerManager
+
+# Options bringing interfaces into the container (moved from the host or
+# from a docker network), applied before the namespace ones
+ATTACH_OPTIONS = ("add_if", "add_network")
+
+
+class Step:
+    """One call of a config method, with its arguments bound."""
+
+    __slots__ = ("option", "func", "args", "kwargs")
+
+    def __init__(self, option: str, func: Callable, args: tuple, kwargs):
+        self.option = option
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+
+    def __repr__(self) -> str:
+        args = [repr(getattr(a, "name", a)) for a in self.args]
+        args += [f"{k}={getattr(v, 'name', v)!r}" for k, v in self.kwargs]
+        return f"{self.option}({', '.join(args)})"
+
+    def __call__(self, cm: "ContainerManager") -> None:
+        self.func(cm, *self.args, **dict(self.kwargs))
+
+
+class ConfigPlan:
+    """Config options compiled into ordered steps.
+
+    Options are checked against `allowed` and the arguments against the
+    signature of the method of `cls` at compile time, so a plan applies
+    without looking anything up and can be applied again. Containers in
+    the arguments stay references, their addresses are resolved when the
+    step runs. Attach steps run first, the namespace steps then share one
+    nsenter session and iptables batch.
+    """
+
+    def __init__(
+        self,
+        options: dict,
+        cls: type["ContainerManager"],
+        allowed: tuple[str, ...],
+    ):
+        self.options = options
+        self.depends: set["ContainerManager"] = set()
+        # Containers whose addresses the steps resolve
+        self.peers: set["ContainerManager"] = set()
+        self.attach: list[Step] = []
+        self.steps: list[Step] = []
+        for option, value in options.items():
+            if option == "depends":
+                self.depends = cls._depends(options)
+                continue
+            if option not in allowed or not hasattr(cls, option):
+                raise ValueError(f"Option '{option}' is not supported")
+            func = getattr(cls, option)
+            self.peers |= cls._peers(value)
+            signature = inspect.signature(func)
+            values = value if isinstance(value, list) else [value]
+            for arg in values:
+                args: tuple
+                if isinstance(arg, bool):
+                    # Flag options, called without arguments either way
+                    args, kwargs = (), {}
+                elif isinstance(arg, dict):
+                    args, kwargs = (), arg
+                else:
+                    args, kwargs = (arg,), {}
+                try:
+                    signature.bind(None, *args, **kwargs)
+                except TypeError as e:
+                    raise ValueError(f"Option '{option}': {e}") from None
+                step = Step(option, func, args, tuple(kwargs.items()))
+                if option in ATTACH_OPTIONS:
+                    self.attach.append(step)
+                else:
+                    self.steps.append(step)
+
+    def __repr__(self) -> str:
+        return f"ConfigPlan({self.attach + self.steps})"
+
+    def __bool__(self) -> bool:
+        return bool(self.attach or self.steps or self.depends)
+
+    def _run(self, cm: "ContainerManager", steps: list[Step]) -> None:
+        tracer = get_tracer()
+        for step in steps:
+            with tracer.span(step.option, "option", container=cm.name):
+                step(cm)
+
+    def apply(self, cm: "ContainerManager") -> None:
+        self._run(cm, self.attach)
+        with cm.session(), cm.iptables_batch():
+            self._run(cm, self.steps)
@@ -0,0 +1,305 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Iterable
+
+from . import iptables, processmanager
+from .dockerclient import get_docker_client
+from .inventory import get_inventory
+from .networkmanager import NetworkManager
+from .processmanager import ProcessManager
+from .tracing import get_tracer
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .containermanager import ContainerManager
+
+# Idle containers kept per profile (image and run options)
+DEFAULT_SIZE = 2
+# Idle containers kept over all profiles
+DEFAULT_MAX_IDLE = 32
+# Label marking containers owned by a pool, carries the profile
+POOL_LABEL = "docker-overdose.pool"
+# Tables emptied on reset when they were empty in the baseline
+RESET_TABLES = ("filter", "nat", "mangle")
+# Options leaving state behind that a reset can't undo (moved host
+# interfaces, bridges, extra networks, a rewritten resolv.conf)
+NON_RESETTABLE = (
+    "add_if",
+    "config_bridge",
+    "create_vlan",
+    "add_network",
+    "change_nameserver",
+)
+# Parallel container creations when filling the pool
+FILL_WORKERS = 8
+
+
+class Baseline:
+    """Network namespace state of a fresh container, restored on reset."""
+
+    def __init__(self, routes: list[str], addresses: set, rules: str):
+        self.routes = routes
+        self.addresses = addresses
+        self.rules = rules
+
+    @staticmethod
+    def _addresses(pm: ProcessManager) -> set[tuple[str, str]]:
+        res = pm.exec_in_netns(
+            [processmanager.IP_BIN, "-o", "addr", "show"], capture_output=True
+        )
+        addresses = set()
+        for line in res.stdout.decode(errors="replace").splitlines():
+            # "2: eth0    inet 172.17.0.2/16 brd ... scope global eth0"
+            fields = line.split()
+            if len(fields) >= 4 and fields[2] in ("inet", "inet6"):
+                addresses.add((fields[1].split("@")[0], fields[3]))
+        return addresses
+
+    @classmethod
+    def capture(cls, pm: ProcessManager) -> "Baseline":
+        with pm.session():
+            res = pm.exec_in_netns(
+                [processmanager.IP_BIN, "route", "show"], capture_output=True
+            )
+            routes = res.stdout.decode(errors="replace").splitlines()
+            res = pm.exec_in_ns(
+                [iptables.IPTABLES_SAVE_BIN], capture_output=True
+            )
+            rules = res.stdout.decode(errors="replace")
+            return cls(routes, cls._addresses(pm), rules)
+
+    def restore(self, pm: ProcessManager) -> None:
+        ip = processmanager.IP_BIN
+        with pm.session():
+            for intf, address in self._addresses(pm) - self.addresses:
+                pm.exec_in_netns([ip, "addr", "del", address, "dev", intf])
+            pm.exec_in_netns([ip, "route", "flush", "table", "main"])
+            # Gateways have to be reachable before routes via them
+            routes = sorted(self.routes, key=lambda r: " via " in r)
+            for route in routes:
+                if route.strip():
+                    pm.exec_in_netns([ip, "route", "replace", *route.split()])
+            # Tables missing from the baseline were empty, an empty block
+            # flushes them
+            rules = self.rules
+            for table in RESET_TABLES:
+                if f"*{table}\n" not in rules:
+                    rules += f"*{table}\nCOMMIT\n"
+            pm.exec_in_ns(
+                [iptables.IPTABLES_RESTORE_BIN],
+                capture_output=True,
+                input=rules.encode(),
+            )
+
+
+class _Entry:
+    def __init__(self, name: str, profile: str, container, baseline: Baseline):
+        # Current name, the container model keeps the one it was created
+        # with
+        self.name = name
+        self.profile = profile
+        self.container = container
+        self.baseline = baseline
+        self.released = time.monotonic()
+
+
+class ContainerPool:
+    """Idle, paused containers per profile, handed out instead of new ones.
+
+    A profile is the image plus run options of a ContainerManager. Returned
+    containers get their routes, addresses and iptables rules reset to the
+    state right after creation and are paused until taken again. At most
+    `size` containers are kept per profile and `max_idle` overall, the
+    least recently returned ones are removed first.
+    """
+
+    def __init__(
+        self,
+        size: int = DEFAULT_SIZE,
+        max_idle: int = DEFAULT_MAX_IDLE,
+        client=None,
+    ):
+        self.client = client if client else get_docker_client()
+        self.inventory = get_inventory(self.client)
+        self.size = size
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        # pool name -> entry, least recently returned first
+        self._idle: OrderedDict[str, _Entry] = OrderedDict()
+        # container name -> entry of containers in use
+        self._active: dict[str, _Entry] = {}
+        self._names = itertools.count(1)
+        # Networks idle containers are attached to, removed on close()
+        self._networks: list[NetworkManager] = []
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "returned": 0,
+            "evicted": 0,
+        }
+
+    def __enter__(self) -> "ContainerPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @staticmethod
+    def profile(cm: "ContainerManager") -> str:
+        return cm.run_hash
+
+    def _pool_name(self, profile: str) -> str:
+        return f"overdose-pool-{profile[:12]}-{next(self._names)}"
+
+    def _create(self, cm: "ContainerManager", name: str) -> _Entry:
+        profile = self.profile(cm)
+        run_kwargs = cm.run_kwargs()
+        run_kwargs["name"] = name
+        run_kwargs["labels"] = dict(
+            run_kwargs["labels"], **{POOL_LABEL: profile}
+        )
+        with get_tracer().span("pool.create", "docker", container=name):
+            container = self.client.containers.run(cm.image, **run_kwargs)
+            container.reload()
+        pm = ProcessManager(name, pid=container.attrs["State"]["Pid"])
+        return _Entry(name, profile, container, Baseline.capture(pm))
+
+    def fill(self, containers: Iterable["ContainerManager"]) -> int:
+        """Create idle containers until every profile has `size` of them.
+
+        Returns the number of containers created.
+        """
+        missing: list["ContainerManager"] = []
+        with self.lock:
+            counts: dict[str, int] = {}
+            for e in self._idle.values():
+                counts[e.profile] = counts.get(e.profile, 0) + 1
+            for cm in containers:
+                profile = self.profile(cm)
+                while (
+                    counts.get(profile, 0) < self.size
+                    and len(self._idle) + len(missing) < self.max_idle
+                ):
+                    counts[profile] = counts.get(profile, 0) + 1
+                    missing.append(cm)
+
+        def create(cm):
+            entry = self._create(cm, self._pool_name(self.profile(cm)))
+            entry.container.pause()
+            with self.lock:
+                self._idle[entry.name] = entry
+
+        if missing:
+            print(f"Filling container pool with {len(missing)} containers...")
+            with ThreadPoolExecutor(max_workers=FILL_WORKERS) as pool:
+                list(pool.map(create, missing))
+        return len(missing)
+
+    def acquire(self, cm: "ContainerManager") -> tuple[object, bool]:
+        """Container for `cm`, renamed to its name and running.
+
+        Returns the container and whether it was taken from the pool.
+        """
+        profile = self.profile(cm)
+        with self.lock:
+            name = next(
+                (
+                    n
+                    for n, e in reversed(self._idle.items())
+                    if e.profile == profile
+                ),
+                None,
+            )
+            entry = self._idle.pop(name) if name else None
+            self.stats["hits" if entry else "misses"] += 1
+        if entry is None:
+            entry = self._create(cm, cm.name)
+        else:
+            with get_tracer().span("pool.acquire", "docker", container=name):
+                entry.container.rename(cm.name)
+                entry.container.unpause()
+                entry.name = cm.name
+                self.inventory.invalidate(name)
+        with self.lock:
+            self._active[cm.name] = entry
+        return entry.container, name is not None
+
+    def release(self, cm: "ContainerManager") -> bool:
+        """Take back the container of `cm`.
+
+        Returns False if the container doesn't belong to the pool, the
+        caller then stops it as usual.
+        """
+        with self.lock:
+            entry = self._active.pop(cm.name, None)
+        if entry is None:
+            return False
+        # The stream would follow the container under its next name too
+        if cm.logmux:
+            cm.logmux.detach(cm.name)
+        options = list(cm.net_options) + list(cm.post_options)
+        if any(o in NON_RESETTABLE for o in options):
+            self._remove(entry)
+            return True
+        print(f"[{cm.name}] Returning container to pool...", end="")
+        name = self._pool_name(entry.profile)
+        with get_tracer().span("pool.release", "docker", container=cm.name):
+            pm = ProcessManager(cm.name, pid=cm.pid, backend=cm.backend)
+            entry.baseline.restore(pm)
+            entry.container.pause()
+            entry.container.rename(name)
+        entry.name = name
+        entry.released = time.monotonic()
+        # Keep the networks of the container past the teardown
+        attrs = entry.container.attrs.get("NetworkSettings") or {}
+        networks = NetworkManager.claim(attrs.get("Networks") or {})
+        with self.lock:
+            self._networks += networks
+            self._idle[name] = entry
+            self.stats["returned"] += 1
+            evicted = self._over_limit(entry.profile)
+        print("OK")
+        for e in evicted:
+            self._remove(e)
+        return True
+
+    def _over_limit(self, profile: str) -> list[_Entry]:
+        # Called with the lock held
+        evicted = []
+        same = [n for n, e in self._idle.items() if e.profile == profile]
+        for n in same[: max(0, len(same) - self.size)]:
+            evicted.append(self._idle.pop(n))
+        while len(self._idle) > self.max_idle:
+            evicted.append(self._idle.popitem(last=False)[1])
+        self.stats["evicted"] += len(evicted)
+        return evicted
+
+    def _remove(self, entry: _Entry) -> None:
+        import docker
+
+        try:
+            entry.container.remove(force=True)
+        except docker.errors.NotFound:
+            pass
+        self.inventory.invalidate(entry.name)
+
+    def forget(self, cm: "ContainerManager") -> None:
+        with self.lock:
+            self._active.pop(cm.name, None)
+
+    @property
+    def idle(self) -> int:
+        with self.lock:
+            return len(self._idle)
+
+    def close(self) -> None:
+        """Remove all idle containers and the networks they kept."""
+        with self.lock:
+            entries = list(self._idle.values())
+            self._idle.clear()
+            networks, self._networks = self._networks, []
+        with ThreadPoolExecutor(max_workers=FILL_WORKERS) as pool:
+            list(pool.map(self._remove, entries))
+        NetworkManager.close_all(networks)
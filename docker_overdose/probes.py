@@ -0,0 +1,171 @@
+import abc
+import os
+import random
+import re
+import threading
+import time
+from typing import TYPE_CHECKING, Iterator, Optional
+
+from .events import get_event_watcher
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .containermanager import ContainerManager
+
+# Polling of probes: first delay, growth factor and cap (in seconds)
+BACKOFF_INITIAL = 0.05
+BACKOFF_FACTOR = 2
+BACKOFF_MAX = 2.0
+# Delays are spread by up to this fraction, so dependents of the same
+# container don't poll in lockstep
+JITTER = 0.2
+# Seconds a dependency gets to become ready
+READY_TIMEOUT = 60
+# Where the socket tables of the container namespaces are read
+PROC_DIR = "/proc"
+TCP_LISTEN = "0A"
+
+
+def backoff(
+    initial: float = BACKOFF_INITIAL,
+    factor: float = BACKOFF_FACTOR,
+    maximum: float = BACKOFF_MAX,
+    jitter: float = JITTER,
+) -> Iterator[float]:
+    """Endless exponentially growing delays with jitter."""
+    delay = initial
+    while True:
+        yield delay * (1 + random.uniform(-jitter, jitter))
+        delay = min(delay * factor, maximum)
+
+
+class Probe(abc.ABC):
+    """Readiness check of a running container."""
+
+    # Docker events that may turn the probe ready, waited for instead of
+    # sleeping
+    events: tuple[str, ...] = ()
+
+    def arm(self, cm: "ContainerManager") -> None:
+        """Called when the container was (re)started, before its logs are
+        followed."""
+
+    @abc.abstractmethod
+    def check(self, cm: "ContainerManager") -> bool:
+        """Whether the container is ready."""
+
+
+class TcpProbe(Probe):
+    """A TCP socket listens on `port` in the network namespace.
+
+    The socket tables of the namespace are read from /proc, no process is
+    started for a check.
+    """
+
+    def __init__(self, port: int):
+        self.port = port
+
+    def __repr__(self) -> str:
+        return f"TcpProbe({self.port})"
+
+    def check(self, cm: "ContainerManager") -> bool:
+        port = f"{self.port:04X}"
+        for table in ("tcp", "tcp6"):
+            try:
+                with open(
+                    os.path.join(PROC_DIR, str(cm.pid), "net", table)
+                ) as f:
+                    next(f)
+                    for line in f:
+                        # "0: 00000000:0050 00000000:0000 0A ..."
+                        fields = line.split()
+                        if (
+                            fields[3] == TCP_LISTEN
+                            and fields[1].rsplit(":", 1)[1] == port
+                        ):
+                            return True
+            except (OSError, StopIteration, IndexError):
+                continue
+        return False
+
+
+class LogProbe(Probe):
+    """A log line matched the regular expression `pattern`.
+
+    Lines are matched as they pass the log multiplexer. Without one, and for
+    adopted containers whose earlier lines were never streamed, the daemon
+    is asked for the logs instead.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = re.compile(pattern.encode())
+        self.event: Optional[threading.Event] = None
+        self.since: Optional[int] = None
+
+    def __repr__(self) -> str:
+        return f"LogProbe({self.pattern.pattern.decode()!r})"
+
+    def arm(self, cm: "ContainerManager") -> None:
+        self.since = None if cm.adopted else int(time.time())
+        self.event = (
+            cm.logmux.watch(cm.name, self.pattern) if cm.logmux else None
+        )
+
+    def check(self, cm: "ContainerManager") -> bool:
+        if self.event is not None and (
+            self.event.is_set() or self.since is not None
+        ):
+            return self.event.is_set()
+        logs = cm._container.logs(stdout=True, stderr=True, since=self.since)
+        return any(self.pattern.search(line) for line in logs.splitlines())
+
+
+class HealthProbe(Probe):
+    """The docker healthcheck of the container reports healthy."""
+
+    events = ("health_status",)
+
+    def __repr__(self) -> str:
+        return "HealthProbe()"
+
+    def check(self, cm: "ContainerManager") -> bool:
+        state = cm.client.api.inspect_container(cm.name)["State"]
+        return state.get("Health", {}).get("Status") == "healthy"
+
+
+class CommandProbe(Probe):
+    """`cmd` exits with 0 in the mount and network namespace."""
+
+    def __init__(self, cmd: str | list[str]):
+        self.cmd = cmd
+
+    def __repr__(self) -> str:
+        return f"CommandProbe({self.cmd!r})"
+
+    def check(self, cm: "ContainerManager") -> bool:
+        return cm.exec_in_ns(self.cmd, capture_output=True).returncode == 0
+
+
+def wait_ready(
+    cm: "ContainerManager",
+    probes: list[Probe],
+    timeout: float = READY_TIMEOUT,
+) -> bool:
+    """Poll `probes` with backoff until all passed or `timeout` expired."""
+    deadline = time.monotonic() + timeout
+    pending = list(probes)
+    delays = backoff()
+    watcher = None
+    if any(p.events for p in pending):
+        watcher = get_event_watcher(cm.client)
+    while True:
+        since = watcher.seq if watcher else 0
+        pending = [p for p in pending if not p.check(cm)]
+        remaining = deadline - time.monotonic()
+        if not pending or remaining <= 0:
+            return not pending
+        delay = min(next(delays), remaining)
+        events = {e for p in pending for e in p.events}
+        if events and watcher and watcher.alive:
+            watcher.wait(cm.name, events, since=since, timeout=delay)
+        else:
+            time.sleep(delay)
@@ -1,17 +1,171 @@
+import shlex
 import subprocess
-from typing import Optional, Iterable
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Optional, Iterable
+from .netlink import NetnsWorker, get_netns_worker
+from .iptables import IptablesBatch
+from .tracing import get_tracer
 
 NSENTER_BIN = "/usr/bin/nsenter"
+SH_BIN = "/bin/sh"
 IPTABLES_BIN = "/usr/sbin/iptables"
 # IPTABLES_BIN = "/usr/sbin/iptables-legacy"
 BRCTL_BIN = "/sbin/brctl"
 IP_BIN = "/sbin/ip"
 
+# Backends for link/address/route changes: "nsenter" forks nsenter + ip for
+# every operation, "netlink" talks rtnetlink from a thread inside the netns
+BACKENDS = ("nsenter", "netlink")
+DEFAULT_BACKEND = "nsenter"
+
+
+class NsenterSession:
+    """Long-lived shell inside the namespaces of a target process.
+
+    Commands are written to the shell one per line and their output is read
+    back up to a marker carrying the return code, so a whole configuration
+    pass costs a single fork/exec + setns instead of one per command.
+    """
+
+    def __init__(self, target: int, mount: bool = False, net: bool = False):
+        args = [NSENTER_BIN, "--target", str(target)]
+        if mount:
+            args += ["--mount"]
+        if net:
+            args += ["--net"]
+        args += [SH_BIN]
+        self.lock = threading.Lock()
+        self.broken = False
+        try:
+            self.proc: Optional[subprocess.Popen] = subprocess.Popen(
+                args,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            )
+        except OSError:
+            self.proc = None
+            self.broken = True
+
+    def run(
+        self, cmd: list[str], capture_output: bool = False
+    ) -> Optional[subprocess.CompletedProcess]:
+        """Run `cmd` in the session, returns None if the session is broken.
+
+        Stdout and stderr of the command are merged into stdout.
+        """
+        with self.lock:
+            if self.broken or self.proc is None:
+                return None
+            # Both are pipes, see __init__
+            stdin, stdout = self.proc.stdin, self.proc.stdout
+            assert stdin is not None and stdout is not None
+            marker = f"__overdose_rc_{uuid.uuid4().hex}__".encode()
+            line = (
+                f"{shlex.join(cmd)} </dev/null 2>&1; "
+                f"printf '\\n%s %d\\n' {marker.decode()} $?\n"
+            )
+            try:
+                stdin.write(line.encode())
+                stdin.flush()
+                output = b""
+                while True:
+                    data = stdout.readline()
+                    if not data:
+                        raise BrokenPipeError
+                    if data.startswith(marker):
+                        rc = int(data[len(marker) :].strip())  # noqa: E203
+                        break
+                    output += data
+            except (OSError, ValueError):
+                self.broken = True
+                self.close()
+                return None
+        # Strip the newline printed in front of the marker
+        output = output[:-1]
+        if not capture_output:
+            sys.stdout.buffer.write(output)
+            sys.stdout.flush()
+            return subprocess.CompletedProcess(cmd, rc)
+        return subprocess.CompletedProcess(cmd, rc, stdout=output, stderr=b"")
+
+    def close(self) -> None:
+        if self.proc is None or self.proc.stdin is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
 
 class ProcessManager:
-    def __init__(self, name: str = "", pid: int = 1):
+    # Open sessions while in session mode, keyed on (target, mount, net)
+    _sessions: Optional[dict[tuple[int, bool, bool], NsenterSession]] = None
+    backend: str = DEFAULT_BACKEND
+    # Pending iptables rules while in an iptables_batch() block
+    _iptables_batch: Optional[IptablesBatch] = None
+
+    def __init__(
+        self, name: str = "", pid: int = 1, backend: str = DEFAULT_BACKEND
+    ):
         self.name = name
         self.pid = pid
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}'")
+        self.backend = backend
+
+    @property
+    def netns_worker(self) -> Optional[NetnsWorker]:
+        if self.backend != "netlink" or not self.pid:
+            return None
+        try:
+            return get_netns_worker(self.pid)
+        except OSError as e:
+            print(f"(netlink unavailable: {e}, using nsenter) ", end="")
+            return None
+
+    @staticmethod
+    def _netlink(func: Callable, *args) -> int:
+        try:
+            func(*args)
+        except OSError as e:
+            print(f"{e} ", end="")
+            return e.errno or 1
+        return 0
+
+    @contextmanager
+    def session(self):
+        """Reuse one helper shell per namespace for all commands within."""
+        if self._sessions is not None:
+            # Already in session mode
+            yield self
+            return
+        self._sessions = {}
+        try:
+            yield self
+        finally:
+            sessions, self._sessions = self._sessions, None
+            for s in sessions.values():
+                s.close()
+
+    def _get_session(
+        self, target: int, mount: bool, net: bool
+    ) -> Optional[NsenterSession]:
+        if self._sessions is None:
+            return None
+        key = (target, mount, net)
+        if key not in self._sessions:
+            self._sessions[key] = NsenterSession(target, mount, net)
+        return self._sessions[key]
 
     def nsenter(
         self,
@@ -20,6 +174,7 @@ class ProcessManager:
         mount: Optional[str | bool] = None,
         net: Optional[str | bool] = None,
         capture_output: bool = False,
+        input: Optional[bytes] = None,
     ) -> subprocess.CompletedProcess:
         if not target:
             target = self.pid
@@ -34,9 +189,27 @@ class ProcessManager:
                 args += [net]
         if isinstance(cmd, str):
             cmd = cmd.split()
-        args += cmd
-        # print(f"Will now execute [{' '.join(args)}]")
-        return subprocess.run(args, capture_output=capture_output)
+        with get_tracer().span(
+            "nsenter", "nsenter", container=self.name, cmd=cmd
+        ) as s:
+            if (
+                input is None
+                and isinstance(mount, bool | None)
+                and isinstance(net, bool | None)
+            ):
+                session = self._get_session(target, bool(mount), bool(net))
+                if session:
+                    res = session.run(cmd, capture_output=capture_output)
+                    if res is not None:
+                        s.set(rc=res.returncode, session=True)
+                        return res
+            args += cmd
+            # print(f"Will now execute [{' '.join(args)}]")
+            res = subprocess.run(
+                args, capture_output=capture_output, input=input
+            )
+            s.set(rc=res.returncode, session=False)
+            return res
 
     def exec_in_netns(
         self, cmd: str | list[str], capture_output: bool = False
@@ -49,10 +222,17 @@ class ProcessManager:
         return self.nsenter(mount=True, cmd=cmd, capture_output=capture_output)
 
     def exec_in_ns(
-        self, cmd: str | list[str], capture_output: bool = False
+        self,
+        cmd: str | list[str],
+        capture_output: bool = False,
+        input: Optional[bytes] = None,
     ) -> subprocess.CompletedProcess:
         return self.nsenter(
-            cmd=cmd, mount=True, net=True, capture_output=capture_output
+            cmd=cmd,
+            mount=True,
+            net=True,
+            capture_output=capture_output,
+            input=input,
         )
 
     def intf_to_netns(
@@ -66,27 +246,45 @@ class ProcessManager:
             f"[{self.name}] Moving interface {intf} to namespace {netns}...",
             end="",
         )
-        self.exec_in_ns("mkdir -p /var/run/netns")
-        self.exec_in_ns(
-            f"ln -s /proc/{netns}/ns/net /var/run/netns/{netns}",
-            capture_output=True,
-        )
-        if (intf.startswith("phy") and not force_eth) or force_wlan:
-            cmd = ["iw", "phy", intf, "set", "netns", str(netns)]
-            res = self.exec_in_ns(cmd, capture_output=True)
+        wlan = (intf.startswith("phy") and not force_eth) or force_wlan
+        worker = None if wlan else self.netns_worker
+        if worker:
+            rc = self._netlink(worker.link_to_netns, intf, netns)
         else:
-            cmd = ["ip", "link", "set", intf, "netns", str(netns)]
-            res = self.exec_in_netns(cmd, capture_output=True)
-        rc = res.returncode
+            self.exec_in_ns("mkdir -p /var/run/netns")
+            self.exec_in_ns(
+                f"ln -s /proc/{netns}/ns/net /var/run/netns/{netns}",
+                capture_output=True,
+            )
+            if wlan:
+                cmd = ["iw", "phy", intf, "set", "netns", str(netns)]
+                res = self.exec_in_ns(cmd, capture_output=True)
+            else:
+                cmd = ["ip", "link", "set", intf, "netns", str(netns)]
+                res = self.exec_in_netns(cmd, capture_output=True)
+            rc = res.returncode
         if not rc:
             print("OK")
         else:
             print("NOK!")
         return rc
 
+    def delete_route(self, subnet: str) -> None:
+        print(f"[{self.name}] Delete route to {subnet}...", end="")
+        worker = self.netns_worker
+        if worker:
+            self._netlink(worker.route_del, subnet)
+        else:
+            self.exec_in_netns([IP_BIN, "route", "del", subnet])
+        print("OK")
+
     def delete_default_route(self) -> None:
         print(f"[{self.name}] Delete default route...", end="")
-        self.exec_in_netns("ip route del default")
+        worker = self.netns_worker
+        if worker:
+            self._netlink(worker.route_del, "default")
+        else:
+            self.exec_in_netns("ip route del default")
         print("OK")
 
     def add_route(
@@ -95,7 +293,11 @@ class ProcessManager:
         via: str,
     ) -> None:
         print(f"[{self.name}] Add new route to {subnet} via {via}...", end="")
-        self.exec_in_netns(["ip", "route", "add", subnet, "via", via])
+        worker = self.netns_worker
+        if worker:
+            self._netlink(worker.route_add, subnet, via)
+        else:
+            self.exec_in_netns(["ip", "route", "add", subnet, "via", via])
         print("OK")
 
     def change_default_route(self, ipaddress: str) -> None:
@@ -131,19 +333,33 @@ class ProcessManager:
         # self.exec_in_netns([IPTABLES_BIN] + cmd, capture_output=True)
         self.exec_in_ns([IPTABLES_BIN] + cmd, capture_output=True)
 
+    @contextmanager
+    def iptables_batch(self):
+        """Apply all rules ensured within in one iptables-restore per table."""
+        if self._iptables_batch is not None:
+            yield self._iptables_batch
+            return
+        self._iptables_batch = IptablesBatch(self)
+        try:
+            yield self._iptables_batch
+        finally:
+            batch, self._iptables_batch = self._iptables_batch, None
+            batch.commit()
+
+    def ensure_iptables_rule(
+        self, chain: str, spec: list[str], table: str = "filter"
+    ) -> None:
+        if self._iptables_batch is not None:
+            self._iptables_batch.add(chain, spec, table=table)
+        else:
+            batch = IptablesBatch(self)
+            batch.add(chain, spec, table=table)
+            batch.commit()
+
     def set_masquerade(self, interface: str) -> None:
         print(f"[{self.name}] Set up masquerading on {interface}...", end="")
-        self.run_iptables(
-            [
-                "-t",
-                "nat",
-                "-I",
-                "POSTROUTING",
-                "-o",
-                interface,
-                "-j",
-                "MASQUERADE",
-            ]
+        self.ensure_iptables_rule(
+            "POSTROUTING", ["-o", interface, "-j", "MASQUERADE"], table="nat"
         )
         print("OK")
 
@@ -152,6 +368,16 @@ class ProcessManager:
             f"[{self.name}] Creating VLAN {vlanid} on interface {interface}...",  # noqa : E501
             end="",
         )
+        worker = self.netns_worker
+        if worker:
+            self._netlink(
+                worker.vlan_add,
+                interface,
+                f"{interface}.{vlanid}",
+                int(vlanid),
+            )
+            print("OK")
+            return
         self.exec_in_ns(
             [
                 IP_BIN,
@@ -174,6 +400,11 @@ class ProcessManager:
             f"[{self.name}] Setting IP address {ipaddress} on interface '{intf}'...",  # noqa : E501
             end="",
         )
+        worker = self.netns_worker
+        if worker:
+            self._netlink(worker.addr_add, intf, ipaddress)
+            print("OK")
+            return
         self.exec_in_netns(
             [
                 IP_BIN,
@@ -191,6 +422,11 @@ class ProcessManager:
             f"[{self.name}] Bringing interface '{intf}' up...",
             end="",
         )
+        worker = self.netns_worker
+        if worker:
+            self._netlink(worker.link_up, intf)
+            print("OK")
+            return
         self.exec_in_netns(
             [
                 IP_BIN,
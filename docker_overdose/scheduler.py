@@ -0,0 +1,153 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Hashable, Iterable, Mapping
+
+DEFAULT_WORKERS = 8
+
+
+class DependencyCycleError(Exception):
+    def __init__(self, cycle: list):
+        self.cycle = cycle
+        super().__init__(
+            "Dependency cycle detected: " + " -> ".join(str(n) for n in cycle)
+        )
+
+
+class ScheduleResult:
+    def __init__(self):
+        self.succeeded: list = []
+        # node -> exception or reason
+        self.failed: dict = {}
+        # node -> the failed node at the root of its branch
+        self.skipped: dict = {}
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed and not self.skipped
+
+    def report(self, action: str = "start") -> None:
+        for node, reason in self.failed.items():
+            print(f"[{node}] Failed to {action}: {reason}")
+        for node, root in self.skipped.items():
+            print(
+                f"[{node}] Skipped {action}: dependency branch [{root}] failed"
+            )
+
+
+class DependencyScheduler:
+    """Run a callable on every node of a dependency DAG.
+
+    Nodes whose dependencies have all succeeded are dispatched to a bounded
+    worker pool right away, so the wall-clock time scales with the depth of
+    the graph instead of the number of nodes. When a node fails, everything
+    downstream of it is skipped and attributed to that node.
+    """
+
+    def __init__(
+        self,
+        graph: Mapping[Hashable, Iterable[Hashable]],
+        workers: int = DEFAULT_WORKERS,
+    ):
+        # Only keep edges between nodes that are part of this schedule
+        self.graph = {
+            node: {d for d in deps if d in graph and d != node}
+            for node, deps in graph.items()
+        }
+        self.workers = max(1, workers)
+        self.check_cycles()
+
+    def reversed(self) -> "DependencyScheduler":
+        rgraph: dict = {node: set() for node in self.graph}
+        for node, deps in self.graph.items():
+            for d in deps:
+                rgraph[d].add(node)
+        return DependencyScheduler(rgraph, workers=self.workers)
+
+    def check_cycles(self) -> None:
+        WHITE, GREY, BLACK = 0, 1, 2
+        color = {node: WHITE for node in self.graph}
+        for start in self.graph:
+            if color[start] != WHITE:
+                continue
+            color[start] = GREY
+            path = [start]
+            stack = [iter(sorted(self.graph[start], key=str))]
+            while stack:
+                for d in stack[-1]:
+                    if color[d] == GREY:
+                        raise DependencyCycleError(
+                            path[path.index(d) :] + [d]  # noqa: E203
+                        )
+                    if color[d] == WHITE:
+                        color[d] = GREY
+                        path.append(d)
+                        stack.append(iter(sorted(self.graph[d], key=str)))
+                        break
+                else:
+                    color[path.pop()] = BLACK
+                    stack.pop()
+
+    def levels(self) -> list[list]:
+        remaining = {node: set(deps) for node, deps in self.graph.items()}
+        levels = []
+        while remaining:
+            level = [n for n, deps in remaining.items() if not deps]
+            levels.append(level)
+            for n in level:
+                del remaining[n]
+            for deps in remaining.values():
+                deps.difference_update(level)
+        return levels
+
+    def run(self, func: Callable[[Hashable], object]) -> ScheduleResult:
+        result = ScheduleResult()
+        if not self.graph:
+            return result
+        dependents: dict = {node: set() for node in self.graph}
+        for node, deps in self.graph.items():
+            for d in deps:
+                dependents[d].add(node)
+        waiting = {node: len(deps) for node, deps in self.graph.items()}
+        lock = threading.Lock()
+        finished = threading.Event()
+        outstanding = [len(self.graph)]
+
+        def skip(node, root):
+            # Called with the lock held
+            for n in dependents[node]:
+                if n in result.skipped:
+                    continue
+                result.skipped[n] = root
+                outstanding[0] -= 1
+                skip(n, root)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+
+            def task(node):
+                try:
+                    ok = func(node)
+                    error = None if ok is not False else "returned False"
+                except Exception as e:
+                    error = e
+                ready = []
+                with lock:
+                    outstanding[0] -= 1
+                    if error is None:
+                        result.succeeded.append(node)
+                        for n in dependents[node]:
+                            waiting[n] -= 1
+                            if not waiting[n] and n not in result.skipped:
+                                ready.append(n)
+                    else:
+                        result.failed[node] = error
+                        skip(node, node)
+                    if outstanding[0] == 0:
+                        finished.set()
+                for n in ready:
+                    pool.submit(task, n)
+
+            roots = [node for node, count in waiting.items() if not count]
+            for node in roots:
+                pool.submit(task, node)
+            finished.wait()
+        return result
@@ -0,0 +1,83 @@
+import atexit
+import json
+import os
+import threading
+from typing import Optional
+
+# File keeping the config fingerprints of adoptable containers
+STATE_ENV = "DOCKER_OVERDOSE_STATE"
+DEFAULT_STATE_FILE = ".docker-overdose-state.json"
+
+
+class ConfigState:
+    """Which configuration was applied to which container.
+
+    Entries map a container name to the id of the container the config was
+    applied to and a fingerprint per phase ("net", "post"). Changes are
+    kept in memory until flush(), which also runs at exit.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self._entries: Optional[dict[str, dict]] = None
+        self._dirty = False
+
+    def _load(self) -> dict[str, dict]:
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def matches(
+        self, name: str, container_id: str, phase: str, fingerprint: str
+    ) -> bool:
+        with self.lock:
+            entry = self._load().get(name)
+        return (
+            entry is not None
+            and entry.get("id") == container_id
+            and entry.get(phase) == fingerprint
+        )
+
+    def record(
+        self, name: str, container_id: str, phase: str, fingerprint: str
+    ) -> None:
+        with self.lock:
+            entries = self._load()
+            entry = entries.get(name)
+            if not entry or entry.get("id") != container_id:
+                # Fingerprints of a previous container don't apply anymore
+                entry = entries[name] = {"id": container_id}
+            entry[phase] = fingerprint
+            self._dirty = True
+
+    def forget(self, name: str) -> None:
+        with self.lock:
+            if self._load().pop(name, None) is not None:
+                self._dirty = True
+
+    def flush(self) -> None:
+        with self.lock:
+            if not self._dirty:
+                return
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(self._entries, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+
+config_state = None
+
+
+def get_config_state() -> ConfigState:
+    global config_state
+    if not config_state:
+        path = os.environ.get(STATE_ENV) or DEFAULT_STATE_FILE
+        config_state = ConfigState(path)
+        atexit.register(config_state.flush)
+    return config_state
@@ -0,0 +1,206 @@
+import csv
+import json
+import os
+import threading
+import time
+from array import array
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from .probes import PROC_DIR
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .containermanager import ContainerManager
+
+# Seconds between sampling passes
+DEFAULT_INTERVAL = 1.0
+# Counters taken from /proc/<pid>/net/dev, by column
+NET_DEV_FIELDS = {
+    "rx_bytes": 0,
+    "rx_packets": 1,
+    "rx_errs": 2,
+    "rx_drop": 3,
+    "tx_bytes": 8,
+    "tx_packets": 9,
+    "tx_errs": 10,
+    "tx_drop": 11,
+}
+# Counters taken from /proc/<pid>/net/snmp
+SNMP_FIELDS = (
+    "Ip.InReceives",
+    "Ip.OutRequests",
+    "Tcp.ActiveOpens",
+    "Tcp.PassiveOpens",
+    "Tcp.RetransSegs",
+    "Tcp.InErrs",
+    "Udp.InDatagrams",
+    "Udp.OutDatagrams",
+    "Udp.InErrors",
+)
+
+
+def read_net_dev(pid: int, proc: str = PROC_DIR) -> dict[str, int]:
+    """Interface counters of the network namespace of `pid`."""
+    counters = {}
+    with open(os.path.join(proc, str(pid), "net", "dev")) as f:
+        # Two header lines
+        for line in f.readlines()[2:]:
+            intf, _, data = line.partition(":")
+            values = data.split()
+            intf = intf.strip()
+            for name, column in NET_DEV_FIELDS.items():
+                counters[f"{intf}.{name}"] = int(values[column])
+    return counters
+
+
+def read_snmp(
+    pid: int, proc: str = PROC_DIR, fields: Iterable[str] = SNMP_FIELDS
+) -> dict[str, int]:
+    """Protocol counters of the network namespace of `pid`."""
+    with open(os.path.join(proc, str(pid), "net", "snmp")) as f:
+        lines = f.read().splitlines()
+    table = {}
+    # A header line with the names is followed by one with the values
+    for names, values in zip(lines[::2], lines[1::2]):
+        proto, _, names = names.partition(":")
+        for name, value in zip(names.split(), values.split()[1:]):
+            table[f"{proto}.{name}"] = value
+    return {f: int(table[f]) for f in fields if f in table}
+
+
+class StatsCollector:
+    """Network counters of many containers, read from the host's /proc.
+
+    Each pass reads the counter files of every running container, no
+    process is started. Per container and counter the increase since the
+    previous pass is kept in an array, next to one array of timestamps.
+    Counters that weren't there yet, or whose container wasn't running,
+    read as zero.
+    """
+
+    def __init__(
+        self,
+        containers: Iterable["ContainerManager"],
+        interval: float = DEFAULT_INTERVAL,
+        snmp: bool = True,
+        max_samples: Optional[int] = None,
+        proc: str = PROC_DIR,
+    ):
+        self.containers = list(containers)
+        self.interval = interval
+        self.snmp = snmp
+        self.max_samples = max_samples
+        self.proc = proc
+        self.lock = threading.Lock()
+        self.timestamps = array("d")
+        # (container, counter) -> increase per sample
+        self.series: dict[tuple[str, str], array] = {}
+        self._last: dict[tuple[str, str], int] = {}
+        self._pids: dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "StatsCollector":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _read(self, pid: int) -> dict[str, int]:
+        counters = read_net_dev(pid, self.proc)
+        if self.snmp:
+            counters.update(read_snmp(pid, self.proc))
+        return counters
+
+    def sample(self) -> int:
+        """One pass over all containers, returns how many were read."""
+        ts = time.time()
+        read = {}
+        for c in self.containers:
+            pid = c.pid
+            if not pid:
+                continue
+            try:
+                read[c.name] = (pid, self._read(pid))
+            except OSError:
+                # Stopped since the pid was looked up
+                continue
+        with self.lock:
+            n = len(self.timestamps)
+            self.timestamps.append(ts)
+            for name, (pid, counters) in read.items():
+                if self._pids.get(name) != pid:
+                    # New container: counters start over
+                    self._pids[name] = pid
+                    for key in [k for k in self._last if k[0] == name]:
+                        del self._last[key]
+                for counter, value in counters.items():
+                    key = (name, counter)
+                    last = self._last.get(key, value)
+                    self._last[key] = value
+                    s = self.series.get(key)
+                    if s is None:
+                        s = self.series[key] = array("q", bytes(8 * n))
+                    s.append(value - last if value >= last else value)
+            for s in self.series.values():
+                if len(s) <= n:
+                    s.append(0)
+            if self.max_samples and len(self.timestamps) > self.max_samples:
+                drop = len(self.timestamps) - self.max_samples
+                del self.timestamps[:drop]
+                for s in self.series.values():
+                    del s[:drop]
+        return len(read)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            started = time.monotonic()
+            self.sample()
+            self._stop.wait(
+                max(0.0, self.interval - (time.monotonic() - started))
+            )
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def totals(self, container: Optional[str] = None) -> dict:
+        """Sum of the increases per (container, counter)."""
+        with self.lock:
+            return {
+                key: sum(s)
+                for key, s in self.series.items()
+                if container is None or key[0] == container
+            }
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            series: dict[str, dict[str, list[int]]] = {}
+            for (name, counter), s in sorted(self.series.items()):
+                series.setdefault(name, {})[counter] = s.tolist()
+            return {"timestamps": self.timestamps.tolist(), "series": series}
+
+    def export_json(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    def export_csv(self, path: str) -> None:
+        """One row per sample, one column per container and counter."""
+        with self.lock:
+            keys = sorted(self.series)
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["timestamp"] + [f"{n}/{c}" for n, c in keys])
+                for i, ts in enumerate(self.timestamps):
+                    writer.writerow(
+                        [f"{ts:.3f}"] + [self.series[k][i] for k in keys]
+                    )
@@ -0,0 +1,487 @@
+"""Declarative topologies and incremental apply.
+
+A topology file (YAML, TOML or JSON) describes networks and containers:
+
+    version = "latest"
+
+    [networks.lan]
+    internal = true
+
+    [containers.gw]
+    image = "debian"
+    run_options = { network = "lan" }
+
+    [containers.client]
+    image = "debian"
+    run_options = { network = "lan" }
+    net_options = { depends = ["gw"], change_default_route = "@gw" }
+
+Option values starting with "@" refer to a container, "@gw/lan" to its
+address in network "lan".
+
+Applying a topology compares it with the live containers and a state file
+written by the previous apply. Only containers whose image or run options
+changed are recreated, containers with only changed routes get just those
+routes replaced, and everything else is left alone.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .containermanager import (
+    RUN_HASH_LABEL,
+    ContainerManager,
+    options_hash,
+)
+from .dockerclient import get_docker_client
+from .inventory import get_inventory
+from .networkmanager import NetworkManager
+from .overdosemanager import OverdoseManager
+from .probes import backoff
+from .scheduler import DEFAULT_WORKERS
+
+# Prefix of option values referring to a container
+REF_PREFIX = "@"
+# Options diffed route by route instead of recreating the container
+ROUTE_OPTIONS = ("add_route", "change_default_route")
+TOPOLOGY_KEYS = ("version", "networks", "containers")
+CONTAINER_KEYS = (
+    "image",
+    "run_options",
+    "net_options",
+    "post_options",
+    "autostart",
+    "backend",
+)
+NETWORK_KEYS = ("internal", "isolate")
+# Seconds to wait for a stopped container to be removed before recreating it
+REMOVE_TIMEOUT = 30
+
+
+def load_spec(path: str) -> dict:
+    """Read a topology file, the format follows from the extension."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError("PyYAML is needed for YAML topologies")
+        with open(path) as f:
+            spec = yaml.safe_load(f) or {}
+    elif ext == ".toml":
+        import tomllib
+
+        with open(path, "rb") as f:
+            spec = tomllib.load(f)
+    elif ext == ".json":
+        with open(path) as f:
+            spec = json.load(f)
+    else:
+        raise ValueError(f"Unknown topology format '{ext}'")
+    validate_spec(spec)
+    return spec
+
+
+def validate_spec(spec: dict) -> None:
+    unknown = set(spec) - set(TOPOLOGY_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown topology keys: {sorted(unknown)}")
+    containers = spec.get("containers") or {}
+    for name, c in containers.items():
+        if not c.get("image"):
+            raise ValueError(f"Container '{name}' has no image")
+        unknown = set(c) - set(CONTAINER_KEYS)
+        if unknown:
+            raise ValueError(
+                f"Container '{name}' has unknown keys: {sorted(unknown)}"
+            )
+        for o in ("net_options", "post_options"):
+            for ref in _refs(c.get(o) or {}):
+                if ref not in containers:
+                    raise ValueError(
+                        f"Container '{name}' refers to unknown container '{ref}'"  # noqa: E501
+                    )
+    for name, n in (spec.get("networks") or {}).items():
+        unknown = set(n or {}) - set(NETWORK_KEYS)
+        if unknown:
+            raise ValueError(
+                f"Network '{name}' has unknown keys: {sorted(unknown)}"
+            )
+
+
+def _refs(value) -> set[str]:
+    """Names of the containers referred to in (nested) option values."""
+    if isinstance(value, str) and value.startswith(REF_PREFIX):
+        return {value.removeprefix(REF_PREFIX).partition("/")[0]}
+    if isinstance(value, dict):
+        refs = set()
+        for k, v in value.items():
+            if k == "depends":
+                depends = v if isinstance(v, list) else [v]
+                refs |= {d.lstrip(REF_PREFIX) for d in depends}
+            else:
+                refs |= _refs(v)
+        return refs
+    if isinstance(value, list):
+        return set().union(*(_refs(v) for v in value)) if value else set()
+    return set()
+
+
+def routes(options: dict) -> dict[str, str]:
+    """Routes set by `options` as subnet -> gateway (as written)."""
+    result = {}
+    adds = options.get("add_route", [])
+    for arg in adds if isinstance(adds, list) else [adds]:
+        result[arg["subnet"]] = arg["via"]
+    if "change_default_route" in options:
+        result["default"] = options["change_default_route"]
+    return result
+
+
+def config_fingerprint(c: dict) -> str:
+    """Hash of the options of a container spec, except for its routes."""
+    return options_hash(
+        *(
+            {
+                k: v
+                for k, v in (c.get(o) or {}).items()
+                if k not in ROUTE_OPTIONS
+            }
+            for o in ("net_options", "post_options")
+        )
+    )
+
+
+class Plan:
+    def __init__(self):
+        self.create: list[str] = []
+        self.recreate: list[str] = []
+        self.remove: list[str] = []
+        # container -> (subnets to delete, routes to add)
+        self.reroute: dict[str, tuple[list[str], dict[str, str]]] = {}
+        self.unchanged: list[str] = []
+        self.create_networks: list[str] = []
+        self.remove_networks: list[str] = []
+
+    @property
+    def empty(self) -> bool:
+        return not (
+            self.create
+            or self.recreate
+            or self.remove
+            or self.reroute
+            or self.create_networks
+            or self.remove_networks
+        )
+
+    def report(self) -> None:
+        print("Topology plan:")
+        if self.empty:
+            print("\tNothing to do")
+        for action in (
+            "create_networks",
+            "remove_networks",
+            "create",
+            "recreate",
+            "remove",
+        ):
+            names = getattr(self, action)
+            if names:
+                print(f"\t{action.replace('_', ' ')}: {', '.join(names)}")
+        for name, (delete, add) in self.reroute.items():
+            changes = [f"-{s}" for s in delete if s not in add]
+            changes += [f"~{s}" if s in delete else f"+{s}" for s in add]
+            print(f"\treroute [{name}]: {' '.join(changes)}")
+        print(f"\tunchanged: {len(self.unchanged)} containers")
+
+
+class Topology:
+    def __init__(
+        self,
+        spec: dict,
+        state_path: Optional[str] = None,
+        manager: Optional[OverdoseManager] = None,
+    ):
+        validate_spec(spec)
+        self.spec = spec
+        self.state_path = state_path
+        if manager is None:
+            manager = OverdoseManager(
+                containers={}, version=spec.get("version", "latest")
+            )
+        self.manager = manager
+        self.networks: dict[str, dict] = {
+            name: n or {} for name, n in (spec.get("networks") or {}).items()
+        }
+        self.specs: dict[str, dict] = spec.get("containers") or {}
+        self.containers: dict[str, ContainerManager] = {}
+
+    @classmethod
+    def load(cls, path: str, state_path: Optional[str] = None, **kwargs):
+        if state_path is None:
+            state_path = f"{os.path.splitext(path)[0]}.state.json"
+        return cls(load_spec(path), state_path=state_path, **kwargs)
+
+    def build(self) -> dict[str, ContainerManager]:
+        """Add the containers of the topology to the manager."""
+        for name, c in self.specs.items():
+            self.containers[name] = ContainerManager(
+                name,
+                image=c["image"],
+                run_options=dict(c.get("run_options") or {}),
+                autostart=c.get("autostart", True),
+                **({"backend": c["backend"]} if "backend" in c else {}),
+            )
+        # Options can refer to any container, so they are resolved once
+        # all containers exist. Adding them compiles the options, which
+        # rejects bad ones before anything is started.
+        for name, c in self.specs.items():
+            cm = self.containers[name]
+            cm.net_options = self._resolve(c.get("net_options") or {})
+            cm.post_options = self._resolve(c.get("post_options") or {})
+        for cm in self.containers.values():
+            self.manager.add(cm)
+        return self.containers
+
+    def _resolve(self, value):
+        if isinstance(value, str) and value.startswith(REF_PREFIX):
+            name, _, network = value.removeprefix(REF_PREFIX).partition("/")
+            c = self.containers[name]
+            return (c, network) if network else c
+        if isinstance(value, dict):
+            resolved = {}
+            for k, v in value.items():
+                if k == "depends":
+                    depends = v if isinstance(v, list) else [v]
+                    resolved[k] = [
+                        self.containers[d.lstrip(REF_PREFIX)] for d in depends
+                    ]
+                else:
+                    resolved[k] = self._resolve(v)
+            return resolved
+        if isinstance(value, list):
+            return [self._resolve(v) for v in value]
+        return value
+
+    def load_state(self) -> dict:
+        if not self.state_path or not os.path.exists(self.state_path):
+            return {"containers": {}, "networks": []}
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def save_state(self, state: dict) -> None:
+        if not self.state_path:
+            return
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.state_path)
+
+    def _record(self, name: str) -> dict:
+        c = self.specs[name]
+        return {
+            "run_hash": self.containers[name].run_hash,
+            "config": config_fingerprint(c),
+            "routes": {
+                **routes(c.get("net_options") or {}),
+                **routes(c.get("post_options") or {}),
+            },
+        }
+
+    def plan(self) -> Plan:
+        """Compare the topology with the live containers and the state."""
+        if not self.containers:
+            self.build()
+        state = self.load_state()
+        recorded = state.get("containers", {})
+        inventory = get_inventory()
+        inventory.refresh()
+        plan = Plan()
+
+        live = {}
+        for name, cm in self.containers.items():
+            live[name] = inventory.get(name)
+            if not cm.autostart and live[name] is None:
+                continue
+            running = live[name] is not None and (
+                inventory.status(live[name]) == "running"
+            )
+            labels = (live[name].attrs.get("Labels") or {}) if running else {}
+            desired = self._record(name)
+            record = recorded.get(name)
+            if not running:
+                plan.create.append(name)
+            elif (
+                labels.get(RUN_HASH_LABEL) != desired["run_hash"]
+                or not record
+                or record.get("run_hash") != desired["run_hash"]
+                or record.get("config") != desired["config"]
+            ):
+                plan.recreate.append(name)
+            elif record.get("routes") != desired["routes"]:
+                old, new = record.get("routes", {}), desired["routes"]
+                plan.reroute[name] = (
+                    [s for s in old if old[s] != new.get(s)],
+                    {s: v for s, v in new.items() if old.get(s) != v},
+                )
+            else:
+                plan.unchanged.append(name)
+
+        # Routes via a container that is (re)created point to its old
+        # address, so they are replaced as well
+        moved = set(plan.create) | set(plan.recreate)
+        for name in list(plan.unchanged) + list(plan.reroute):
+            stale = {
+                s: v
+                for s, v in self._record(name)["routes"].items()
+                if _refs(v) & moved
+            }
+            if stale:
+                delete, add = plan.reroute.get(name, ([], {}))
+                plan.reroute[name] = (
+                    sorted(set(delete) | set(stale)),
+                    {**add, **stale},
+                )
+                if name in plan.unchanged:
+                    plan.unchanged.remove(name)
+
+        plan.remove = [n for n in recorded if n not in self.containers]
+        existing = {n.name for n in get_docker_client().networks.list()}
+        plan.create_networks = [n for n in self.networks if n not in existing]
+        plan.remove_networks = [
+            n
+            for n in state.get("networks", [])
+            if n not in self.networks and n in existing
+        ]
+        return plan
+
+    def apply(
+        self, plan: Optional[Plan] = None, workers: int = DEFAULT_WORKERS
+    ) -> Plan:
+        if plan is None:
+            plan = self.plan()
+        plan.report()
+        state = self.load_state()
+
+        if plan.remove:
+            stale = OverdoseManager(
+                host=self.manager.host,
+                containers={n: ContainerManager(n) for n in plan.remove},
+                multiplex_logs=False,
+            )
+            stale.stop_containers(remove_networks=False)
+        if plan.recreate:
+            self.manager.stop_containers(plan.recreate, remove_networks=False)
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(self._remove, plan.recreate))
+        self._apply_networks(plan)
+
+        started = []
+        if plan.create or plan.recreate:
+            result = self.manager.start_containers(
+                plan.create + plan.recreate, workers=workers
+            )
+            started = result.succeeded
+            self.manager.post_start_config(started)
+
+        rerouted = []
+        if plan.reroute:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                done = pool.map(self._reroute, plan.reroute.items())
+                rerouted = [n for n, ok in zip(plan.reroute, done) if ok]
+
+        containers = {
+            n: r
+            for n, r in state.get("containers", {}).items()
+            if n in self.containers and n not in plan.create + plan.recreate
+        }
+        for n in started + rerouted + plan.unchanged:
+            containers[n] = self._record(n)
+        self.save_state(
+            {"containers": containers, "networks": list(self.networks)}
+        )
+        return plan
+
+    def _remove(self, name: str) -> None:
+        # Auto-removal only follows the exit, the name is taken until the
+        # container is gone
+        import docker
+
+        client = get_docker_client()
+        deadline = time.monotonic() + REMOVE_TIMEOUT
+        delays = backoff()
+        while True:
+            try:
+                client.api.remove_container(name, force=True)
+                return
+            except docker.errors.NotFound:
+                return
+            except docker.errors.APIError as e:
+                # Removal already in progress
+                if e.status_code != 409 or time.monotonic() > deadline:
+                    raise
+            time.sleep(next(delays))
+
+    def _apply_networks(self, plan: Plan) -> None:
+        import docker
+
+        client = get_docker_client()
+        for name in plan.remove_networks:
+            print(f"Removing network [{name}]...", end="")
+            try:
+                client.api.remove_network(name)
+            except docker.errors.NotFound:
+                pass
+            print("OK")
+        groups: dict[tuple[bool, bool], list[str]] = {}
+        for name in plan.create_networks:
+            n = self.networks[name]
+            key = (n.get("internal", True), n.get("isolate", False))
+            groups.setdefault(key, []).append(name)
+        for (internal, isolate), names in groups.items():
+            for network in NetworkManager.bulk(
+                names,
+                host=self.manager.host,
+                internal=internal,
+                isolate=isolate,
+            ):
+                # Networks outlive this process until removed from the
+                # topology
+                NetworkManager.unregister(network)
+
+    def _reroute(self, item) -> bool:
+        name, (delete, add) = item
+        c = self.containers[name]
+        if not c.is_running:
+            return False
+        with c.session():
+            for subnet in delete:
+                if subnet == "default" and subnet not in add:
+                    c.delete_default_route()
+                elif subnet != "default":
+                    c.delete_route(subnet)
+            for subnet, via in add.items():
+                via = self._resolve(via)
+                if subnet == "default":
+                    c.change_default_route(via)
+                else:
+                    c.add_route(subnet, via)
+        return True
+
+
+def apply_topology(
+    path: str,
+    state_path: Optional[str] = None,
+    dry_run: bool = False,
+    workers: int = DEFAULT_WORKERS,
+) -> Plan:
+    """Bring the live containers in line with the topology in `path`."""
+    topology = Topology.load(path, state_path=state_path)
+    plan = topology.plan()
+    if dry_run:
+        plan.report()
+        return plan
+    return topology.apply(plan, workers=workers)
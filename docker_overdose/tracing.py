@@ -0,0 +1,184 @@
+import atexit
+import json
+import os
+import shlex
+import threading
+import time
+from typing import Optional
+
+# Set to a file name to trace all runs and write a Chrome trace at exit
+TRACE_ENV = "DOCKER_OVERDOSE_TRACE"
+
+
+class _NullSpan:
+    """What Tracer.span() hands out while tracing is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "cat", "args", "tid", "start", "end")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.tid = threading.get_ident()
+        self.start = 0.0
+        self.end = 0.0
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end = time.perf_counter()
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.record(self)
+
+    def set(self, **args) -> None:
+        """Attach results (return code, state, ...) to the span."""
+        self.args.update(args)
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+    @property
+    def failed(self) -> bool:
+        return (
+            "error" in self.args
+            or self.args.get("ok") is False
+            or bool(self.args.get("rc"))
+        )
+
+
+def _arg(value) -> str | int | bool:
+    if isinstance(value, list):
+        # Commands are kept as argument lists until exported
+        return shlex.join(value)
+    if isinstance(value, (int, bool)):
+        return value
+    return str(value)
+
+
+class Tracer:
+    """Records spans of lifecycle phases, config options and nsenter calls.
+
+    While disabled, span() returns a shared no-op context manager, so
+    instrumented code only pays for a method call.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.spans: list[Span] = []
+        self.origin = time.perf_counter()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def clear(self) -> None:
+        with self.lock:
+            self.spans = []
+            self.origin = time.perf_counter()
+
+    def span(self, name: str, cat: str = "", **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, cat, args)
+
+    def record(self, span: Span) -> None:
+        with self.lock:
+            self.spans.append(span)
+
+    def chrome_trace(self) -> dict:
+        """Spans as complete events of the Chrome trace-event format."""
+        with self.lock:
+            spans = list(self.spans)
+        pid = os.getpid()
+        events = [
+            {
+                "name": s.name,
+                "cat": s.cat,
+                "ph": "X",
+                "ts": (s.start - self.origin) * 1e6,
+                "dur": s.duration * 1e6,
+                "pid": pid,
+                "tid": s.tid,
+                "args": {k: _arg(v) for k, v in s.args.items()},
+            }
+            for s in spans
+        ]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome(self, path: str) -> None:
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def summary(self) -> list[dict]:
+        """Count, total, mean and max duration per (category, name)."""
+        rows: dict[tuple[str, str], dict] = {}
+        with self.lock:
+            spans = list(self.spans)
+        for s in spans:
+            row = rows.setdefault(
+                (s.cat, s.name),
+                {
+                    "cat": s.cat,
+                    "name": s.name,
+                    "count": 0,
+                    "failed": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                },
+            )
+            row["count"] += 1
+            row["failed"] += s.failed
+            row["total"] += s.duration
+            row["max"] = max(row["max"], s.duration)
+        for row in rows.values():
+            row["mean"] = row["total"] / row["count"]
+        return sorted(rows.values(), key=lambda r: r["total"], reverse=True)
+
+    def report(self) -> None:
+        print(
+            f"{'category':<10} {'span':<24} {'count':>7} {'failed':>6} "
+            f"{'total ms':>10} {'mean ms':>9} {'max ms':>9}"
+        )
+        for r in self.summary():
+            print(
+                f"{r['cat']:<10} {r['name']:<24} {r['count']:>7} "
+                f"{r['failed']:>6} {r['total'] * 1000:>10.1f} "
+                f"{r['mean'] * 1000:>9.2f} {r['max'] * 1000:>9.2f}"
+            )
+
+
+tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    global tracer
+    if not tracer:
+        path = os.environ.get(TRACE_ENV)
+        tracer = Tracer(enabled=bool(path))
+        if path:
+            atexit.register(tracer.export_chrome, path)
+    return tracer
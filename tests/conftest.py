@@ -12,3 +12,26 @@ def go_to_tmpdir(request):
     # Chdir only for the duration of the test.
     with tmpdir.as_cwd():
         yield
+
+
+@pytest.fixture
+def fake_docker(tmp_path, monkeypatch):
+    """Global docker client connected to a fake daemon, stub nsenter."""
+    from benchmarks.fakedaemon import FakeDockerDaemon
+    from benchmarks.harness import StubBinaries
+    from docker_overdose import dockerclient, events, inventory
+
+    sock = str(tmp_path / "docker.sock")
+    latencies = dict.fromkeys(("create", "start", "inspect", "list"), 0)
+    latencies.update(stop=0, kill=0)
+    with FakeDockerDaemon(sock, latencies) as daemon, StubBinaries(
+        str(tmp_path)
+    ) as stubs:
+        monkeypatch.setattr(dockerclient, "docker_client", None)
+        monkeypatch.setattr(inventory, "inventories", {})
+        monkeypatch.setattr(events, "event_watcher", None)
+        dockerclient.connect(socket_path=sock)
+        daemon.stubs = stubs
+        yield daemon
+        if events.event_watcher:
+            events.event_watcher.close()
@@ -0,0 +1,70 @@
+import io
+
+import pytest
+
+from docker_overdose.containermanager import ContainerManager
+from docker_overdose.logmux import LogMultiplexer
+from docker_overdose.networkmanager import NetworkManager
+from docker_overdose.processmanager import ProcessManager
+
+
+@pytest.fixture
+def mux():
+    mux = LogMultiplexer(output=io.StringIO())
+    yield mux
+    mux.close()
+
+
+def test_one_inspect_serves_all_addresses(fake_docker, mux):
+    lan, wan = NetworkManager("lan"), NetworkManager("wan")
+    hub = ContainerManager(
+        "hub", image="debian", run_options={"network": lan}, logmux=mux
+    )
+    hub.run()
+    assert list(hub.addresses) == ["lan"]
+    hub.add_network(wan)
+
+    fake_docker.reset_calls()
+    refs = [hub, (hub, "lan"), (hub, wan), (hub, None)] * 10
+    addresses = {ContainerManager.resolve_address(ref) for ref in refs}
+    # One inspect for all lookups, NetworkManager refs resolve by name
+    # without a network lookup
+    assert fake_docker.reset_calls() == {"inspect": 1}
+    # Attached networks are picked up after add_network
+    assert sorted(hub.addresses) == ["lan", "wan"]
+    assert addresses == set(hub.addresses.values())
+
+    # A new container under the name gets new addresses
+    before = hub.ipaddress_in_network(lan)
+    hub.stop()
+    hub.run()
+    assert hub.ipaddress_in_network(lan) not in (before, False)
+    assert list(hub.addresses) == ["lan"]
+    hub.stop()
+
+
+def test_nameserver_references_are_resolved(fake_docker, mux, monkeypatch):
+    written = []
+    monkeypatch.setattr(
+        ProcessManager,
+        "change_nameserver",
+        lambda self, nameservers: written.append(nameservers),
+    )
+    lan = NetworkManager("lan")
+    dns = ContainerManager(
+        "dns", image="debian", run_options={"network": lan}, logmux=mux
+    )
+    client = ContainerManager("client", image="debian", logmux=mux)
+    dns.run()
+    address = dns.ipaddress_in_network("lan")
+    client.change_nameserver(dns)
+    client.change_nameserver((dns, lan))
+    client.change_nameserver([(dns, "lan"), "9.9.9.9"])
+    client.change_nameserver("1.1.1.1")
+    assert written == [
+        [address],
+        [address],
+        [address, "9.9.9.9"],
+        ["1.1.1.1"],
+    ]
+    dns.stop()
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+
+from docker_overdose import state
+from docker_overdose.containermanager import ContainerManager
+from docker_overdose.overdosemanager import OverdoseManager
+
+
+@pytest.fixture
+def config_state(tmp_path, monkeypatch):
+    s = state.ConfigState(str(tmp_path / "state.json"))
+    monkeypatch.setattr(state, "config_state", s)
+    return s
+
+
+def lab(gw_options=None, route="10.1.0.0/16"):
+    manager = OverdoseManager(containers={}, multiplex_logs=False)
+    gw = ContainerManager(
+        "gw", image="debian", run_options=gw_options or {"network": "lan"}
+    )
+    client = ContainerManager(
+        "client",
+        image="debian",
+        run_options={"network": "lan"},
+        net_options={
+            "depends": [gw],
+            "add_route": {"subnet": route, "via": gw},
+        },
+    )
+    manager.add(gw)
+    manager.add(client)
+    return manager
+
+
+def start(fake_docker, manager):
+    fake_docker.reset_calls()
+    fake_docker.stubs.reset()
+    assert manager.start_containers(adopt=True).ok
+    return fake_docker.reset_calls(), fake_docker.stubs.reset()
+
+
+def test_restart_adopts_running_containers(fake_docker, config_state):
+    calls, subprocesses = start(fake_docker, lab())
+    assert calls["create"] == 2
+    assert subprocesses["ip"] == 1
+    assert os.path.exists(config_state.path)
+
+    # A restarted orchestrator reattaches without touching anything
+    manager = lab()
+    calls, subprocesses = start(fake_docker, manager)
+    assert "create" not in calls and "remove" not in calls
+    assert not subprocesses
+    assert all(c.adopted for c in manager.containers.values())
+
+    # Only the container with the changed config is configured again
+    calls, subprocesses = start(fake_docker, lab(route="10.2.0.0/16"))
+    assert "create" not in calls
+    assert subprocesses["ip"] == 1
+
+    # A gateway with other run options is replaced, and the client routing
+    # via it is configured again
+    manager = lab(gw_options={"network": "lan", "environment": ["X=1"]})
+    calls, subprocesses = start(fake_docker, manager)
+    assert calls["remove"] == 1 and calls["create"] == 1
+    assert subprocesses["ip"] == 1
+    assert not manager.containers["gw"].adopted
+    assert manager.containers["client"].adopted
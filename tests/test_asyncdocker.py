@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+
+from docker_overdose.asyncdocker import (
+    AsyncDockerClient,
+    NotFound,
+    create_config,
+)
+
+
+def test_create_config():
+    config = create_config(
+        "nginx:latest",
+        {
+            "name": "web",
+            "command": "sh -c 'echo hi'",
+            "environment": {"A": "1"},
+            "ports": {"80/tcp": 8080},
+            "network_mode": "none",
+            "privileged": True,
+        },
+    )
+    assert config["Image"] == "nginx:latest"
+    assert config["Cmd"] == ["sh", "-c", "echo hi"]
+    assert config["Env"] == ["A=1"]
+    assert config["ExposedPorts"] == {"80/tcp": {}}
+    assert config["HostConfig"] == {
+        "PortBindings": {"80/tcp": [{"HostIp": "", "HostPort": "8080"}]},
+        "NetworkMode": "none",
+        "Privileged": True,
+    }
+
+
+def test_create_config_rejects_unknown_options():
+    with pytest.raises(ValueError):
+        create_config("nginx", {"no_such_option": 1})
+
+
+async def handle(reader, writer):
+    request = await reader.readuntil(b"\r\n\r\n")
+    path = request.split()[1].decode()
+    if path.endswith("/containers/web/json"):
+        body = json.dumps({"State": {"Running": True, "Pid": 42}}).encode()
+        status = b"200 OK"
+    else:
+        body = json.dumps({"message": "No such container"}).encode()
+        status = b"404 Not Found"
+    writer.write(
+        b"HTTP/1.1 " + status + b"\r\nContent-Type: application/json\r\n"
+        b"Transfer-Encoding: chunked\r\n\r\n"
+        + b"%x\r\n%s\r\n0\r\n\r\n" % (len(body), body)
+    )
+    await writer.drain()
+    writer.close()
+
+
+def test_client_requests(tmp_path):
+    path = str(tmp_path / "docker.sock")
+
+    async def main():
+        server = await asyncio.start_unix_server(handle, path)
+        client = AsyncDockerClient(socket_path=path)
+        async with server:
+            attrs = await client.inspect_container("web")
+            assert attrs["State"]["Pid"] == 42
+            with pytest.raises(NotFound):
+                await client.inspect_container("other")
+
+    asyncio.run(main())
+
+
+def test_peers_are_dependencies():
+    from docker_overdose.asyncmanager import AsyncContainerManager
+
+    client = object()
+    gw = AsyncContainerManager("gw", client=client)
+    dns = AsyncContainerManager("dns", client=client)
+    c = AsyncContainerManager(
+        "c",
+        client=client,
+        net_options={
+            "add_route": {"subnet": "10.0.0.0/8", "via": (gw, "lan")}
+        },
+        post_options={"change_nameserver": dns},
+    )
+    assert c.dependencies == {gw}
+    assert c.peers == {gw, dns}
@@ -0,0 +1,27 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_benchmark_smoke(tmp_path):
+    # In a process of its own, the harness connects the global client
+    out = tmp_path / "results.json"
+    subprocess.run(
+        [sys.executable, "-m", "benchmarks", "--sizes", "5", "--json", out],
+        capture_output=True,
+        check=True,
+        cwd=ROOT,
+        timeout=120,
+    )
+    [result] = json.loads(out.read_text())
+    start, post_config, stop = result["phases"].values()
+    assert start["api_calls"]["create"] == 5
+    assert start["api_calls"]["start"] == 5
+    # One nsenter per configured container and one `ip` per route option
+    assert start["subprocesses"]["nsenter"] == 4
+    assert start["subprocesses"]["ip"] == 12
+    assert post_config["subprocesses"]["iptables-restore"] == 1
+    assert stop["api_calls"]["stop"] == 5
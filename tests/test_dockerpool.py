@@ -0,0 +1,99 @@
+import time
+import types
+
+import pytest
+import requests
+
+from docker_overdose import dockerclient
+from docker_overdose.dockerpool import ClientMetrics, InstrumentedAPIClient
+
+
+def test_metrics():
+    metrics = ClientMetrics()
+    first = metrics.start()
+    metrics.start()
+    assert (metrics.in_flight, metrics.max_in_flight) == (2, 2)
+    metrics.finish(first - 0.02)
+    metrics.finish(time.perf_counter() - 20, error=True)
+    metrics.retried()
+    s = metrics.snapshot()
+    assert (s["in_flight"], s["max_in_flight"]) == (0, 2)
+    assert (s["requests"], s["errors"], s["retries"]) == (2, 1, 1)
+    assert s["latency_total"] >= 20.02
+    histogram = s["latency_histogram"]
+    assert histogram["0.05"] == histogram["+Inf"] == 1
+    assert sum(histogram.values()) == 2
+
+
+def test_metrics_report(capsys):
+    metrics = ClientMetrics()
+    metrics.finish(metrics.start())
+    metrics.report()
+    out = capsys.readouterr().out
+    assert out.startswith("Docker API: 1 requests, 0 errors, 0 retries")
+    assert "\t<= 0.001s: 1\n" in out
+
+
+@pytest.fixture
+def api(monkeypatch):
+    # Fails the first `failures` sends with a connection error
+    sent = []
+    failures = [0]
+
+    def send(self, request, **kwargs):
+        sent.append(request.method)
+        if len(sent) <= failures[0]:
+            raise requests.exceptions.ConnectionError("reset")
+        return types.SimpleNamespace(
+            status_code=503 if failures[0] < 0 else 200
+        )
+
+    monkeypatch.setattr(requests.Session, "send", send)
+    client = InstrumentedAPIClient(
+        base_url="unix:///nonexistent.sock", version="1.43", retries=2
+    )
+    client.sent = sent
+    client.failures = failures
+    return client
+
+
+def request(method):
+    return requests.Request(method, "http://docker/containers/json").prepare()
+
+
+def test_idempotent_requests_are_retried(api):
+    api.failures[0] = 2
+    assert api.send(request("GET")).status_code == 200
+    assert api.sent == ["GET"] * 3
+    s = api.metrics.snapshot()
+    assert (s["requests"], s["errors"], s["retries"]) == (3, 2, 2)
+
+
+def test_retries_are_bounded(api):
+    api.failures[0] = 3
+    with pytest.raises(requests.exceptions.ConnectionError):
+        api.send(request("HEAD"))
+    assert len(api.sent) == 3
+    assert api.metrics.snapshot()["in_flight"] == 0
+
+
+def test_other_requests_are_not_retried(api):
+    api.failures[0] = 1
+    with pytest.raises(requests.exceptions.ConnectionError):
+        api.send(request("POST"))
+    assert api.sent == ["POST"]
+    assert api.metrics.snapshot()["retries"] == 0
+
+
+def test_server_errors_count_as_errors(api):
+    api.failures[0] = -1
+    assert api.send(request("GET")).status_code == 503
+    s = api.metrics.snapshot()
+    assert (s["requests"], s["errors"], s["retries"]) == (1, 1, 0)
+
+
+def test_version_negotiation_is_counted(fake_docker):
+    # connect() looks the API version up, already through send()
+    client = dockerclient.get_docker_client()
+    assert client.api.api_version != "auto"
+    assert client.metrics.snapshot()["requests"] >= 1
@@ -0,0 +1,127 @@
+import queue
+import threading
+import time
+import types
+
+from docker_overdose import events
+from docker_overdose.containermanager import ContainerManager
+from docker_overdose.events import EventWatcher
+
+
+class FakeStream:
+    def __init__(self):
+        self.queue = queue.Queue()
+
+    def __iter__(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            yield event
+
+    def push(self, name, action):
+        self.queue.put(
+            {"Action": action, "Actor": {"Attributes": {"name": name}}}
+        )
+
+    def close(self):
+        self.queue.put(None)
+
+
+def watcher():
+    stream = FakeStream()
+    client = types.SimpleNamespace(events=lambda **kwargs: stream)
+    w = EventWatcher(client)
+    assert w.start()
+    return w, stream
+
+
+def settle(w, seq):
+    deadline = time.monotonic() + 5
+    while w.seq < seq and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_wait_only_counts_events_after_since():
+    w, stream = watcher()
+    stream.push("a", "start")
+    settle(w, 1)
+    # Already happened
+    assert w.wait("a", ("start",), since=0, timeout=0)
+    # But not after the marker
+    since = w.seq
+    assert not w.wait("a", ("start",), since=since, timeout=0.05)
+    threading.Timer(0.05, stream.push, ("a", "start")).start()
+    assert w.wait("a", ("start",), since=since, timeout=5)
+    # Other containers and actions don't wake the waiter
+    stream.push("b", "start")
+    stream.push("a", "die")
+    settle(w, 4)
+    assert not w.wait("a", ("start",), since=w.seq, timeout=0.05)
+    assert w.last_action("a") == "die"
+    stream.close()
+
+
+def test_health_status_action():
+    w, stream = watcher()
+    stream.push("a", "health_status: healthy")
+    assert w.wait("a", ("health_status",), timeout=5)
+    stream.close()
+
+
+def test_stream_loss_wakes_waiters():
+    w, stream = watcher()
+    threading.Timer(0.05, stream.close).start()
+    started = time.monotonic()
+    assert not w.wait("a", ("start",), timeout=5)
+    assert time.monotonic() - started < 2
+    assert not w.alive
+    # Waits without a stream return at once, callers poll instead
+    assert not w.wait("a", ("start",), timeout=5)
+
+
+def test_dependency_wait_is_woken_by_start(fake_docker):
+    d = ContainerManager("d", image="debian")
+    c = ContainerManager("c", image="debian", net_options={"depends": d})
+    assert c.run(noconfig=True)
+    start = threading.Timer(0.2, d.run, kwargs={"noconfig": True})
+    start.start()
+    started = time.monotonic()
+    assert c.config(c.net_options)
+    # Well within the polling interval of waits without events
+    assert time.monotonic() - started < 1
+    start.join()
+    c.stop()
+    d.stop()
+
+
+def test_failed_subscriptions_back_off(monkeypatch, capsys):
+    calls = []
+
+    def subscribe(**kwargs):
+        calls.append(kwargs)
+        raise ConnectionError("refused")
+
+    client = types.SimpleNamespace(events=subscribe)
+    monkeypatch.setattr(events, "event_watchers", {})
+    now = [100.0]
+    monkeypatch.setattr(events.time, "monotonic", lambda: now[0])
+    for _ in range(5):
+        assert events.get_event_watcher(client) is None
+    # One attempt and one message, the callers poll until the retry
+    assert len(calls) == 1
+    assert capsys.readouterr().out.count("Unable to subscribe") == 1
+    now[0] += events.RETRY_INITIAL
+    assert events.get_event_watcher(client) is None
+    assert len(calls) == 2
+    # The delay doubles
+    now[0] += events.RETRY_INITIAL
+    assert events.get_event_watcher(client) is None
+    assert len(calls) == 2
+    stream = FakeStream()
+    client.events = lambda **kwargs: stream
+    now[0] += events.RETRY_INITIAL
+    watcher = events.get_event_watcher(client)
+    assert watcher is not None and watcher.alive
+    assert capsys.readouterr().out == ""
+    stream.close()
@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Budget for `import docker_overdose` in a fresh interpreter (seconds)
+IMPORT_BUDGET = 0.5
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_python(code, **env):
+    environ = dict(os.environ, PYTHONPATH=ROOT, **env)
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        check=True,
+        env=environ,
+        text=True,
+    ).stdout.strip()
+
+
+def test_import_has_no_side_effects():
+    # No docker socket and no docker SDK needed to import the package
+    code = (
+        "import sys; import docker_overdose; "
+        "from docker_overdose.containermanager import ContainerManager; "
+        "print(sorted(m for m in ('docker', 'requests') if m in sys.modules))"
+    )
+    assert run_python(code, DOCKER_OVERDOSE_SOCK="/nonexistent") == "[]"
+
+
+def test_import_time_budget():
+    code = (
+        "import time; t = time.perf_counter(); import docker_overdose; "
+        "print(time.perf_counter() - t)"
+    )
+    assert float(run_python(code)) < IMPORT_BUDGET
+
+
+def test_socket_from_environment(tmp_path, monkeypatch):
+    from docker_overdose import dockerclient
+
+    sock = tmp_path / "docker.sock"
+    sock.touch()
+    monkeypatch.setenv(dockerclient.DOCKER_SOCK_ENV, str(sock))
+    assert dockerclient.find_docker_sock() == str(sock)
+
+
+def test_configured_socket_must_exist(tmp_path, monkeypatch):
+    from docker_overdose import dockerclient
+
+    # Even with a default socket around
+    default = tmp_path / "default.sock"
+    default.touch()
+    monkeypatch.setattr(dockerclient, "DOCKER_SOCK_OPTIONS", (str(default),))
+    missing = str(tmp_path / "missing.sock")
+    with pytest.raises(Exception, match="missing.sock not available"):
+        dockerclient.find_docker_sock(missing)
+    monkeypatch.setenv(dockerclient.DOCKER_SOCK_ENV, missing)
+    with pytest.raises(Exception, match="missing.sock not available"):
+        dockerclient.find_docker_sock()
+    monkeypatch.delenv(dockerclient.DOCKER_SOCK_ENV)
+    assert dockerclient.find_docker_sock() == str(default)
@@ -0,0 +1,174 @@
+import threading
+import time
+import types
+
+import docker
+
+from docker_overdose.inventory import ContainerInventory
+
+
+class FakeContainers:
+    def __init__(self):
+        self.list_calls = 0
+        self.get_calls = 0
+        # Called while a list is in flight
+        self.during_list = None
+
+    def list(self, all=False, sparse=False):
+        self.list_calls += 1
+        containers = [
+            self.prepare_model(
+                {"Id": "1", "Names": ["/a"], "State": "running"}
+            ),
+            self.prepare_model(
+                {"Id": "2", "Names": ["/b"], "State": "exited"}
+            ),
+        ]
+        if self.during_list:
+            self.during_list()
+        return containers
+
+    def get(self, name):
+        self.get_calls += 1
+        if name != "a":
+            raise docker.errors.NotFound(name)
+        return self.prepare_model({"Id": "1", "State": {"Status": "running"}})
+
+    def prepare_model(self, attrs):
+        return types.SimpleNamespace(id=attrs["Id"], attrs=attrs)
+
+
+class FakeAPI:
+    def __init__(self):
+        self.inspect_calls = 0
+
+    def inspect_container(self, name):
+        self.inspect_calls += 1
+        return {"Name": name, "State": {"Pid": 42}}
+
+
+def fake_client():
+    return types.SimpleNamespace(containers=FakeContainers(), api=FakeAPI())
+
+
+def test_one_list_call_for_all_containers():
+    client = fake_client()
+    inventory = ContainerInventory(client, ttl=60)
+    assert inventory.is_running("a")
+    assert not inventory.is_running("b")
+    assert not inventory.is_running("c")
+    assert client.containers.list_calls == 1
+    assert inventory.stats["hits"] == 2
+    assert inventory.stats["misses"] == 1
+
+
+def test_inspect_is_cached_until_an_event():
+    client = fake_client()
+    inventory = ContainerInventory(client, ttl=60)
+    inventory.refresh()
+    assert inventory.inspect("a")["State"]["Pid"] == 42
+    inventory.inspect("a")
+    assert client.api.inspect_calls == 1
+    inventory.on_event("a", "die", {"id": "1"})
+    assert not inventory.is_running("a")
+    inventory.inspect("a")
+    assert client.api.inspect_calls == 2
+
+
+def test_events_track_new_containers():
+    client = fake_client()
+    inventory = ContainerInventory(client, ttl=60)
+    inventory.refresh()
+    inventory.on_event("c", "start", {"id": "3"})
+    assert inventory.is_running("c")
+    inventory.on_event("c", "destroy", {"id": "3"})
+    assert not inventory.is_running("c")
+    assert client.containers.list_calls == 1
+
+
+def test_update_overrides_stale_state():
+    client = fake_client()
+    inventory = ContainerInventory(client, ttl=60)
+    inventory.refresh()
+    created = client.containers.prepare_model(
+        {"Id": "3", "State": {"Status": "created"}}
+    )
+    inventory.update("c", created, status="running")
+    assert inventory.is_running("c")
+
+
+def test_changes_during_a_list_are_kept():
+    client = fake_client()
+    inventory = ContainerInventory(client, ttl=60)
+
+    def during_list():
+        inventory.on_event("a", "die", {"id": "1"})
+        inventory.update(
+            "c",
+            client.containers.prepare_model({"Id": "3", "State": "created"}),
+            status="running",
+        )
+
+    client.containers.during_list = during_list
+    inventory.refresh()
+    assert not inventory.is_running("a")
+    assert inventory.is_running("c")
+    assert not inventory.is_running("b")
+    # A later list is newer than both changes
+    client.containers.during_list = None
+    inventory.refresh()
+    assert inventory.is_running("a")
+    assert inventory.get("c") is None
+
+
+def test_one_thread_lists_at_a_time():
+    client = fake_client()
+    client.containers.during_list = lambda: time.sleep(0.1)
+    inventory = ContainerInventory(client, ttl=60)
+    threads = [
+        threading.Thread(target=inventory.is_running, args=("a",))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert client.containers.list_calls == 1
+
+
+def test_invalidated_containers_are_fetched_again():
+    client = fake_client()
+    inventory = ContainerInventory(client, ttl=60)
+    inventory.refresh()
+    inventory.on_event("a", "die", {"id": "1"})
+    assert not inventory.is_running("a")
+    inventory.invalidate("a")
+    inventory.invalidate("b")
+    # Looked up on their own, not read as gone until the TTL expired
+    assert inventory.is_running("a")
+    assert inventory.is_running("a")
+    assert inventory.get("b") is None
+    assert client.containers.get_calls == 2
+    assert client.containers.list_calls == 1
+    # The inspect result is cached as well
+    assert inventory.inspect("a")["State"]["Status"] == "running"
+    assert client.api.inspect_calls == 0
+
+
+def test_late_events_of_a_replaced_container_are_ignored():
+    client = fake_client()
+    inventory = ContainerInventory(client, ttl=60)
+    inventory.refresh()
+    # "a" (id 1) was removed and started again under the same name
+    replacement = client.containers.prepare_model(
+        {"Id": "9", "State": {"Status": "created"}}
+    )
+    inventory.update("a", replacement, status="running")
+    inventory.on_event("a", "die", {"id": "1"})
+    assert inventory.is_running("a")
+    inventory.on_event("a", "destroy", {"id": "1"})
+    assert inventory.get("a") is replacement
+    # A start of another container with the name replaces the model
+    inventory.on_event("a", "start", {"id": "10"})
+    assert inventory.get("a").id == "10"
+    assert inventory.is_running("a")
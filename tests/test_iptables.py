@@ -0,0 +1,73 @@
+import subprocess
+
+from docker_overdose.iptables import (
+    IPTABLES_RESTORE_BIN,
+    IptablesBatch,
+    parse_save,
+)
+
+SAVE_OUTPUT = """# Generated by iptables-save
+*filter
+:DOCKER-USER - [0:0]
+-A DOCKER-USER -s 172.18.0.0/16 -j ACCEPT
+-A DOCKER-USER -j RETURN
+COMMIT
+"""
+
+
+class FakeProcessManager:
+    name = "fake"
+
+    def __init__(self, save_output=""):
+        self.save_output = save_output
+        self.calls = []
+
+    def exec_in_ns(self, cmd, capture_output=False, input=None):
+        self.calls.append((cmd, input))
+        if cmd[0] == IPTABLES_RESTORE_BIN:
+            return subprocess.CompletedProcess(cmd, 0, b"", b"")
+        return subprocess.CompletedProcess(
+            cmd, 0, self.save_output.encode(), b""
+        )
+
+
+def test_parse_save():
+    assert parse_save(SAVE_OUTPUT) == {
+        ("DOCKER-USER", ("-s", "172.18.0.0/16", "-j", "ACCEPT")),
+        ("DOCKER-USER", ("-j", "RETURN")),
+    }
+
+
+def test_only_missing_rules_are_restored():
+    pm = FakeProcessManager(SAVE_OUTPUT)
+    batch = IptablesBatch(pm)
+    batch.add("DOCKER-USER", ["-s", "172.18.0.0/16", "-j", "ACCEPT"])
+    batch.add("DOCKER-USER", ["-d", "172.18.0.0/16", "-j", "ACCEPT"])
+    batch.add("DOCKER-USER", ["-d", "172.18.0.0/16", "-j", "ACCEPT"])
+    assert batch.commit() == 0
+    assert len(pm.calls) == 2
+    cmd, payload = pm.calls[1]
+    assert cmd == [IPTABLES_RESTORE_BIN, "--noflush"]
+    assert payload == (
+        b"*filter\n-I DOCKER-USER -d 172.18.0.0/16 -j ACCEPT\nCOMMIT\n"
+    )
+
+
+def test_nothing_to_restore():
+    pm = FakeProcessManager(SAVE_OUTPUT)
+    batch = IptablesBatch(pm)
+    batch.add("DOCKER-USER", ["-s", "172.18.0.0/16", "-j", "ACCEPT"])
+    batch.commit()
+    assert len(pm.calls) == 1
+
+
+def test_one_restore_per_table():
+    pm = FakeProcessManager()
+    batch = IptablesBatch(pm)
+    batch.add("POSTROUTING", ["-o", "eth0", "-j", "MASQUERADE"], "nat")
+    batch.add("POSTROUTING", ["-o", "eth1", "-j", "MASQUERADE"], "nat")
+    batch.add("FORWARD", ["-s", "10.0.0.1", "-j", "ACCEPT"])
+    batch.commit()
+    restores = [c for c in pm.calls if c[0][0] == IPTABLES_RESTORE_BIN]
+    assert len(restores) == 2
+    assert b"-s 10.0.0.1/32" in restores[1][1]
@@ -0,0 +1,83 @@
+import subprocess
+
+from docker_overdose.containermanager import ContainerManager
+from docker_overdose.links import LinkManager
+from docker_overdose.overdosemanager import OverdoseManager
+
+
+class FakeNamespace:
+    def __init__(self, name, pid, calls):
+        self.name = name
+        self.pid = pid
+        self.calls = calls
+
+    def nsenter(self, cmd, net=None, capture_output=False, input=None):
+        self.calls.append((self.name, cmd, input.decode().splitlines()))
+        return subprocess.CompletedProcess(cmd, 0, b"", b"")
+
+
+def test_links_batched_per_namespace():
+    calls = []
+    host = FakeNamespace("host", 1, calls)
+    hub = FakeNamespace("hub", 100, calls)
+    spokes = [FakeNamespace(f"s{i}", 200 + i, calls) for i in range(5)]
+    links = LinkManager(host, subnet="10.10.0.0/24")
+    for s in spokes:
+        links.add(hub, s)
+    pending = links.add(hub, FakeNamespace("down", False, calls))
+
+    assert links.create() == 5
+    # One batch creating all pairs, then one per namespace
+    assert len(calls) == 1 + 1 + len(spokes)
+    name, cmd, lines = calls[0]
+    assert name == "host" and cmd[-2:] == ["-batch", "-"]
+    assert lines[0] == (
+        "link add name veth0 netns 100 type veth peer name veth0 netns 200"
+    )
+    assert lines[4].startswith("link add name veth4 netns 100")
+    hub_lines = next(lines for n, _, lines in calls if n == "hub")
+    assert "addr add 10.10.0.0/31 dev veth0" in hub_lines
+    assert "link set veth4 up" in hub_lines
+    s1_lines = next(lines for n, _, lines in calls if n == "s1")
+    assert s1_lines == ["addr add 10.10.0.3/31 dev veth0", "link set veth0 up"]
+    assert not pending.created
+
+    # Deleting one end removes the pair
+    calls.clear()
+    assert links.remove(["s1", "s2"]) == 2
+    assert calls == [
+        ("hub", calls[0][1], ["link del veth1", "link del veth2"])
+    ]
+    # Still registered, created again on the next start
+    assert len(links.links) == 6
+    calls.clear()
+    assert links.create() == 2
+    assert calls[0][2] == [
+        "link add name veth1 netns 100 type veth peer name veth0 netns 201",
+        "link add name veth2 netns 100 type veth peer name veth0 netns 202",
+    ]
+
+
+def test_links_come_back_after_a_restart(fake_docker, monkeypatch):
+    manager = OverdoseManager(containers={})
+    events = []
+    for name in ("r1", "r2"):
+        c = ContainerManager(name, image="debian")
+        manager.add(c)
+        monkeypatch.setattr(
+            c, "post_config", lambda name=name: events.append(name) or True
+        )
+    create = manager.links.create
+    monkeypatch.setattr(
+        manager.links, "create", lambda: events.append(create()) or 0
+    )
+    link = manager.add_link("r1", "r2")
+    for _ in range(2):
+        events.clear()
+        assert manager.start_containers(post_config=True).ok
+        # Post config waits for the link
+        assert events[0] == 1 and sorted(events[1:]) == ["r1", "r2"]
+        assert link.created
+        manager.stop_containers()
+        assert not link.created
+    manager.logmux.close()
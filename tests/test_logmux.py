@@ -0,0 +1,141 @@
+import io
+import socket
+import struct
+import threading
+import types
+
+from docker_overdose.logmux import LogMultiplexer, LogStreamParser
+
+
+def frame(data: bytes, stream: int = 1) -> bytes:
+    return struct.pack(">BxxxL", stream, len(data)) + data
+
+
+def chunk(data: bytes) -> bytes:
+    return b"%x\r\n%s\r\n" % (len(data), data)
+
+
+def response(*frames: bytes) -> bytes:
+    head = b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+    return head + b"".join(chunk(f) for f in frames) + b"0\r\n\r\n"
+
+
+def test_parser_handles_split_chunks_and_frames():
+    data = response(frame(b"one\ntw"), frame(b"o\n", stream=2))
+    parser = LogStreamParser()
+    lines = []
+    # Feed byte by byte to exercise every partial state
+    for i in range(len(data)):
+        lines += parser.feed(data[i : i + 1])  # noqa: E203
+    assert parser.status == 200
+    assert lines == [b"one", b"two"]
+
+
+def test_parser_tty():
+    parser = LogStreamParser(tty=True)
+    data = b"HTTP/1.1 200 OK\r\n\r\nline 1\nline"
+    assert parser.feed(data) == [b"line 1"]
+    assert parser.flush() == [b"line"]
+
+
+def test_parser_keeps_error_bodies():
+    body = b'{"message":"No such container: c1"}'
+    head = b"HTTP/1.1 404 Not Found\r\nContent-Length: %d\r\n\r\n" % len(body)
+    parser = LogStreamParser()
+    assert parser.feed(head + body[:10]) == []
+    assert parser.failed and not parser.complete
+    assert parser.feed(body[10:]) == []
+    assert parser.complete
+    assert parser.error == "404 No such container: c1"
+
+    parser = LogStreamParser()
+    data = b"HTTP/1.1 500 Server Error\r\nTransfer-Encoding: chunked\r\n\r\n"
+    assert parser.feed(data + chunk(b"boom\n") + b"0\r\n\r\n") == []
+    assert parser.complete
+    assert parser.error == "500 boom"
+
+
+def fake_container(name, socket_path):
+    api = types.SimpleNamespace(
+        _custom_adapter=types.SimpleNamespace(socket_path=socket_path),
+        _version="1.43",
+    )
+    return types.SimpleNamespace(
+        name=name,
+        client=types.SimpleNamespace(api=api),
+        _container=types.SimpleNamespace(id=name, attrs={"Config": {}}),
+    )
+
+
+def serve(server, count, payload):
+    for _ in range(count):
+        conn, _ = server.accept()
+        request = conn.recv(4096)
+        name = request.split(b"/containers/")[1].split(b"/")[0]
+        conn.sendall(response(*(frame(name + b" " + p) for p in payload)))
+        conn.close()
+
+
+def test_multiplexer_prefixes_lines(tmp_path):
+    path = str(tmp_path / "docker.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    t = threading.Thread(target=serve, args=(server, 2, [b"a\n", b"b\n"]))
+    t.start()
+    out = io.StringIO()
+    mux = LogMultiplexer(output=out)
+    assert mux.attach(fake_container("c1", path))
+    assert mux.attach(fake_container("c2", path))
+    t.join()
+    # Threads stop by themselves once all streams ended
+    mux._pump.join(5)
+    mux._writer.join(5)
+    lines = out.getvalue().splitlines()
+    assert "[c1] c1 a" in lines
+    assert "[c2] c2 b" in lines
+    assert lines.count("[c1] !!! Logging interrupted. Container stopped? !!!")
+    mux.close()
+    server.close()
+
+
+def test_bounded_queue_drops_oldest():
+    mux = LogMultiplexer(max_queue=2, output=io.StringIO())
+    mux._put("c1", [b"1", b"2", b"3"])
+    assert [line for _, line in mux.queue] == [b"2", b"3"]
+    assert mux.dropped["c1"] == 1
+
+
+def test_multiplexer_reports_failed_streams(tmp_path):
+    path = str(tmp_path / "docker.sock")
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+    done = threading.Event()
+
+    def serve_error():
+        conn, _ = server.accept()
+        conn.recv(4096)
+        body = b'{"message":"No such container: c1"}'
+        conn.sendall(
+            b"HTTP/1.1 404 Not Found\r\nContent-Type: application/json\r\n"
+            b"Content-Length: %d\r\n\r\n%s" % (len(body), body)
+        )
+        # The stream ends with the error, not when the daemon hangs up
+        done.wait(5)
+        conn.close()
+
+    t = threading.Thread(target=serve_error)
+    t.start()
+    out = io.StringIO()
+    mux = LogMultiplexer(output=out)
+    assert mux.attach(fake_container("c1", path))
+    mux._pump.join(5)
+    mux._writer.join(5)
+    done.set()
+    t.join()
+    assert out.getvalue().splitlines() == [
+        "[c1] !!! Logging failed: 404 No such container: c1 !!!"
+    ]
+    mux.close()
+    server.close()
@@ -0,0 +1,54 @@
+import io
+
+from docker_overdose.logmux import LogMultiplexer
+from docker_overdose.logstore import LogRing, LogStore
+
+
+def test_ring_wraps_and_queries(tmp_path):
+    path = str(tmp_path / "c1.log")
+    ring = LogRing(path, size=64, slots=8)
+    for i in range(20):
+        ring.append([b"line %02d" % i], ts=1000.0 + i)
+    size = ring.mm.size()
+    # 7 bytes per line: 9 fit the data ring, the index holds 8
+    assert len(ring) == 8
+    assert ring.tail(2) == [(1018.0, "line 18"), (1019.0, "line 19")]
+    assert [line for _, line in ring.between(1014.5, 1016)] == [
+        "line 15",
+        "line 16",
+    ]
+    assert ring.search("line 1", limit=2) == [
+        (1012.0, "line 12"),
+        (1013.0, "line 13"),
+    ]
+    assert [line for _, line in ring.search(r"(1[68]|3)$", regex=True)] == [
+        "line 13",
+        "line 16",
+        "line 18",
+    ]
+    assert ring.search("line 05") == []
+
+    # Post-mortem read of the file, which never grew
+    reader = LogRing.open(path)
+    assert reader.tail(1) == [(1019.0, "line 19")]
+    ring.append([b"x" * 100], ts=2000.0)
+    assert reader.tail(1) == [(2000.0, "x" * 64)]
+    assert len(reader) == 1
+    reader.close()
+    ring.close()
+    assert LogRing(path, size=64, slots=8).tail(1) == [(2000.0, "x" * 64)]
+    assert (tmp_path / "c1.log").stat().st_size == size
+
+
+def test_multiplexer_writes_store(tmp_path):
+    store = LogStore(str(tmp_path / "logs"), size=4096)
+    out = io.StringIO()
+    mux = LogMultiplexer(output=out, store=store, echo=False)
+    mux._put("c1", [b"hello\r", b"world"])
+    mux._put("c2", [b"other"])
+    mux._run_writer(mux._generation)
+    assert out.getvalue() == ""
+    assert [line for _, line in store.tail("c1")] == ["hello", "world"]
+    assert store.search("c2", "oth")[0][1] == "other"
+    assert store.names() == ["c1", "c2"]
+    store.close()
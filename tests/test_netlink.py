@@ -0,0 +1,165 @@
+import errno
+import socket
+import struct
+
+import pytest
+
+from docker_overdose import netlink
+from docker_overdose.netlink import NLMSGHDR, RtNetlink, _attr, _str_attr
+
+REQUEST_ACK = 0x1 | 0x4
+CREATE_EXCL = 0x400 | 0x200
+INDEXES = {"eth0": 2, "eth1": 3}
+
+
+def message(type_, seq, payload, flags=0):
+    return NLMSGHDR.pack(16 + len(payload), type_, flags, seq, 0) + payload
+
+
+def error(seq, code=0):
+    # The error is followed by the header of the request it answers
+    return message(2, seq, struct.pack("=i", code) + bytes(16))
+
+
+class FakeSocket:
+    """Answers every request with the next of `codes` (0 is an ACK)."""
+
+    def __init__(self, *codes, noise=b""):
+        self.codes = list(codes)
+        self.noise = noise
+        self.sent: list[bytes] = []
+
+    def send(self, data):
+        self.sent.append(data)
+        return len(data)
+
+    def recv(self, size):
+        if self.noise:
+            # Unrelated messages arrive before the answer
+            noise, self.noise = self.noise, b""
+            return noise
+        seq = NLMSGHDR.unpack_from(self.sent[-1])[3]
+        return error(seq, self.codes.pop(0))
+
+
+def rtnetlink(*codes, **kwargs):
+    nl = RtNetlink.__new__(RtNetlink)
+    nl.sock = FakeSocket(*codes, **kwargs)
+    nl.seq = 0
+    nl.link_index = INDEXES.__getitem__
+    return nl
+
+
+def test_attributes_are_padded():
+    assert _attr(1, b"\x0a\x00\x00\x01") == struct.pack(
+        "=HH4s", 8, 1, b"\x0a\x00\x00\x01"
+    )
+    # Lengths leave out the padding
+    eth0 = _str_attr(3, "eth0")
+    assert eth0 == struct.pack("=HH", 9, 3) + b"eth0" + bytes(4)
+    nested = _attr(2, _attr(1, struct.pack("=H", 10)))
+    assert nested == struct.pack("=HHHHH", 12, 2, 6, 1, 10) + bytes(2)
+
+
+def test_link_messages():
+    nl = rtnetlink(0, 0)
+    nl.link_up("eth1")
+    nl.link_to_netns("eth0", 1234)
+    up, move = nl.sock.sent
+    assert up == message(
+        16, 1, struct.pack("=BxHiII", 0, 0, 3, 1, 1), REQUEST_ACK
+    )
+    assert move == message(
+        16,
+        2,
+        struct.pack("=BxHiII", 0, 0, 2, 0, 0)
+        + struct.pack("=HHI", 8, 19, 1234),
+        REQUEST_ACK,
+    )
+
+
+def test_vlan_message():
+    nl = rtnetlink(0)
+    nl.vlan_add("eth0", "eth0.10", 10)
+    info = struct.pack("=HH", 9, 1) + b"vlan\0" + bytes(3)
+    info += struct.pack("=HHHHH", 12, 2, 6, 1, 10) + bytes(2)
+    payload = struct.pack("=BxHiII", 0, 0, 0, 0, 0)
+    payload += struct.pack("=HHI", 8, 5, 2)
+    payload += struct.pack("=HH", 12, 3) + b"eth0.10\0"
+    payload += struct.pack("=HH", 4 + len(info), 18) + info
+    assert nl.sock.sent == [message(16, 1, payload, REQUEST_ACK | CREATE_EXCL)]
+
+
+def test_address_message():
+    nl = rtnetlink(0, 0)
+    nl.addr_add("eth1", "10.0.0.2/24")
+    nl.addr_add("eth0", "fd00::2/64")
+    v4, v6 = nl.sock.sent
+    ip = socket.inet_aton("10.0.0.2")
+    assert v4 == message(
+        20,
+        1,
+        struct.pack("=BBBBI", socket.AF_INET, 24, 0, 0, 3)
+        + struct.pack("=HH", 8, 2)
+        + ip
+        + struct.pack("=HH", 8, 1)
+        + ip,
+        REQUEST_ACK | CREATE_EXCL,
+    )
+    assert v6[16:24] == struct.pack("=BBBBI", socket.AF_INET6, 64, 0, 0, 2)
+    assert len(v6) == 16 + 8 + 2 * 20
+
+
+def test_route_messages():
+    nl = rtnetlink(0, 0, 0)
+    nl.route_add("10.1.0.0/16", "10.0.0.1")
+    nl.route_add("default", "fd00::1")
+    nl.route_del("default")
+    add, default6, delete = nl.sock.sent
+    assert add == message(
+        24,
+        1,
+        struct.pack("=BBBBBBBBI", socket.AF_INET, 16, 0, 0, 254, 3, 0, 1, 0)
+        + struct.pack("=HH", 8, 1)
+        + socket.inet_aton("10.1.0.0")
+        + struct.pack("=HH", 8, 5)
+        + socket.inet_aton("10.0.0.1"),
+        REQUEST_ACK | CREATE_EXCL,
+    )
+    # No destination for default routes, the family follows the gateway
+    assert default6[16:28] == struct.pack(
+        "=BBBBBBBBI", socket.AF_INET6, 0, 0, 0, 254, 3, 0, 1, 0
+    )
+    assert default6[28:] == struct.pack("=HH", 20, 5) + socket.inet_pton(
+        socket.AF_INET6, "fd00::1"
+    )
+    assert delete == message(
+        25,
+        3,
+        struct.pack("=BBBBBBBBI", socket.AF_INET, 0, 0, 0, 254, 0, 255, 1, 0),
+        REQUEST_ACK,
+    )
+
+
+def test_request_errors():
+    nl = rtnetlink(-errno.EEXIST, 0)
+    with pytest.raises(OSError) as e:
+        nl.route_add("10.1.0.0/16", "10.0.0.1")
+    assert e.value.errno == errno.EEXIST
+    # The sequence number moves on, a failed request doesn't stick
+    nl.route_add("10.1.0.0/16", "10.0.0.1")
+    assert nl.seq == 2
+
+
+def test_request_skips_other_messages():
+    # An answer to an earlier request and a padded message of another type
+    # in one datagram, before the answer
+    noise = error(7, -errno.EPERM) + message(3, 1, b"\x01\x02\x03") + bytes(1)
+    nl = rtnetlink(0, noise=noise)
+    nl.link_up("eth0")
+    assert len(nl.sock.sent) == 1
+
+
+def test_worker_reports_a_missing_namespace():
+    with pytest.raises(OSError):
+        netlink.NetnsWorker(2**22 + 1)
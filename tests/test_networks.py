@@ -0,0 +1,46 @@
+from docker_overdose.networkmanager import NetworkManager
+
+
+def test_network_handle_is_cached(fake_docker):
+    NetworkManager("lan")
+    fake_docker.reset_calls()
+    lan = NetworkManager("lan")
+    assert not lan.by_overdose
+    # One lookup, the subnet and gateway come from its result
+    for _ in range(3):
+        assert lan.ipsubnet and lan.gateway and lan.inspect
+    assert fake_docker.reset_calls() == {"network_inspect": 1}
+    NetworkManager.close_all()
+
+
+def test_bulk_lists_once_and_batches_iptables(fake_docker):
+    NetworkManager("a")
+    fake_docker.reset_calls()
+    fake_docker.stubs.reset()
+    networks = NetworkManager.bulk(["a", "b", "c"])
+    assert [n.by_overdose for n in networks] == [False, True, True]
+    for n in networks:
+        assert n.ipsubnet
+    # The existing network is taken from the list, the others are created
+    # and looked up once
+    assert fake_docker.reset_calls() == {
+        "network_list": 1,
+        "network_create": 2,
+        "network_inspect": 2,
+    }
+    # The isolation rules of all networks in one iptables-restore
+    assert fake_docker.stubs.reset()["iptables-restore"] == 1
+    NetworkManager.close_all()
+
+
+def test_refresh_reads_the_network_again(fake_docker):
+    lan = NetworkManager("lan")
+    subnet, gateway = lan.ipsubnet, lan.gateway
+    # Recreated behind our back with another subnet
+    fake_docker.networks["lan"]["IPAM"]["Config"] = [
+        {"Subnet": "10.99.0.0/16", "Gateway": "10.99.0.1"}
+    ]
+    assert (lan.ipsubnet, lan.gateway) == (subnet, gateway)
+    lan.refresh()
+    assert (lan.ipsubnet, lan.gateway) == ("10.99.0.0/16", "10.99.0.1")
+    NetworkManager.close_all()
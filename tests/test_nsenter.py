@@ -0,0 +1,56 @@
+import os
+
+import pytest
+
+from benchmarks.harness import StubBinaries
+from docker_overdose.processmanager import NsenterSession, ProcessManager
+
+SCRIPTS = {
+    "fail": "printf oops\nexit 3\n",
+    "lines": "printf 'a\\nb\\n'\n",
+    # Kills the session shell the first time, succeeds afterwards
+    "die": (
+        "if [ -e {directory}/died ]; then echo survived; exit 0; fi\n"
+        ": > {directory}/died\n"
+        "kill -9 $PPID\n"
+    ),
+}
+
+
+@pytest.fixture
+def stubs(tmp_path):
+    with StubBinaries(str(tmp_path)) as stubs:
+        for name, body in SCRIPTS.items():
+            path = tmp_path / name
+            path.write_text(
+                "#!/bin/sh\n" + body.format(directory=str(tmp_path))
+            )
+            path.chmod(0o755)
+        yield stubs
+
+
+def test_return_code_and_output(stubs):
+    session = NsenterSession(os.getpid(), net=True)
+    res = session.run(["fail"], capture_output=True)
+    assert (res.returncode, res.stdout) == (3, b"oops")
+    res = session.run(["lines"], capture_output=True)
+    assert (res.returncode, res.stdout) == (0, b"a\nb\n")
+    res = session.run(["ip", "link", "show"], capture_output=True)
+    assert (res.returncode, res.stdout) == (0, b"")
+    session.close()
+    # One shell for all commands
+    assert stubs.reset() == {"nsenter": 1, "ip": 1}
+
+
+def test_broken_session_falls_back_to_nsenter(stubs):
+    pm = ProcessManager("pm", pid=os.getpid())
+    with pm.session():
+        assert pm.exec_in_netns("lines", capture_output=True).stdout == (
+            b"a\nb\n"
+        )
+        # The shell dies mid-pass, the command is run on its own
+        res = pm.exec_in_netns("die", capture_output=True)
+        assert (res.returncode, res.stdout) == (0, b"survived\n")
+        assert pm.exec_in_netns("fail", capture_output=True).returncode == 3
+    # The session, then one nsenter per command once it broke
+    assert stubs.reset()["nsenter"] == 3
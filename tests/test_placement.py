@@ -0,0 +1,106 @@
+import pytest
+
+from benchmarks.fakedaemon import FakeDockerDaemon
+from docker_overdose import dockerclient, events
+from docker_overdose.containermanager import ContainerManager
+from docker_overdose.networkmanager import NetworkManager
+from docker_overdose.overdosemanager import OverdoseManager
+from docker_overdose.placement import (
+    PlacementScheduler,
+    _local,
+    parse_memory,
+)
+
+
+@pytest.fixture
+def endpoints(fake_docker, tmp_path, monkeypatch):
+    """Two more fake daemons, by socket path."""
+    monkeypatch.setattr(dockerclient, "endpoint_clients", {})
+    monkeypatch.setattr(events, "event_watchers", {})
+    daemons = {}
+    for name, cpus in (("one", 2), ("two", 6)):
+        daemon = FakeDockerDaemon(str(tmp_path / f"{name}.sock"), cpus=cpus)
+        daemon.start()
+        daemons[daemon.socket_path] = daemon
+    yield daemons
+    for watcher in events.event_watchers.values():
+        watcher.close()
+    for daemon in daemons.values():
+        daemon.close()
+
+
+def lab():
+    manager = OverdoseManager(containers={}, multiplex_logs=False)
+    gw = ContainerManager("gw", image="debian", run_options={"network": "lan"})
+    for name, options in (
+        ("gw", {"network": "lan"}),
+        ("web", {"network": "lan"}),
+        ("db", {}),
+        ("c1", {"nano_cpus": 2 * 10**9}),
+        ("c2", {}),
+        ("c3", {}),
+    ):
+        manager.add(
+            gw
+            if name == "gw"
+            else ContainerManager(name, image="debian", run_options=options)
+        )
+    # db reaches nothing over docker, but configures itself via gw
+    manager.containers["db"].net_options = {"depends": [gw]}
+    return manager
+
+
+def test_groups_share_an_endpoint(endpoints):
+    manager = lab()
+    one, two = endpoints
+    placement = PlacementScheduler([one, two]).place(
+        manager.containers.values()
+    )
+    assert placement["gw"] == placement["web"] == placement["db"]
+    assert sorted(placement.values()) == sorted([one] * 3 + [two] * 3)
+
+    # Weighted by the CPUs of the daemons (2 and 6) and of the containers
+    placement = PlacementScheduler([one, two], "weights").place(
+        manager.containers.values()
+    )
+    assert placement["gw"] == placement["c1"] == two
+    assert placement["c2"] == placement["c3"] == one
+
+    manager.containers["web"].endpoint = one
+    manager.containers["db"].endpoint = two
+    with pytest.raises(ValueError, match="pinned"):
+        PlacementScheduler([one, two]).place(manager.containers.values())
+    assert parse_memory("1.5g") == 1536 * 1024**2
+
+
+def test_start_spread_over_daemons(endpoints):
+    manager = lab()
+    placement = manager.place(list(endpoints))
+    assert manager.start_containers().ok
+    for endpoint, daemon in endpoints.items():
+        placed = sorted(n for n, e in placement.items() if e == endpoint)
+        running = sorted(c.name for c in daemon.containers.values())
+        assert running == placed
+        assert daemon.calls["image_list"] == 1
+    lan = placement["gw"]
+    assert "lan" in endpoints[lan].networks
+    assert all(manager.containers[n].is_running for n in placement)
+    manager.stop_containers()
+    assert not any(d.containers for d in endpoints.values())
+    assert not endpoints[lan].networks
+
+
+def test_only_remote_networks_skip_the_local_iptables(endpoints, monkeypatch):
+    flags = {}
+
+    def bulk(names, isolate=False, endpoint=None, **kwargs):
+        flags[endpoint] = isolate
+        return []
+
+    monkeypatch.setattr(NetworkManager, "bulk", bulk)
+    lab().place(list(endpoints))
+    # Both fake daemons are reached over unix sockets, on this host
+    assert flags and set(flags.values()) == {False}
+    assert _local("/var/run/docker.sock")
+    assert _local("unix:///run/docker-a.sock")
+    assert not _local("tcp://10.0.0.2:2375")
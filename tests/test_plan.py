@@ -0,0 +1,143 @@
+import contextlib
+import time
+
+import pytest
+
+from docker_overdose.containermanager import ContainerManager
+from docker_overdose.overdosemanager import OverdoseManager
+from docker_overdose.plan import ConfigPlan
+
+
+class Target:
+    def __init__(self):
+        self.name = "t"
+        self.calls = []
+
+    @staticmethod
+    def _depends(options):
+        return set(options["depends"])
+
+    @staticmethod
+    def _peers(value):
+        return set()
+
+    @contextlib.contextmanager
+    def session(self):
+        self.calls.append("session")
+        yield
+
+    @contextlib.contextmanager
+    def iptables_batch(self):
+        yield
+
+    def intf_up(self, intf):
+        self.calls.append(("intf_up", intf))
+
+    def add_route(self, subnet, via):
+        self.calls.append(("add_route", subnet, via))
+
+    def delete_default_route(self):
+        self.calls.append("delete_default_route")
+
+    def add_if(self, interface):
+        self.calls.append(("add_if", interface))
+
+
+ALLOWED = ("intf_up", "add_route", "delete_default_route", "add_if")
+
+
+def test_plan_orders_and_binds_steps():
+    options = {
+        "depends": ["gw"],
+        "intf_up": ["eth1", "eth2"],
+        "delete_default_route": False,
+        "add_route": {"subnet": "10.0.0.0/8", "via": "gw"},
+        "add_if": "enp0s2",
+    }
+    plan = ConfigPlan(options, Target, ALLOWED)
+    assert plan.depends == {"gw"}
+    t = Target()
+    plan.apply(t)
+    plan.apply(t)
+    # Attach steps first, the rest in one session. Flag options are called
+    # whatever their value, like config() always did.
+    assert t.calls[:6] == [
+        ("add_if", "enp0s2"),
+        "session",
+        ("intf_up", "eth1"),
+        ("intf_up", "eth2"),
+        "delete_default_route",
+        ("add_route", "10.0.0.0/8", "gw"),
+    ]
+    assert t.calls[6:] == t.calls[:6]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"no_such_option": True},
+        {"add_route": {"subnet": "10.0.0.0/8"}},
+        {"intf_up": {"intf": "eth0", "mtu": 9000}},
+    ],
+)
+def test_plan_rejects_bad_options(options):
+    with pytest.raises(ValueError):
+        ConfigPlan(options, Target, ALLOWED)
+
+
+def test_plans_cached_and_checked_on_add(fake_docker):
+    c = ContainerManager("c", image="debian", net_options={"intf_up": "eth0"})
+    plan = c.plan("net")
+    assert c.plan("net") is plan
+    c.net_options = {"intf_up": "eth1"}
+    assert c.plan("net") is not plan
+
+    manager = OverdoseManager(containers={}, multiplex_logs=False)
+    bad = ContainerManager("bad", image="debian", post_options={"up": True})
+    with pytest.raises(ValueError, match="'up' is not supported"):
+        manager.add(bad)
+    assert "bad" not in manager.containers
+
+
+def test_peers_in_options_order_the_start(fake_docker, monkeypatch):
+    gw = ContainerManager("gw", image="debian")
+    a = ContainerManager("a", image="debian", net_options={"depends": gw})
+    client = ContainerManager(
+        "client",
+        image="debian",
+        net_options={"add_route": {"subnet": "10.1.0.0/16", "via": gw}},
+        post_options={"change_nameserver": a},
+    )
+    manager = OverdoseManager(containers={})
+    # Referrers added before the peers they refer to
+    for c in (client, a, gw):
+        manager.add(c)
+    assert manager.dependency_graph(["client", "a", "gw"]) == {
+        "client": {"gw"},
+        "a": {"gw"},
+        "gw": set(),
+    }
+    assert client.peers == {gw, a}
+
+    events = []
+    run = ContainerManager.run
+
+    def slow_run(self, *args, **kwargs):
+        if self is a:
+            time.sleep(0.2)
+        ok = run(self, *args, **kwargs)
+        events.append(("run", self.name))
+        return ok
+
+    def post_config(self):
+        events.append(("post", self.name))
+        return True
+
+    monkeypatch.setattr(ContainerManager, "run", slow_run)
+    monkeypatch.setattr(ContainerManager, "post_config", post_config)
+    monkeypatch.setattr(ContainerManager, "add_route", lambda *args: None)
+    assert manager.start_containers(post_config=True, pull=False).ok
+    # The post options of client refer to a, which is started concurrently
+    assert events.index(("post", "client")) > events.index(("run", "a"))
+    manager.stop_containers()
+    manager.logmux.close()
@@ -0,0 +1,83 @@
+from docker_overdose.containermanager import ContainerManager
+from docker_overdose.networkmanager import NetworkManager
+from docker_overdose.overdosemanager import OverdoseManager
+from docker_overdose.pool import ContainerPool
+
+
+def scenario(pool, *names, image="debian"):
+    manager = OverdoseManager(containers={}, multiplex_logs=False, pool=pool)
+    for n in names:
+        manager.add(
+            ContainerManager(
+                n,
+                image=image,
+                run_options={"network": "lan"},
+                net_options={
+                    "add_route": {"subnet": "10.1.0.0/16", "via": "1.2.3.4"}
+                },
+            )
+        )
+    return manager
+
+
+def test_pool_reuses_containers(fake_docker):
+    pool = ContainerPool(size=2, max_idle=3)
+    manager = scenario(pool, "a", "b")
+    assert pool.fill(manager.containers.values()) == 2
+    assert pool.idle == 2
+
+    fake_docker.reset_calls()
+    assert manager.start_containers().ok
+    calls = fake_docker.reset_calls()
+    assert "create" not in calls
+    assert calls["rename"] == 2 and calls["unpause"] == 2
+    assert pool.stats["hits"] == 2
+
+    fake_docker.stubs.reset()
+    manager.stop_containers()
+    calls = fake_docker.reset_calls()
+    assert "stop" not in calls
+    assert calls["pause"] == 2
+    # Routes flushed and iptables rules reset in both
+    assert fake_docker.stubs.reset()["iptables-restore"] == 2
+    assert pool.idle == 2
+
+    # Names are free again for the next scenario
+    manager = scenario(pool, "a", "b", "c")
+    assert manager.start_containers().ok
+    assert pool.stats["misses"] == 1
+    manager.stop_containers()
+    # One per profile too many
+    assert pool.idle == 2
+    assert pool.stats["evicted"] == 1
+
+    # Another profile pushes out the least recently returned one
+    manager = scenario(pool, "x", "y", image="alpine")
+    assert manager.start_containers().ok
+    manager.stop_containers()
+    assert pool.idle == 3
+    assert pool.stats["evicted"] == 2
+
+    pool.close()
+    assert pool.idle == 0
+    assert not fake_docker.containers
+
+
+def test_returned_containers_keep_networks_and_drop_logs(fake_docker):
+    lan = NetworkManager("lan")
+    pool = ContainerPool()
+    manager = OverdoseManager(containers={}, pool=pool)
+    manager.add(
+        ContainerManager("a", image="debian", run_options={"network": lan})
+    )
+    assert manager.start_containers().ok
+    manager.stop_containers()
+    # The idle container is still attached, the network waits for the pool
+    assert "lan" in fake_docker.networks
+    # Its log stream is no longer followed
+    manager.logmux._pump.join(5)
+    assert not manager.logmux._pump.is_alive()
+    pool.close()
+    assert "lan" not in fake_docker.networks
+    assert not fake_docker.containers
+    manager.logmux.close()
@@ -0,0 +1,93 @@
+import io
+import re
+import threading
+import time
+import types
+
+import pytest
+
+from docker_overdose import probes
+from docker_overdose.containermanager import ContainerManager
+from docker_overdose.logmux import LogMultiplexer
+from docker_overdose.overdosemanager import OverdoseManager
+
+
+class FlagProbe(probes.Probe):
+    def __init__(self):
+        self.flag = threading.Event()
+        self.checks = 0
+
+    def check(self, cm):
+        self.checks += 1
+        return self.flag.is_set()
+
+
+def test_backoff_grows_with_jitter():
+    delays = probes.backoff(initial=1, factor=2, maximum=5, jitter=0.1)
+    expected = [1, 2, 4, 5, 5]
+    for delay, base in zip(delays, expected):
+        assert base * 0.9 <= delay <= base * 1.1
+
+
+def test_probes_need_a_check():
+    class NoCheck(probes.Probe):
+        pass
+
+    with pytest.raises(TypeError):
+        NoCheck()
+
+
+def test_tcp_probe_reads_namespace_socket_table(tmp_path, monkeypatch):
+    monkeypatch.setattr(probes, "PROC_DIR", str(tmp_path))
+    (tmp_path / "42" / "net").mkdir(parents=True)
+    (tmp_path / "42" / "net" / "tcp").write_text(
+        "  sl  local_address rem_address   st\n"
+        "   0: 00000000:1F90 00000000:0000 0A\n"
+        "   1: 0100007F:0050 0100007F:D431 01\n"
+    )
+    cm = types.SimpleNamespace(pid=42)
+    assert probes.TcpProbe(8080).check(cm)
+    # Port 80 only has an established connection, no listener
+    assert not probes.TcpProbe(80).check(cm)
+
+
+def test_wait_ready_polls_until_ready_or_timeout():
+    probe = FlagProbe()
+    threading.Timer(0.3, probe.flag.set).start()
+    started = time.monotonic()
+    assert probes.wait_ready(None, [probe], timeout=5)
+    assert time.monotonic() - started < 1
+    # Backoff: a handful of checks, not a busy loop
+    assert 2 < probe.checks < 10
+    assert not probes.wait_ready(None, [FlagProbe()], timeout=0.2)
+
+
+def test_log_probe_matches_multiplexed_lines():
+    mux = LogMultiplexer(output=io.StringIO())
+    event = mux.watch("c1", re.compile(rb"listening on \d+"))
+    mux.match("c1", [b"starting"])
+    assert not event.is_set()
+    mux.match("c1", [b"2024-01-01T00:00:00Z listening on 80"])
+    assert event.is_set()
+    assert mux.watches["c1"] == []
+
+
+def test_dependents_wait_for_readiness(fake_docker):
+    manager = OverdoseManager(containers={}, multiplex_logs=False)
+    probe = FlagProbe()
+    server = ContainerManager("server", image="debian", readiness=probe)
+    client = ContainerManager(
+        "client", image="debian", net_options={"depends": [server]}
+    )
+    manager.add(server)
+    manager.add(client)
+    timer = threading.Timer(0.3, probe.flag.set)
+    timer.start()
+    started = time.monotonic()
+    assert manager.start_containers().ok
+    assert time.monotonic() - started >= 0.3
+    assert server.wait_until_ready(timeout=0)
+    # Readiness starts over with a new container
+    server.clear_cache()
+    probe.flag.clear()
+    assert not server.wait_until_ready(timeout=0.1)
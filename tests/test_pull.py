@@ -0,0 +1,25 @@
+from docker_overdose.containermanager import ContainerManager
+from docker_overdose.overdosemanager import OverdoseManager
+
+
+def test_missing_images_pulled_before_start(fake_docker):
+    fake_docker.images = {"debian:latest"}
+    manager = OverdoseManager(containers={}, multiplex_logs=False)
+    for i, image in enumerate(("debian", "alpine", "alpine", "busybox:1.36")):
+        manager.add(ContainerManager(f"c{i}", image=image))
+
+    fake_docker.reset_calls()
+    assert manager.start_containers().ok
+    calls = fake_docker.reset_calls()
+    # One listing, each missing image pulled once, no failed creates
+    assert calls["image_list"] == 1
+    assert calls["image_pull"] == 2
+    assert calls["create"] == 4
+    assert fake_docker.images == {
+        "debian:latest",
+        "alpine:latest",
+        "busybox:1.36",
+    }
+
+    assert manager.pull_images() == dict.fromkeys(fake_docker.images, True)
+    assert fake_docker.reset_calls()["image_pull"] == 0
@@ -0,0 +1,61 @@
+import threading
+import time
+
+import pytest
+
+from docker_overdose.scheduler import DependencyCycleError, DependencyScheduler
+
+
+def test_levels():
+    s = DependencyScheduler({"a": [], "b": ["a"], "c": ["a"], "d": ["b", "c"]})
+    assert [sorted(level) for level in s.levels()] == [
+        ["a"],
+        ["b", "c"],
+        ["d"],
+    ]
+
+
+def test_cycle_detected():
+    with pytest.raises(DependencyCycleError) as e:
+        DependencyScheduler({"a": ["c"], "b": ["a"], "c": ["b"]})
+    assert len(e.value.cycle) == 4
+
+
+def test_independent_nodes_run_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+    s = DependencyScheduler({"a": [], "b": [], "c": []}, workers=3)
+    result = s.run(lambda n: barrier.wait() is not None)
+    assert result.ok
+    assert sorted(result.succeeded) == ["a", "b", "c"]
+
+
+def test_dependencies_finish_first():
+    done = []
+
+    def run(node):
+        time.sleep(0.01)
+        done.append(node)
+
+    s = DependencyScheduler({"a": [], "b": ["a"], "c": ["b"]}, workers=4)
+    assert s.run(run).ok
+    assert done == ["a", "b", "c"]
+
+
+def test_failed_branch_is_reported():
+    def run(node):
+        if node == "b":
+            raise RuntimeError("boom")
+        return True
+
+    s = DependencyScheduler(
+        {"a": [], "b": ["a"], "c": ["b"], "d": ["c"], "e": ["a"]}
+    )
+    result = s.run(run)
+    assert sorted(result.succeeded) == ["a", "e"]
+    assert list(result.failed) == ["b"]
+    assert result.skipped == {"c": "b", "d": "b"}
+
+
+def test_reversed():
+    s = DependencyScheduler({"a": [], "b": ["a"]}).reversed()
+    assert s.levels() == [["b"], ["a"]]
@@ -0,0 +1,70 @@
+import csv
+import json
+import types
+
+from docker_overdose.stats import StatsCollector, read_snmp
+
+NET_DEV = """\
+Inter-|   Receive                            |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+    lo: {lo} 1 0 0 0 0 0 0 {lo} 1 0 0 0 0 0 0
+  eth0: {rx} 10 0 0 0 0 0 0 {tx} 5 0 1 0 0 0 0
+"""  # noqa: E501
+
+SNMP = """\
+Ip: Forwarding DefaultTTL InReceives
+Ip: 1 64 {ip}
+Udp: InDatagrams NoPorts InErrors OutDatagrams
+Udp: 7 0 2 9
+"""
+
+
+def write(proc, pid, rx, tx, ip=0):
+    net = proc / str(pid) / "net"
+    net.mkdir(parents=True, exist_ok=True)
+    (net / "dev").write_text(NET_DEV.format(lo=0, rx=rx, tx=tx))
+    (net / "snmp").write_text(SNMP.format(ip=ip))
+
+
+def test_read_snmp(tmp_path):
+    write(tmp_path, 1, 0, 0, ip=42)
+    assert read_snmp(1, str(tmp_path)) == {
+        "Ip.InReceives": 42,
+        "Udp.InDatagrams": 7,
+        "Udp.OutDatagrams": 9,
+        "Udp.InErrors": 2,
+    }
+
+
+def test_collector_deltas_and_export(tmp_path):
+    proc = tmp_path / "proc"
+    a = types.SimpleNamespace(name="a", pid=10)
+    b = types.SimpleNamespace(name="b", pid=False)
+    collector = StatsCollector([a, b], proc=str(proc), max_samples=3)
+    write(proc, 10, rx=1000, tx=50)
+    assert collector.sample() == 1
+    write(proc, 10, rx=1500, tx=80)
+    collector.sample()
+    # b starts, a is recreated with fresh counters
+    b.pid = 20
+    write(proc, 20, rx=7, tx=7)
+    a.pid = 11
+    write(proc, 11, rx=100, tx=0)
+    assert collector.sample() == 2
+    write(proc, 11, rx=300, tx=0)
+    write(proc, 20, rx=9, tx=7)
+    collector.sample()
+
+    assert len(collector.timestamps) == 3
+    assert collector.series[("a", "eth0.rx_bytes")].tolist() == [500, 0, 200]
+    assert collector.series[("b", "eth0.rx_bytes")].tolist() == [0, 0, 2]
+    assert collector.totals("a")[("a", "eth0.tx_bytes")] == 30
+
+    collector.export_json(str(tmp_path / "stats.json"))
+    with open(tmp_path / "stats.json") as f:
+        data = json.load(f)
+    assert data["series"]["b"]["eth0.rx_bytes"] == [0, 0, 2]
+    collector.export_csv(str(tmp_path / "stats.csv"))
+    with open(tmp_path / "stats.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert [r["a/eth0.rx_bytes"] for r in rows] == ["500", "0", "200"]
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+import time
+
+from docker_overdose.overdosemanager import OverdoseManager
+
+
+class FakeContainer:
+    def __init__(self, name, depends=(), delay=0.0, log=None):
+        self.name = name
+        self.depends = depends
+        self.delay = delay
+        self.log = log
+
+    @property
+    def dependencies(self):
+        return set(self.depends)
+
+    def stop(self, timeout=None):
+        time.sleep(min(self.delay, timeout))
+        self.log.append(("stop", self.name))
+        return True
+
+    def kill(self):
+        self.log.append(("kill", self.name))
+        return True
+
+
+def test_teardown_reverse_order_and_deadline():
+    log = []
+    router = FakeContainer("router", log=log)
+    slow = FakeContainer("slow", depends=[router], delay=1.5, log=log)
+    client = FakeContainer("client", depends=[slow], log=log)
+    manager = OverdoseManager(containers={}, multiplex_logs=False)
+    for c in (router, slow, client):
+        manager.containers[c.name] = c
+
+    timings = manager.stop_containers(timeout=1.2, remove_networks=False)
+    # Dependents first; the deadline passed while [slow] was stopping
+    assert log == [("stop", "client"), ("stop", "slow"), ("kill", "router")]
+    assert timings["router"][0] == "kill"
+    assert timings["client"][1] < 0.5
+
+
+def test_networks_removed_at_exit():
+    # close_all() runs from atexit, where no new threads can be started
+    code = (
+        "from docker_overdose.networkmanager import NetworkManager\n"
+        "class Net:\n"
+        "    def __init__(self, name):\n"
+        "        self.name = name\n"
+        "    def remove(self):\n"
+        "        print('removed', self.name)\n"
+        "for name in ('a', 'b'):\n"
+        "    n = NetworkManager.__new__(NetworkManager)\n"
+        "    n.by_overdose, n._net = True, Net(name)\n"
+        "    NetworkManager.register(n)\n"
+    )
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    res = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, PYTHONPATH=root),
+    )
+    assert res.returncode == 0, res.stderr
+    assert sorted(res.stdout.splitlines()) == ["removed a", "removed b"]
+    assert "Traceback" not in res.stderr
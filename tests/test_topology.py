@@ -0,0 +1,104 @@
+import copy
+
+import pytest
+
+from docker_overdose.topology import Topology, load_spec
+
+SPEC = {
+    "networks": {"lan": {"internal": True}},
+    "containers": {
+        "gw": {"image": "debian", "run_options": {"network": "lan"}},
+        "a": {
+            "image": "debian",
+            "run_options": {"network": "lan"},
+            "net_options": {
+                "depends": ["gw"],
+                "change_default_route": "@gw",
+                "add_route": [{"subnet": "10.1.0.0/16", "via": "@gw"}],
+            },
+        },
+        "b": {
+            "image": "debian",
+            "run_options": {"network": "lan"},
+            "net_options": {"depends": "gw", "change_default_route": "@gw"},
+        },
+    },
+}
+
+
+def apply(spec, state):
+    return Topology(copy.deepcopy(spec), state_path=state).apply()
+
+
+def test_load_toml(tmp_path):
+    path = tmp_path / "lab.toml"
+    path.write_text(
+        '[containers.gw]\nimage = "debian"\n'
+        '[containers.a]\nimage = "debian"\n'
+        'net_options = { change_default_route = "@gw" }\n'
+    )
+    assert load_spec(str(path))["containers"]["a"]["net_options"] == {
+        "change_default_route": "@gw"
+    }
+
+
+def test_unknown_reference_rejected():
+    spec = {"containers": {"a": {"image": "x", "net_options": {"x": "@b"}}}}
+    with pytest.raises(ValueError, match="unknown container 'b'"):
+        Topology(spec)
+
+
+def test_bad_options_rejected_on_build(fake_docker):
+    spec = copy.deepcopy(SPEC)
+    spec["containers"]["b"]["net_options"]["no_such_option"] = True
+    topology = Topology(spec)
+    with pytest.raises(ValueError, match="'no_such_option' is not supported"):
+        topology.build()
+
+
+def test_incremental_apply(fake_docker, tmp_path):
+    state = str(tmp_path / "lab.state.json")
+    plan = apply(SPEC, state)
+    assert sorted(plan.create) == ["a", "b", "gw"]
+    assert plan.create_networks == ["lan"]
+
+    # Nothing changed, nothing to do
+    assert Topology(copy.deepcopy(SPEC), state_path=state).plan().empty
+
+    # One changed route is replaced in place
+    spec = copy.deepcopy(SPEC)
+    spec["containers"]["a"]["net_options"]["add_route"][0][
+        "subnet"
+    ] = "10.2.0.0/16"
+    fake_docker.reset_calls()
+    fake_docker.stubs.reset()
+    plan = apply(spec, state)
+    assert plan.reroute == {"a": (["10.1.0.0/16"], {"10.2.0.0/16": "@gw"})}
+    assert sorted(plan.unchanged) == ["b", "gw"]
+    assert "create" not in fake_docker.reset_calls()
+    # ip route del + ip route add, in one nsenter session
+    assert fake_docker.stubs.reset() == {"nsenter": 1, "ip": 2}
+
+    # Recreating the gateway moves the routes through it
+    spec["containers"]["gw"]["run_options"]["environment"] = ["X=1"]
+    del spec["containers"]["b"]
+    plan = apply(spec, state)
+    assert plan.recreate == ["gw"]
+    assert plan.remove == ["b"]
+    assert plan.reroute["a"][1] == {
+        "default": "@gw",
+        "10.2.0.0/16": "@gw",
+    }
+    assert Topology(spec, state_path=state).plan().empty
+
+
+def test_recreate_waits_for_auto_removal(fake_docker, tmp_path):
+    state = str(tmp_path / "lab.state.json")
+    apply(SPEC, state)
+    # The name stays taken for a while after the exit
+    fake_docker.latencies["auto_remove"] = 0.2
+    spec = copy.deepcopy(SPEC)
+    spec["containers"]["gw"]["run_options"]["environment"] = ["X=1"]
+    plan = apply(spec, state)
+    assert plan.recreate == ["gw"]
+    assert Topology(spec, state_path=state).plan().empty
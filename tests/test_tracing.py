@@ -0,0 +1,43 @@
+import json
+
+from docker_overdose import processmanager
+from docker_overdose.processmanager import ProcessManager
+from docker_overdose.tracing import NULL_SPAN, Tracer
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    span = tracer.span("run", "lifecycle", container="a")
+    assert span is NULL_SPAN
+    with span as s:
+        s.set(ok=True)
+    assert tracer.spans == []
+
+
+def test_chrome_trace_and_summary(tmp_path):
+    tracer = Tracer(enabled=True)
+    with tracer.span("run", "lifecycle", container="a"):
+        with tracer.span("nsenter", "nsenter", cmd=["ip", "a"]) as s:
+            s.set(rc=1)
+    path = tmp_path / "trace.json"
+    tracer.export_chrome(str(path))
+    events = json.loads(path.read_text())["traceEvents"]
+    assert [e["name"] for e in events] == ["nsenter", "run"]
+    assert events[0]["ph"] == "X"
+    assert events[0]["args"] == {"cmd": "ip a", "rc": 1}
+    # The outer span encloses the inner one
+    assert events[1]["ts"] <= events[0]["ts"]
+    assert events[1]["dur"] >= events[0]["dur"]
+    rows = {r["name"]: r for r in tracer.summary()}
+    assert rows["nsenter"]["failed"] == 1
+    assert rows["run"]["count"] == 1
+
+
+def test_nsenter_spans_carry_return_code(monkeypatch):
+    tracer = Tracer(enabled=True)
+    monkeypatch.setattr(processmanager, "get_tracer", lambda: tracer)
+    monkeypatch.setattr(processmanager, "NSENTER_BIN", "/bin/false")
+    ProcessManager("host").exec_in_netns(["ip", "route"])
+    [span] = tracer.spans
+    assert span.args["rc"] == 1
+    assert span.args["session"] is False